@@ -1,6 +1,11 @@
 # actions/actions.py
 
+import asyncio
+import contextvars
 import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from typing import Any, Text, Dict, List, Optional
 from rasa_sdk import Action, Tracker, FormValidationAction
 from rasa_sdk.executor import CollectingDispatcher
@@ -8,12 +13,28 @@ from rasa_sdk.events import FollowupAction, SlotSet, Form
 from tgtg import TgtgClient, TgtgAPIError, TgtgLoginError
 
 # Assuming you have implemented the manager as discussed previously
-from actions.client_manager import TGTGManager 
-from actions.items_summary import summarize_magic_bag
-from dateutil import parser # You might need: pip install python-dateutil
+from actions.client_manager import tgtg_manager
+from actions.items_summary import summarize_magic_bag, summarize_favorites
+from actions.favorites_cache import favorites_cache
+from actions.store_index import describe_candidates
+from actions.login_flow import login_poller
+from actions.notifier import NOTIFY_ENTITY
+from actions.monitor import WatchStore
+from actions.rate_limiter import Priority, RequestShedError, request_priority
+from actions.user_prefs import prefs_store
+from actions.formatting import formatter_for, get_tz, parse_pickup
+from actions.order_tracker import TERMINAL_STATES, order_tracker
+from actions.auto_reserve import DEFAULT_DAILY_SPEND_CAP, AutoReserveStore
+from actions.calendar_feed import REMINDER_DURATION, calendar_store, feed_url, fingerprint
+from actions.metrics import inc, span, trace_request
 
 logger = logging.getLogger(__name__)
 
+# rasa_sdk runs a sync `run` inline on its event loop. TGTG actions block (rate
+# limiter slots, per-user locks, HTTP), so their bodies run on these threads instead
+ACTION_WORKERS = int(os.getenv("ACTION_WORKERS", "32"))
+action_executor = ThreadPoolExecutor(ACTION_WORKERS, thread_name_prefix="action")
+
 class ActionTgtgBase(Action):
     """
     Base Class for all TGTG Actions.
@@ -21,38 +42,67 @@ class ActionTgtgBase(Action):
     1. Getting the client for the specific user.
     2. Auto-saving tokens if they were refreshed during the API call.
     3. Catching Auth errors and forcing a re-login if tokens are dead.
+    The body runs in `action_executor`, so a throttled turn never stalls the other users'.
     """
 
     def name(self) -> Text:
         raise NotImplementedError("Subclasses must define a name.")
 
-    def run(self, dispatcher: CollectingDispatcher,
+    async def run(self, dispatcher: CollectingDispatcher,
             tracker: Tracker,
             domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
-        
+        loop = asyncio.get_running_loop()
+        if order_tracker.loop is None:
+            # Orders placed from the worker threads are followed on the server's loop
+            order_tracker.loop = loop
+        # The thread sees the turn's context (priority, trace) like inline code would
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(action_executor, context.run, self.run_sync, dispatcher, tracker, domain)
+
+    def run_sync(self, dispatcher: CollectingDispatcher,
+            tracker: Tracker,
+            domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
+
+        with trace_request(self.name(), tracker.sender_id) as trace:
+            return self._run_traced(dispatcher, tracker, domain, trace)
+
+    def _run_traced(self, dispatcher, tracker, domain, trace) -> List[Dict[Text, Any]]:
         user_id = tracker.sender_id
-        client = TGTGManager.get_client(user_id)
+        with span("get_client"):
+            client = tgtg_manager.get_client(user_id)
 
         # 1. Intercept: User not logged in at all
         if not client:
+            trace.outcome = "not_logged_in"
             dispatcher.utter_message(text="To proceed, I need to verify your identity with TGTG.")
             return [FollowupAction("action_start_login_process")]
 
         # 2. Try running the business logic
         try:
             # We pass the client to the subclass
-            events = self.run_authenticated(dispatcher, tracker, domain, client)
+            with span("run_authenticated"):
+                events = self.run_authenticated(dispatcher, tracker, domain, client)
             
             # 3. AUTO-REFRESH CHECK:
             # If the library refreshed the token during the API call, we must save it.
             # We compare the client's current tokens with what is in the DB.
-            TGTGManager.save_if_changed(user_id, client)
+            with span("save_tokens"):
+                tgtg_manager.save_if_changed(user_id, client)
             
             return events
 
+        except RequestShedError as e:
+            # Our own rate limiter gave up waiting: TGTG is fine, we're just busy
+            trace.outcome = "shed"
+            logger.warning(f"Request for user {user_id} shed: {e}")
+            dispatcher.utter_message(text="TGTG is very busy right now. Please try again in a minute.")
+            return []
+
         except (TgtgAPIError, TgtgLoginError) as e:
             # 4. Handle Token Expiration
             # If we get here, it means even the Refresh Token failed (or API is down).
+            trace.outcome = "auth_failure"
+            inc("tgtg_auth_failures_total", action=self.name())
             logger.error(f"TGTG API Error for user {user_id}: {e}")
             
             # Check if it's an Auth error (usually 401 or 403)
@@ -68,6 +118,7 @@ class ActionTgtgBase(Action):
             return [FollowupAction("action_start_login_process")]
 
         except Exception as e:
+            trace.outcome = "error"
             logger.error(f"Unexpected error in {self.name()}: {e}", exc_info=True)
             dispatcher.utter_message(text="I'm having trouble connecting to TGTG right now. Please try again later.")
             return []
@@ -75,6 +126,34 @@ class ActionTgtgBase(Action):
     def run_authenticated(self, dispatcher, tracker, domain, client) -> List[Dict[Text, Any]]:
         raise NotImplementedError("Subclasses must implement run_authenticated")
 
+    def find_store(self, dispatcher: CollectingDispatcher,
+            tracker: Tracker,
+            client: TgtgClient,
+            store_name: Text,
+            not_found_text: Text) -> Optional[Dict[Text, Any]]:
+        """
+        Resolve a store name against the user's favorites.
+        Returns the matching payload, or None after telling the user what went wrong
+        (no match, or several stores matching equally well).
+        """
+        snapshot = favorites_cache.get_snapshot(tracker.sender_id, client)
+        with span("find_store"):
+            result = snapshot.index.lookup(store_name)
+
+        if result.is_ambiguous:
+            dispatcher.utter_message(
+                text=f"I found several stores matching '{store_name}'. Which one do you mean?\n"
+                     f"{describe_candidates(result.candidates)}"
+            )
+            return None
+
+        if result.match is None:
+            dispatcher.utter_message(text=not_found_text)
+            return None
+
+        # The index may be shared with an older snapshot; hand back the fresh stock numbers
+        return snapshot.current(result.match)
+
 
 # -------------------------------------------------------------------------
 # Login Flow
@@ -99,32 +178,46 @@ class ActionSubmitLoginForm(FormValidationAction):
         return "action_submit_login_form"
 
     async def run(self, dispatcher, tracker, domain):
+        with trace_request(self.name(), tracker.sender_id) as trace:
+            return self._submit(dispatcher, tracker, trace)
+
+    def _submit(self, dispatcher, tracker, trace):
         email = tracker.get_slot("email")
         user_id = tracker.sender_id
         
         if not email:
+            trace.outcome = "no_email"
             dispatcher.utter_message(text="I need a valid email address.")
             return [Form(self.name())]
 
-        client = TgtgClient(email=email)
-        
-        try:
-            dispatcher.utter_message(text=f"Sending email to {email}. Please check your inbox and click the link inside.")
-            
-            # BLOCKING CALL: This waits for the user to click the link
-            credentials = client.get_credentials() 
-            
-            # Save to DB
-            TGTGManager.save_credentials(user_id, credentials)
-            
-            dispatcher.utter_message(text="Authentication successful! You can now use the bot.")
-            
-            return [SlotSet("is_logged_in", True), SlotSet("email", email), Form(None)]
-            
-        except Exception as e:
-            logger.error(f"Login failed: {e}")
-            dispatcher.utter_message(text="⚠️ Verification timed out or failed. Please try again.")
-            return [Form(None)] # Stop the form so they aren't stuck
+        # Non-blocking: the email exchange finishes in the background and the
+        # user gets a proactive message once they've clicked the link.
+        with span("start_login"):
+            started = login_poller.start(user_id, email)
+        if started:
+            dispatcher.utter_message(text=f"Sending email to {email}. Please check your inbox and click the link inside. I'll message you here once you're verified.")
+        else:
+            dispatcher.utter_message(text="I'm still waiting for you to click the link in the email I sent.")
+
+        return [SlotSet("email", email), Form(None)]
+
+
+class ActionDeliverNotification(Action):
+    """
+    Delivers messages pushed from background jobs (see actions/notifier.py).
+    Triggered through the EXTERNAL_notify intent.
+    """
+    def name(self) -> Text:
+        return "action_deliver_notification"
+
+    def run(self, dispatcher: CollectingDispatcher,
+            tracker: Tracker,
+            domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
+
+        text = next(tracker.get_latest_entity_values(NOTIFY_ENTITY), None)
+        if text:
+            dispatcher.utter_message(text=text)
+        return []
 
 # -------------------------------------------------------------------------
 # Business Logic
@@ -145,22 +238,16 @@ class ActionCheckAvailability(ActionTgtgBase):
             dispatcher.utter_message(text="Which store should I check?")
             return []
 
-        items = client.get_items()
-        
         # 2. Find the matching item
-        target_payload = None
-        for item in items:
-            # Compare lowercase to be safe
-            if store_name.lower() in item['store']['store_name'].lower():
-                target_payload = item
-                break
-        
+        target_payload = self.find_store(dispatcher, tracker, client, store_name,
+                                         f"I couldn't find '{store_name}' in your favorites list.")
         if not target_payload:
-            dispatcher.utter_message(text=f"I couldn't find '{store_name}' in your favorites list.")
             return []
         
-        # 3. USE YOUR CUSTOM FUNCTION
-        summary = summarize_magic_bag(target_payload)
+        # 3. USE YOUR CUSTOM FUNCTION (times/prices in the user's own timezone/currency)
+        fmt = formatter_for(prefs_store.get(tracker.sender_id))
+        with span("summarize"):
+            summary = summarize_magic_bag(target_payload, fmt.tz)
         
         stock = summary.get('remaining', 0)
         restaurant_name = summary.get('restaurant', store_name)
@@ -168,7 +255,7 @@ class ActionCheckAvailability(ActionTgtgBase):
         
         if stock > 0:
             # Optional: Add extra info like price or rating if available in your summary
-            price = summary.get('price', '')
+            price = fmt.format_price(summary.price, summary.currency)
             dispatcher.utter_message(text=f"Yes! {restaurant_name} has {stock} bags available ({price}).")
             
             # Save vital data for subsequent actions (Ordering/Calendar)
@@ -181,6 +268,77 @@ class ActionCheckAvailability(ActionTgtgBase):
             dispatcher.utter_message(text=f"Sorry, nothing at {restaurant_name} right now.")
             return []
 
+class ActionListAvailable(ActionTgtgBase):
+    """
+    "What's available among my favorites?" in one turn: one (cached) get_items call,
+    one batch summarize, then a WhatsApp-sized page of the bags in stock.
+    "more" shows the next page from the same snapshot.
+    """
+    PAGE_SIZE = 5
+    # WhatsApp caps a message at 4096 chars; stay well under it
+    MAX_CHARS = 1500
+    SORTS = ("pickup", "value")
+
+    def name(self) -> Text:
+        return "action_list_available"
+
+    def run_authenticated(self, dispatcher: CollectingDispatcher,
+            tracker: Tracker,
+            domain: Dict[Text, Any],
+            client: TgtgClient) -> List[Dict[Text, Any]]:
+
+        # A fresh request starts from the top; "more" continues where the last page stopped
+        if tracker.latest_message.get("intent", {}).get("name") == "more_results":
+            start = int(tracker.get_slot("digest_offset") or 0)
+            sort_by = tracker.get_slot("digest_sort") or "pickup"
+        else:
+            start = 0
+            sort_by = next(tracker.get_latest_entity_values("sort_by"), None) or "pickup"
+        if sort_by not in self.SORTS:
+            sort_by = "value" if "value" in sort_by or "price" in sort_by or "cheap" in sort_by else "pickup"
+
+        fmt = formatter_for(prefs_store.get(tracker.sender_id))
+        items = favorites_cache.get_items(tracker.sender_id, client)
+        with span("summarize"):
+            available = [s for s in summarize_favorites(items, fmt.tz) if (s.remaining or 0) > 0]
+
+        if not available:
+            dispatcher.utter_message(text="Nothing is available at your favorite stores right now.")
+            return [SlotSet("digest_offset", None)]
+
+        if sort_by == "value":
+            # Best deal first: lowest price paid per unit of original value
+            available.sort(key=lambda s: s.price / s.value if s.value else 1.0)
+        else:
+            far_future = parse_pickup("9999-12-31T00:00:00Z")
+            available.sort(key=lambda s: s.pickup_start or far_future)
+
+        if start >= len(available):
+            dispatcher.utter_message(text="That's everything available right now.")
+            return [SlotSet("digest_offset", None)]
+
+        lines = []
+        used = 0
+        end = start
+        for summary in available[start:start + self.PAGE_SIZE]:
+            card = (f"🍱 {summary.restaurant}: {summary.remaining} left, "
+                    f"{fmt.format_price(summary.price, summary.currency)}"
+                    f" (worth {fmt.format_price(summary.value, summary.currency)})\n"
+                    f"   🕒 {summary.pickup_window or 'pickup time unknown'}")
+            if lines and used + len(card) > self.MAX_CHARS:
+                break
+            lines.append(card)
+            used += len(card) + 1
+            end += 1
+
+        header = f"🛍️ {len(available)} of your favorites have bags right now"
+        header += " (best value first):" if sort_by == "value" else " (earliest pickup first):"
+        if end < len(available):
+            lines.append(f"…and {len(available) - end} more. Say 'more' to see them.")
+        dispatcher.utter_message(text="\n".join([header] + lines) if start == 0 else "\n".join(lines))
+
+        return [SlotSet("digest_offset", end), SlotSet("digest_sort", sort_by)]
+
 class ActionCheckPickupTime(ActionTgtgBase):
     def name(self) -> Text:
         return "action_check_pickup_time"
@@ -195,22 +353,18 @@ class ActionCheckPickupTime(ActionTgtgBase):
             dispatcher.utter_message(text="Which store are we talking about?")
             return []
         
-        items = client.get_items()
-        
-        target_payload = None
-        for item in items:
-            if store_name.lower() in item['store']['store_name'].lower():
-                target_payload = item
-                break
-
+        # Follow-up turn: reuses the snapshot (and its index) fetched by the availability check
+        target_payload = self.find_store(dispatcher, tracker, client, store_name,
+                                         f"Cannot find info for {store_name}.")
         if not target_payload:
-            dispatcher.utter_message(text=f"Cannot find info for {store_name}.")
             return []
 
         # 1. USE YOUR CUSTOM FUNCTION for the Message
-        summary = summarize_magic_bag(target_payload)
+        fmt = formatter_for(prefs_store.get(tracker.sender_id))
+        with span("summarize"):
+            summary = summarize_magic_bag(target_payload, fmt.tz)
         
-        # Your function returns a pretty string like "18:00 → 18:30"
+        # Your function returns a pretty string like "18:00 → 18:30" (in the user's timezone)
         readable_window = summary.get("pickup_window")
 
         if readable_window:
@@ -243,15 +397,131 @@ class ActionReserveOrder(ActionTgtgBase):
         if not item_id:
             dispatcher.utter_message(text="I'm not sure which item you want to order. Please check stock first.")
             return []
-            
-        try:
-            client.checkout(item_id)
+
+        # Checkout jumps ahead of every other queued TGTG request
+        with request_priority(Priority.CHECKOUT):
+            # Stock may have changed since the cached snapshot, so always go upstream before checkout
+            items = favorites_cache.get_items(tracker.sender_id, client, force_refresh=True)
+            target_payload = next((item for item in items if str(item['item']['item_id']) == str(item_id)), None)
+            if target_payload is not None and target_payload.get('items_available', 0) <= 0:
+                dispatcher.utter_message(text="Sorry, that bag has just sold out.")
+                return []
+
+            try:
+                with span("create_order"):
+                    order = client.create_order(item_id, 1)
+            except RequestShedError:
+                raise
+            except Exception as e:
+                dispatcher.utter_message(text=f"Failed to create order: {str(e)}")
+                return []
+
+        label = tracker.get_slot("store") or "your bag"
+        if TERMINAL_STATES.get(order.get("state")):
             dispatcher.utter_message(text="🎉 Order locked! Please complete payment in the TGTG app.")
-        except Exception as e:
-            dispatcher.utter_message(text=f"Failed to create order: {str(e)}")
+        else:
+            # TGTG confirms asynchronously: follow the order in the background and message the user
+            order_tracker.track(tracker.sender_id, order["id"], client, label)
+            dispatcher.utter_message(text="⏳ Reserving your bag now. I'll message you as soon as TGTG confirms it.")
         
         return []
     
+class ActionMonitorStock(ActionTgtgBase):
+    """
+    Adds a watch on a store's bag; the monitor process (actions/monitor.py)
+    messages the user when it comes back in stock.
+    """
+    watches = WatchStore()
+
+    def name(self) -> Text:
+        return "action_monitor_stock"
+
+    def run_authenticated(self, dispatcher: CollectingDispatcher,
+            tracker: Tracker,
+            domain: Dict[Text, Any],
+            client: TgtgClient) -> List[Dict[Text, Any]]:
+
+        store_name = tracker.get_slot("store") or next(tracker.get_latest_entity_values("store"), None)
+        if not store_name:
+            dispatcher.utter_message(text="Which store should I keep an eye on?")
+            return []
+
+        target_payload = self.find_store(dispatcher, tracker, client, store_name,
+                                         f"I couldn't find '{store_name}' in your favorites list.")
+        if not target_payload:
+            return []
+
+        summary = summarize_magic_bag(target_payload)
+        self.watches.add(tracker.sender_id, summary['id'], summary['restaurant'])
+
+        dispatcher.utter_message(text=f"👀 I'll message you as soon as {summary['restaurant']} has bags available.")
+        return [SlotSet("store", summary['restaurant'])]
+
+def parse_spend_cap(value: Optional[Text]) -> Optional[float]:
+    """
+    Spend cap entity ("20", "12.50", "£15") as an amount, None if missing or not positive.
+    """
+    if not value:
+        return None
+    try:
+        amount = float(value.strip().lstrip("£$€").replace(",", "."))
+    except ValueError:
+        return None
+    return amount if amount > 0 else None
+
+class ActionEnableAutoReserve(ActionTgtgBase):
+    """
+    Arms fast checkout for a store: the monitor reserves the bag as soon as it
+    restocks (within the user's quantity and daily spend caps) and tells them after.
+    """
+    watches = WatchStore()
+    auto_reserve = AutoReserveStore()
+
+    def name(self) -> Text:
+        return "action_enable_auto_reserve"
+
+    def run_authenticated(self, dispatcher: CollectingDispatcher,
+            tracker: Tracker,
+            domain: Dict[Text, Any],
+            client: TgtgClient) -> List[Dict[Text, Any]]:
+
+        store_name = tracker.get_slot("store") or next(tracker.get_latest_entity_values("store"), None)
+        if not store_name:
+            dispatcher.utter_message(text="Which store should I auto-reserve from?")
+            return []
+
+        # Validating the item now means the monitor can order it without any lookup later
+        target_payload = self.find_store(dispatcher, tracker, client, store_name,
+                                         f"I couldn't find '{store_name}' in your favorites list.")
+        if not target_payload:
+            return []
+
+        quantity = next(tracker.get_latest_entity_values("quantity"), None)
+        try:
+            quantity = max(1, int(quantity)) if quantity else 1
+        except ValueError:
+            quantity = 1
+
+        # A cap given in this message wins over the one saved in the preferences
+        prefs = prefs_store.get(tracker.sender_id)
+        spend_cap = parse_spend_cap(next(tracker.get_latest_entity_values("spend_cap"), None))
+        if spend_cap is None:
+            spend_cap = prefs.spend_cap if prefs.spend_cap is not None else DEFAULT_DAILY_SPEND_CAP
+
+        summary = summarize_magic_bag(target_payload)
+        self.watches.add(tracker.sender_id, summary['id'], summary['restaurant'])
+        self.auto_reserve.arm(tracker.sender_id, summary['id'], summary['restaurant'], max_quantity=quantity,
+                              daily_spend_cap=spend_cap)
+
+        fmt = formatter_for(prefs)
+        cap = fmt.format_price(spend_cap, summary.currency)
+        dispatcher.utter_message(
+            text=f"⚡ Auto-reserve is on for {summary['restaurant']}: I'll grab up to {quantity} bag(s) "
+                 f"the next time they restock (max {cap} per day) and message you. "
+                 f"It switches off after that order; ask me again to re-arm it."
+        )
+        return [SlotSet("store", summary['restaurant'])]
+
 class ActionReminder(Action):
     def name(self) -> Text:
         return "action_set_reminder"
@@ -268,20 +538,65 @@ class ActionReminder(Action):
             return []
 
         try:
-            # 1. Parse the ISO string (e.g., '2023-10-27T18:00:00Z')
-            dt = parser.parse(pickup_time_str)
-            
-            # 2. Format for your Calendar Tool (Assuming format YYYYMMDDTHHMM)
-            formatted_time = dt.strftime("%Y%m%dT%H%M")
-            
-            # TODO
-            # --- GOOGLE CALENDAR LOGIC HERE ---
-            # result = google_calendar.create_event(summary=f"Food: {store_name}", start=formatted_time)
-            
-            dispatcher.utter_message(text=f"✅ I've added a reminder for {store_name} at {dt.strftime('%H:%M')} to your calendar.")
-            
+            # 1. Parse the ISO string (e.g., '2023-10-27T18:00:00Z'), cached per value
+            dt = parse_pickup(pickup_time_str)
+            fmt = formatter_for(prefs_store.get(tracker.sender_id))
+
+            # 2. Add it to the user's calendar feed (see actions/calendar_feed.py); their
+            # reserved orders are synced into the same feed by the monitor
+            token = calendar_store.subscribe(tracker.sender_id)
+            calendar_store.put_event(tracker.sender_id, {
+                "uid": f"reminder-{fingerprint({'store': store_name, 'start': pickup_time_str})}",
+                "start": dt,
+                "end": dt + timedelta(seconds=REMINDER_DURATION),
+                "summary": f"Pick up: {store_name}",
+                "location": None,
+                "description": "Too Good To Go pickup",
+            })
+
+            dispatcher.utter_message(
+                text=f"✅ I've added a reminder for {store_name} at {fmt.format_time(dt)} to your calendar: "
+                     f"{feed_url(token)}\nOpen the link once to subscribe; your upcoming TGTG pickups show up there too."
+            )
+
         except Exception as e:
             logger.error(f"Calendar error: {e}")
             dispatcher.utter_message(text="I couldn't process the date format for the calendar.")
         
-        return []
\ No newline at end of file
+        return []
+
+
+class ActionSetPreferences(Action):
+    """
+    Stores the user's timezone / currency used when formatting pickup times and
+    prices, and the daily spend cap new auto-reserves are armed with.
+    """
+    def name(self) -> Text:
+        return "action_set_preferences"
+
+    def run(self, dispatcher: CollectingDispatcher,
+            tracker: Tracker,
+            domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
+
+        timezone = next(tracker.get_latest_entity_values("timezone"), None)
+        currency = next(tracker.get_latest_entity_values("currency"), None)
+        spend_cap = parse_spend_cap(next(tracker.get_latest_entity_values("spend_cap"), None))
+
+        if not timezone and not currency and spend_cap is None:
+            dispatcher.utter_message(text="Tell me your timezone (e.g. Europe/Paris), currency (e.g. EUR) "
+                                          "or daily auto-reserve budget (e.g. 20).")
+            return []
+
+        if timezone:
+            try:
+                get_tz(timezone)
+            except (KeyError, ValueError):
+                dispatcher.utter_message(text=f"I don't know the timezone '{timezone}'. Try something like Europe/Paris.")
+                return []
+
+        prefs = prefs_store.set(tracker.sender_id, timezone=timezone, currency=currency, spend_cap=spend_cap)
+        cap = formatter_for(prefs).format_price(
+            prefs.spend_cap if prefs.spend_cap is not None else DEFAULT_DAILY_SPEND_CAP)
+        dispatcher.utter_message(text=f"✅ Got it: times in {prefs.timezone}, prices in {prefs.currency}, "
+                                      f"auto-reserve up to {cap} per day.")
+        return []
@@ -0,0 +1,289 @@
+"""
+Opt-in automatic reservation for watched bags.
+
+When the monitor sees an armed item come back in stock it calls `AutoReserver.fire`
+straight away, before any notification goes out:
+- item ids were validated against the user's favorites when the user armed them
+- the user's client is kept warm (pooled, tokens refreshed) by `warm`
+- orders for all armed users go out concurrently at CHECKOUT priority
+- per-user quantity and daily spend caps are enforced from the auto_orders log;
+  the spend is booked before ordering, so concurrent restocks of a user's other
+  items (on this worker or another) can't overshoot the cap
+- an item is disarmed once it has been ordered: arming is one bag run, not a subscription
+- detect -> order latency is logged for every order; see
+    python -m actions.auto_reserve report
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Text, Tuple
+
+from actions.client_manager import tgtg_manager
+from actions.credential_store import SQLiteStore
+from actions.order_tracker import OrderTracker, TERMINAL_STATES
+from actions.rate_limiter import Priority, request_priority
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_QUANTITY = 1
+# Max money auto-reservations may commit per user over 24h (in the bag's currency)
+DEFAULT_DAILY_SPEND_CAP = 15.0
+SPEND_WINDOW = 24 * 60 * 60
+# Armed users' clients are refreshed this often so a restock never waits on a token refresh
+WARM_INTERVAL = 5 * 60
+
+
+class ArmedItem:
+    __slots__ = ("user_id", "item_id", "store_name", "max_quantity", "daily_spend_cap")
+
+    def __init__(self, user_id, item_id, store_name, max_quantity, daily_spend_cap):
+        self.user_id = user_id
+        self.item_id = item_id
+        self.store_name = store_name
+        self.max_quantity = max_quantity
+        self.daily_spend_cap = daily_spend_cap
+
+
+class AutoReserveStore(SQLiteStore):
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS auto_reserve ("
+        " user_id TEXT NOT NULL,"
+        " item_id TEXT NOT NULL,"
+        " store_name TEXT NOT NULL,"
+        " max_quantity INTEGER NOT NULL,"
+        " daily_spend_cap REAL NOT NULL,"
+        " armed_at REAL NOT NULL,"
+        " PRIMARY KEY (user_id, item_id))",
+        "CREATE TABLE IF NOT EXISTS auto_orders ("
+        " user_id TEXT NOT NULL,"
+        " item_id TEXT NOT NULL,"
+        " order_id TEXT,"
+        " quantity INTEGER NOT NULL,"
+        " amount REAL NOT NULL,"
+        " ordered_at REAL NOT NULL,"
+        " latency_ms REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS auto_orders_user ON auto_orders (user_id, ordered_at)",
+    )
+
+    def arm(self, user_id: Text, item_id: Text, store_name: Text,
+            max_quantity: int = DEFAULT_MAX_QUANTITY,
+            daily_spend_cap: float = DEFAULT_DAILY_SPEND_CAP) -> None:
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO auto_reserve VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, str(item_id), store_name, max_quantity, daily_spend_cap, time.time()),
+            )
+
+    def disarm(self, user_id: Text, item_id: Text) -> None:
+        with self._conn() as conn:
+            conn.execute("DELETE FROM auto_reserve WHERE user_id = ? AND item_id = ?", (user_id, str(item_id)))
+
+    def by_item(self) -> Dict[Text, List[ArmedItem]]:
+        grouped = defaultdict(list)
+        rows = self._conn().execute(
+            "SELECT user_id, item_id, store_name, max_quantity, daily_spend_cap "
+            "FROM auto_reserve ORDER BY armed_at")
+        for row in rows:
+            grouped[row[1]].append(ArmedItem(*row))
+        return dict(grouped)
+
+    def spent_since(self, user_id: Text, since: float) -> float:
+        row = self._conn().execute(
+            "SELECT COALESCE(SUM(amount), 0) FROM auto_orders WHERE user_id = ? AND ordered_at >= ?",
+            (user_id, since),
+        ).fetchone()
+        return row[0]
+
+    def book(self, user_id: Text, item_id: Text, quantity: int, price: float,
+             daily_spend_cap: float) -> Optional[Tuple[int, int]]:
+        """
+        Book the spend of up to `quantity` bags if it fits the user's cap, before ordering.
+        The cap check and the insert are one statement, so two bookings can't both fit
+        the same budget. Returns (entry id, booked quantity), None if not even one bag fits.
+        A booking is pending (order_id NULL) until `confirm`ed or `release`d.
+        """
+        now = time.time()
+        with self._conn() as conn:
+            for q in range(quantity, 0, -1):
+                cursor = conn.execute(
+                    "INSERT INTO auto_orders (user_id, item_id, order_id, quantity, amount, ordered_at, latency_ms) "
+                    "SELECT ?, ?, NULL, ?, ?, ?, 0 WHERE "
+                    "(SELECT COALESCE(SUM(amount), 0) FROM auto_orders WHERE user_id = ? AND ordered_at >= ?) "
+                    "+ ? <= ? + 1e-9",
+                    (user_id, str(item_id), q, q * price, now, user_id, now - SPEND_WINDOW, q * price,
+                     daily_spend_cap),
+                )
+                if cursor.rowcount:
+                    return cursor.lastrowid, q
+        return None
+
+    def confirm(self, entry_id: int, order_id: Text, latency_ms: float) -> None:
+        with self._conn() as conn:
+            conn.execute("UPDATE auto_orders SET order_id = ?, latency_ms = ? WHERE rowid = ?",
+                         (str(order_id or ""), latency_ms, entry_id))
+
+    def release(self, entry_id: int) -> None:
+        """
+        Give back the spend of a booking whose order failed.
+        """
+        with self._conn() as conn:
+            conn.execute("DELETE FROM auto_orders WHERE rowid = ?", (entry_id,))
+
+    def latencies(self, since: float = 0) -> List[float]:
+        rows = self._conn().execute(
+            "SELECT latency_ms FROM auto_orders WHERE ordered_at >= ? AND order_id IS NOT NULL", (since,))
+        return [r[0] for r in rows]
+
+
+def bag_price(payload: Dict[Text, Any]) -> float:
+    price = payload["item"]["item_price"]
+    return price["minor_units"] / (10 ** price["decimals"])
+
+
+class AutoReserver:
+
+    def __init__(self, store: AutoReserveStore = None, manager=None, tracker: OrderTracker = None):
+        self.store = store or AutoReserveStore()
+        self.manager = manager or tgtg_manager
+        self.tracker = tracker or OrderTracker()
+        self._armed: Dict[Text, List[ArmedItem]] = {}
+
+    def reload(self) -> None:
+        self._armed = self.store.by_item()
+
+    def is_armed(self, item_id: Text) -> bool:
+        return item_id in self._armed
+
+    def warm(self, item_ids: Optional[Set[Text]] = None) -> None:
+        """
+        Keep armed users' clients pooled with fresh tokens (only for `item_ids` if given,
+        e.g. the items this monitor worker owns). Runs in a worker thread.
+        """
+        users = {a.user_id for item_id, armed in self._armed.items()
+                 if item_ids is None or item_id in item_ids for a in armed}
+        for user_id in users:
+            client = self.manager.get_client(user_id)
+            if client is None:
+                continue
+            try:
+                with request_priority(Priority.BACKGROUND):
+                    client.login()  # only hits the API when the access token is due for a refresh
+                self.manager.save_if_changed(user_id, client)
+            except Exception as e:
+                logger.warning(f"Couldn't warm client for {user_id}: {e}")
+
+    async def fire(self, item_id: Text, payload: Dict[Text, Any], detected_at: float) -> List[Text]:
+        """
+        Reserve for every armed user of `item_id`, within their caps.
+        `detected_at` is the time.monotonic() at which the restock was seen.
+        Returns the users an order was placed for.
+        """
+        armed = self._armed.get(item_id)
+        if not armed:
+            return []
+
+        available = payload.get("items_available", 0)
+        price = bag_price(payload)
+        since = time.time() - SPEND_WINDOW
+        plans = []
+        # First armed, first served, until the bags run out. The spend read here only
+        # shares the bags out; `_order` enforces the cap when it books the spend.
+        for a in armed:
+            if available <= 0:
+                break
+            budget = a.daily_spend_cap - self.store.spent_since(a.user_id, since)
+            quantity = min(a.max_quantity, available, int(budget // price) if price > 0 else a.max_quantity)
+            if quantity <= 0:
+                logger.info(f"Auto-reserve for {a.user_id} on {item_id} skipped: spend cap reached")
+                continue
+            available -= quantity
+            plans.append((a, quantity))
+
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*(
+            loop.run_in_executor(None, self._order, a.user_id, item_id, quantity, price, a.daily_spend_cap,
+                                 detected_at)
+            for a, quantity in plans
+        ))
+
+        ordered = []
+        for (a, _), (client, order, quantity, latency_ms) in zip(plans, results):
+            if order is None:
+                continue
+            logger.info(f"Auto-reserved {quantity}x {item_id} for {a.user_id} in {latency_ms:.0f}ms")
+            ordered.append(a.user_id)
+            self._disarm(a.user_id, item_id)
+            label = f"your auto-reserved bag at {a.store_name}"
+            rearm = f"Auto-reserve for {a.store_name} is now off; ask me to auto-reserve it again to re-arm it."
+            if TERMINAL_STATES.get(order.get("state")):
+                await self.tracker.notify(
+                    a.user_id, f"⚡ {label} is reserved! Please complete payment in the TGTG app. {rearm}")
+            else:
+                await self.tracker.notify(a.user_id, f"⚡ I've placed an order for {label}. {rearm}")
+                self.tracker.track(a.user_id, order["id"], client, label)
+        return ordered
+
+    def _disarm(self, user_id: Text, item_id: Text) -> None:
+        self.store.disarm(user_id, item_id)
+        remaining = [a for a in self._armed.get(item_id, []) if a.user_id != user_id]
+        if remaining:
+            self._armed[item_id] = remaining
+        else:
+            self._armed.pop(item_id, None)
+
+    def _order(self, user_id: Text, item_id: Text, quantity: int, price: float, daily_spend_cap: float,
+               detected_at: float):
+        """
+        Book the spend, order, then confirm or release the booking. Runs in a worker thread.
+        Returns (client, order or None, booked quantity, detect -> order latency in ms).
+        """
+        client = self.manager.get_client(user_id)
+        if client is None:
+            return None, None, 0, 0.0
+        booking = self.store.book(user_id, item_id, quantity, price, daily_spend_cap)
+        if booking is None:
+            logger.info(f"Auto-reserve for {user_id} on {item_id} skipped: spend cap reached")
+            return client, None, 0, 0.0
+        entry_id, quantity = booking
+        try:
+            with request_priority(Priority.CHECKOUT):
+                order = client.create_order(item_id, quantity)
+        except Exception as e:
+            logger.error(f"Auto-reserve of {item_id} for {user_id} failed: {e}")
+            self.store.release(entry_id)
+            return client, None, quantity, 0.0
+        latency_ms = (time.monotonic() - detected_at) * 1000
+        self.store.confirm(entry_id, order.get("id"), latency_ms)
+        return client, order, quantity, latency_ms
+
+
+def report(store: AutoReserveStore, days: float) -> Dict[Text, float]:
+    latencies = sorted(store.latencies(time.time() - days * 86400))
+    if not latencies:
+        return {"orders": 0}
+    return {
+        "orders": len(latencies),
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "max_ms": latencies[-1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Auto-reserve tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    r = sub.add_parser("report", help="Detect -> order latency of auto-reservations")
+    r.add_argument("--days", type=float, default=7)
+    args = parser.parse_args()
+
+    if args.command == "report":
+        for key, value in report(AutoReserveStore(), args.days).items():
+            print(f"{key:>8}: {value:.1f}" if isinstance(value, float) else f"{key:>8}: {value}")
+
+
+if __name__ == "__main__":
+    main()
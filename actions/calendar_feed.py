@@ -0,0 +1,390 @@
+"""
+Pickup calendars (.ics).
+
+Each user who asks for a reminder gets a private subscription feed,
+    CALENDAR_URL/calendar/<token>.ics
+holding their reserved orders (from `get_active`) and the reminders they set.
+Calendar apps poll it; the feed server answers 304 while the ETag is unchanged.
+
+Events are rendered once and stored in SQLite next to the credentials:
+- `sync_orders` compares a fingerprint per order with the stored one and only
+  re-renders / writes the orders that changed (and deletes the ones gone)
+- a feed is then the stored events concatenated, streamed from the DB, and its
+  ETag is kept up to date by the writes, so serving it does no TGTG call and no rendering
+- `refresh_all` walks every subscriber in one keyset-paginated pass (constant
+  memory); the monitor runs it every CALENDAR_REFRESH_INTERVAL
+
+    python -m actions.calendar_feed refresh          # one bulk pass, e.g. from cron
+    python -m actions.calendar_feed export --out calendars/   # static files for a CDN
+    python -m actions.calendar_feed serve            # standalone feed server
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Text, Tuple
+
+from actions.credential_store import SQLiteStore
+from actions.items_summary import parse_pickup
+from actions.rate_limiter import Priority, request_priority
+
+logger = logging.getLogger(__name__)
+
+# Public base URL of the feed server, as users' calendar apps reach it
+CALENDAR_URL = os.getenv("CALENDAR_URL", "http://localhost:9107")
+CALENDAR_PORT = int(os.getenv("CALENDAR_PORT", "9107"))
+CALENDAR_REFRESH_INTERVAL = 15 * 60
+# Reminders without an end time last this long (seconds)
+REMINDER_DURATION = 30 * 60
+# Subscribers fetched per page by `refresh_all`
+PAGE_SIZE = 500
+PRODID = "-//tgtg-WhatsApp-bot//Pickups//EN"
+UID_DOMAIN = "tgtg-whatsapp-bot"
+_FEED_PATH = re.compile(r"^/calendar/([\w-]+)\.ics$")
+
+
+def _escape(text: Text) -> Text:
+    return (text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def _fold(line: Text) -> Text:
+    """
+    Lines longer than 75 octets continue on the next line after a space (RFC 5545 3.1).
+    """
+    data = line.encode()
+    if len(data) <= 75:
+        return line + "\r\n"
+    parts = []
+    while len(data) > 75:
+        cut = 75 if not parts else 74
+        # Don't split a UTF-8 sequence
+        while cut and (data[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(data[:cut].decode())
+        data = data[cut:]
+    parts.append(data.decode())
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _stamp(dt: datetime) -> Text:
+    return dt.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def render_event(uid: Text, start: datetime, end: datetime, summary: Text,
+                 location: Optional[Text] = None, description: Optional[Text] = None) -> Text:
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{uid}@{UID_DOMAIN}",
+        f"DTSTAMP:{_stamp(datetime.now(timezone.utc))}",
+        f"DTSTART:{_stamp(start)}",
+        f"DTEND:{_stamp(end)}",
+        f"SUMMARY:{_escape(summary)}",
+    ]
+    if location:
+        lines.append(f"LOCATION:{_escape(location)}")
+    if description:
+        lines.append(f"DESCRIPTION:{_escape(description)}")
+    lines += ["BEGIN:VALARM", "TRIGGER:-PT30M", "ACTION:DISPLAY", f"DESCRIPTION:{_escape(summary)}",
+              "END:VALARM", "END:VEVENT"]
+    return "".join(_fold(line) for line in lines)
+
+
+def order_event(order: Dict[Text, Any]) -> Optional[Dict[Text, Any]]:
+    """
+    The calendar fields of one `get_active` order, or None if it has no pickup time.
+    """
+    order_id = order.get("order_id") or order.get("id")
+    interval = order.get("pickup_interval") or {}
+    start = parse_pickup(interval.get("start"))
+    if not order_id or start is None:
+        return None
+    end = parse_pickup(interval.get("end")) or start + timedelta(seconds=REMINDER_DURATION)
+    store = order.get("store_name") or "TGTG"
+    branch = order.get("store_branch")
+    if branch and branch.lower() not in store.lower():
+        store = f"{store} — {branch}"
+    address = ((order.get("pickup_location") or {}).get("address") or {}).get("address_line")
+    details = [f"{order.get('quantity', 1)} x {order.get('item_name') or 'Surprise Bag'}"]
+    if order.get("cancel_until"):
+        details.append(f"Free cancellation until {_stamp(parse_pickup(order['cancel_until']))}")
+    return {
+        "uid": f"order-{order_id}",
+        "start": start,
+        "end": end,
+        "summary": f"Pick up: {store}",
+        "location": address,
+        "description": "\n".join(details),
+    }
+
+
+def fingerprint(event: Dict[Text, Any]) -> Text:
+    return hashlib.sha1(json.dumps(event, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+class CalendarStore(SQLiteStore):
+    """
+    Rendered events per user, and one row per feed with its token and ETag.
+    """
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS calendar_feeds ("
+        " user_id TEXT PRIMARY KEY,"
+        " token TEXT NOT NULL UNIQUE,"
+        " etag TEXT NOT NULL,"
+        " updated_at REAL NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS calendar_events ("
+        " user_id TEXT NOT NULL,"
+        " uid TEXT NOT NULL,"
+        " source TEXT NOT NULL,"
+        " fingerprint TEXT NOT NULL,"
+        " starts_at REAL NOT NULL,"
+        " ends_at REAL NOT NULL,"
+        " vevent TEXT NOT NULL,"
+        " PRIMARY KEY (user_id, uid))",
+    )
+
+    def subscribe(self, user_id: Text) -> Text:
+        """
+        The user's feed token, created on first call.
+        """
+        row = self._conn().execute("SELECT token FROM calendar_feeds WHERE user_id = ?", (user_id,)).fetchone()
+        if row:
+            return row[0]
+        token = secrets.token_urlsafe(18)
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO calendar_feeds (user_id, token, etag, updated_at) VALUES (?, ?, ?, ?)",
+                (user_id, token, fingerprint({}), time.time()))
+        return self._conn().execute("SELECT token FROM calendar_feeds WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    def feed_of(self, token: Text) -> Optional[Tuple[Text, Text, float]]:
+        """
+        (user_id, etag, updated_at) of the feed with `token`.
+        """
+        return self._conn().execute(
+            "SELECT user_id, etag, updated_at FROM calendar_feeds WHERE token = ?", (token,)).fetchone()
+
+    def feeds(self, page_size: int = PAGE_SIZE) -> Iterator[Tuple[Text, Text, float]]:
+        """
+        Every (user_id, token, updated_at), a page at a time.
+        """
+        last = ""
+        while True:
+            rows = self._conn().execute(
+                "SELECT user_id, token, updated_at FROM calendar_feeds WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                (last, page_size)).fetchall()
+            yield from rows
+            if len(rows) < page_size:
+                return
+            last = rows[-1][0]
+
+    def put_event(self, user_id: Text, event: Dict[Text, Any], source: Text = "reminder") -> bool:
+        """
+        Add or update one event. Returns False if it was already stored unchanged.
+        """
+        return self._apply(user_id, [event], source, replace=False) > 0
+
+    def sync_orders(self, user_id: Text, orders: Iterable[Dict[Text, Any]]) -> int:
+        """
+        Make the user's order events match `orders` (the whole `get_active` list).
+        Only changed orders are rendered and written. Returns the number of events changed.
+        """
+        events = [e for e in map(order_event, orders) if e is not None]
+        return self._apply(user_id, events, "order", replace=True)
+
+    def _apply(self, user_id: Text, events: List[Dict[Text, Any]], source: Text, replace: bool) -> int:
+        conn = self._conn()
+        stored = dict(conn.execute(
+            "SELECT uid, fingerprint FROM calendar_events WHERE user_id = ? AND source = ?", (user_id, source)))
+        now = time.time()
+        changed = 0
+        with conn:
+            for event in events:
+                fp = fingerprint(event)
+                if stored.pop(event["uid"], None) == fp:
+                    continue
+                conn.execute(
+                    "INSERT INTO calendar_events (user_id, uid, source, fingerprint, starts_at, ends_at, vevent)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(user_id, uid) DO UPDATE SET"
+                    " source = excluded.source, fingerprint = excluded.fingerprint, starts_at = excluded.starts_at,"
+                    " ends_at = excluded.ends_at, vevent = excluded.vevent",
+                    (user_id, event["uid"], source, fp, event["start"].timestamp(), event["end"].timestamp(),
+                     render_event(**event)))
+                changed += 1
+            if replace and stored:
+                conn.executemany("DELETE FROM calendar_events WHERE user_id = ? AND uid = ?",
+                                 [(user_id, uid) for uid in stored])
+                changed += len(stored)
+            # Reminders are dropped a day after they're over
+            changed += conn.execute(
+                "DELETE FROM calendar_events WHERE user_id = ? AND source = 'reminder' AND ends_at < ?",
+                (user_id, now - 24 * 60 * 60)).rowcount
+            if changed:
+                self._update_etag(conn, user_id, now)
+        return changed
+
+    @staticmethod
+    def _update_etag(conn, user_id: Text, now: float) -> None:
+        # Derived from the fingerprints alone: no event needs reading to answer a poll
+        digest = hashlib.sha1()
+        for uid, fp in conn.execute(
+                "SELECT uid, fingerprint FROM calendar_events WHERE user_id = ? ORDER BY uid", (user_id,)):
+            digest.update(f"{uid}:{fp};".encode())
+        conn.execute("UPDATE calendar_feeds SET etag = ?, updated_at = ? WHERE user_id = ?",
+                     (digest.hexdigest()[:16], now, user_id))
+
+    def render(self, user_id: Text) -> Iterator[Text]:
+        """
+        The user's feed, streamed from the stored events.
+        """
+        yield ("BEGIN:VCALENDAR\r\nVERSION:2.0\r\n"
+               f"PRODID:{PRODID}\r\nCALSCALE:GREGORIAN\r\nX-WR-CALNAME:TGTG pickups\r\n")
+        for (vevent,) in self._conn().execute(
+                "SELECT vevent FROM calendar_events WHERE user_id = ? ORDER BY starts_at", (user_id,)):
+            yield vevent
+        yield "END:VCALENDAR\r\n"
+
+
+calendar_store = CalendarStore()
+
+
+def feed_url(token: Text) -> Text:
+    return f"{CALENDAR_URL}/calendar/{token}.ics"
+
+
+def refresh_user(user_id: Text, client, store: CalendarStore = None) -> int:
+    """
+    Sync the user's feed with their active orders. Returns the number of events changed.
+    """
+    store = store or calendar_store
+    with request_priority(Priority.BACKGROUND):
+        active = client.get_active()
+    orders = active.get("orders", []) if isinstance(active, dict) else active or []
+    return store.sync_orders(user_id, orders)
+
+
+def refresh_all(manager=None, store: CalendarStore = None) -> Dict[Text, int]:
+    """
+    One pass over every subscriber. Runs in a worker thread.
+    Feeds of users without a usable login (never logged in, or login_required) are skipped.
+    """
+    if manager is None:
+        from actions.client_manager import tgtg_manager as manager
+    store = store or calendar_store
+    stats = {"feeds": 0, "changed": 0, "failed": 0, "skipped": 0}
+    for user_id, _, _ in store.feeds():
+        stats["feeds"] += 1
+        client = manager.get_client(user_id)
+        if client is None:
+            stats["skipped"] += 1
+            continue
+        try:
+            stats["changed"] += refresh_user(user_id, client, store)
+            manager.save_if_changed(user_id, client)
+        except Exception as e:
+            stats["failed"] += 1
+            logger.warning(f"Calendar refresh for {user_id} failed: {e}")
+    return stats
+
+
+def export(directory: Text, store: CalendarStore = None) -> int:
+    """
+    Write every feed to `directory`/<token>.ics, skipping files newer than their feed.
+    Returns the number of files written.
+    """
+    store = store or calendar_store
+    os.makedirs(directory, exist_ok=True)
+    written = 0
+    for user_id, token, updated_at in store.feeds():
+        path = os.path.join(directory, f"{token}.ics")
+        if os.path.exists(path) and os.path.getmtime(path) >= updated_at:
+            continue
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+            f.writelines(store.render(user_id))
+        os.replace(tmp_path, path)
+        written += 1
+    return written
+
+
+class _FeedHandler(BaseHTTPRequestHandler):
+    store: CalendarStore = calendar_store
+
+    def do_GET(self):
+        match = _FEED_PATH.match(self.path.split("?", 1)[0])
+        feed = self.store.feed_of(match.group(1)) if match else None
+        if feed is None:
+            self.send_error(404)
+            return
+        user_id, etag, updated_at = feed
+        etag = f'"{etag}"'
+        headers = {
+            "ETag": etag,
+            "Last-Modified": datetime.fromtimestamp(updated_at, timezone.utc).strftime("%a, %d %b %Y %H:%M:%S GMT"),
+            "Cache-Control": "private, max-age=300",
+        }
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/calendar; charset=utf-8")
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        # HTTP/1.0: the body ends with the connection, so it's streamed without a length
+        for chunk in self.store.render(user_id):
+            self.wfile.write(chunk.encode())
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port: int = CALENDAR_PORT) -> Optional[ThreadingHTTPServer]:
+    """
+    Serve the feeds from a daemon thread. Returns None if `port` is 0.
+    """
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer(("", port), _FeedHandler)
+    except OSError as e:
+        # Another worker on this host already serves the feeds
+        logger.warning(f"Calendar feeds not served on port {port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name="calendar-feeds", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pickup calendar feeds")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("refresh", help="Sync every feed with its user's active orders")
+    e = sub.add_parser("export", help="Write every feed as a static .ics file")
+    e.add_argument("--out", default="calendars")
+    s = sub.add_parser("serve", help="Serve the feeds over HTTP")
+    s.add_argument("--port", type=int, default=CALENDAR_PORT)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "refresh":
+        print(refresh_all())
+    elif args.command == "export":
+        print(f"Wrote {export(args.out)} feeds to {args.out}")
+    elif args.command == "serve":
+        start_server(args.port)
+        print(f"Serving calendar feeds on port {args.port}")
+        threading.Event().wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,50 +1,354 @@
-from tgtg import TgtgClient
-import json
-import os
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
 
-DB_FILE = "user_credentials.json"
+from actions.coordination import user_lock
+from actions.credential_store import CredentialStore, load_credential_store
+from actions.metrics import inc
+from actions.rate_limiter import Priority, RateLimitedTgtgClient, request_priority
 
-class TGTGManager:
-    def __init__(self):
-        self._load_db()
+logger = logging.getLogger(__name__)
 
-    def _load_db(self):
-        if not os.path.exists(DB_FILE):
-            self.db = {}
-        else:
-            with open(DB_FILE, 'r') as f:
-                self.db = json.load(f)
+# Fields of the credentials dict that the TGTG library may rotate
+TOKEN_FIELDS = ("access_token", "refresh_token", "cookie")
+# The library's default; used when the client doesn't expose its own
+ACCESS_TOKEN_LIFETIME = 4 * 60 * 60
+# Live clients kept around (least recently used are dropped first)
+POOL_MAX_CLIENTS = 500
+# Clients unused for this long (seconds) are dropped and their HTTP session closed
+POOL_IDLE_TIMEOUT = 15 * 60
+
+
+class PooledTgtgClient(RateLimitedTgtgClient):
+    """
+    TgtgClient that is reused across turns.
+    Keeps its requests session (keep-alive connections) and in-memory token state,
+    and knows whether its tokens changed since they were last persisted.
+    """
 
-    def _save_db(self):
-        with open(DB_FILE, 'w') as f:
-            json.dump(self.db, f)
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.last_used = time.monotonic()
+        self._persisted_tokens = self.tokens()
+        # Requests being sent; an evicted client's session is closed once they're done
+        self._in_flight = 0
+        self._retired = False
+        self._use_lock = threading.Lock()
 
-    def save_credential(self, user_id, credentials):
+    def tokens(self):
+        return tuple(getattr(self, field, None) for field in TOKEN_FIELDS)
+
+    @property
+    def dirty(self) -> bool:
+        # True once the library refreshed the access/refresh token or rotated the cookie
+        return self.tokens() != self._persisted_tokens
+
+    def mark_clean(self) -> None:
+        self._persisted_tokens = self.tokens()
+
+    def close(self) -> None:
+        """
+        Close the HTTP session, or, while a thread is sending a request with it (the
+        monitor or a turn that got the client before it was evicted), once it's done.
+        The client still works afterwards, on fresh connections.
+        """
+        with self._use_lock:
+            self._retired = True
+            if self._in_flight:
+                return
+        self._close_session()
+
+    def _close_session(self) -> None:
+        session = getattr(self, "session", None)
+        if session is not None:
+            session.close()
+
+    def _scheduled(self, *args, **kwargs):
+        with self._use_lock:
+            self._in_flight += 1
+        try:
+            return super()._scheduled(*args, **kwargs)
+        finally:
+            with self._use_lock:
+                self._in_flight -= 1
+                close = self._retired and not self._in_flight
+            if close:
+                self._close_session()
+
+    # Set by TGTGManager.get_client: refreshes are then coordinated with other replicas
+    manager = None
+
+    def refresh_due(self) -> bool:
+        last = getattr(self, "last_time_token_refreshed", None)
+        lifetime = getattr(self, "access_token_lifetime", ACCESS_TOKEN_LIFETIME)
+        return last is None or (datetime.now() - last).total_seconds() > lifetime
+
+    if hasattr(RateLimitedTgtgClient, "_refresh_token"):
+        def _refresh_token(self):
+            if self.manager is None or self.user_id is None or not self.refresh_due():
+                return super()._refresh_token()
+            # Another replica may be refreshing this user too. Rotating the refresh
+            # token twice would leave one of us with a dead one, so take turns and
+            # reuse tokens the other replica just stored.
+            # This runs lazily in the middle of a turn: the lock isn't waited for
+            with user_lock(self.user_id, wait=0) as locked:
+                if self.manager.adopt_stored_tokens(self.user_id, self):
+                    return None
+                if not locked:
+                    # Whoever holds it is rotating the tokens right now. The current
+                    # access token is still accepted (TGTG's outlive the library's
+                    # refresh interval), and a later call adopts the rotated ones
+                    inc("tgtg_lazy_refresh_deferred_total")
+                    return None
+                result = super()._refresh_token()
+                self.manager.save_if_changed(self.user_id, self)
+                return result
+
+        def refresh_now(self):
+            """
+            Refresh the tokens even if they aren't due yet. The caller holds the user's lock.
+            """
+            # The library skips the call while the last refresh is younger than the token lifetime
+            last = self.last_time_token_refreshed
+            self.last_time_token_refreshed = None
+            try:
+                return super()._refresh_token()
+            except Exception:
+                self.last_time_token_refreshed = last
+                raise
+
+
+class ClientPool:
+    """
+    Bounded LRU of live clients keyed by sender_id, with idle eviction.
+    Evicted clients are closed with `close()`, which waits for their requests in flight.
+    """
+
+    def __init__(self, max_clients: int = POOL_MAX_CLIENTS, idle_timeout: float = POOL_IDLE_TIMEOUT):
+        self.max_clients = max_clients
+        self.idle_timeout = idle_timeout
+        self._clients: "OrderedDict[str, PooledTgtgClient]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            client = self._clients.get(user_id)
+            if client is not None:
+                client.last_used = now
+                self._clients.move_to_end(user_id)
+            return client
+
+    def peek(self, user_id):
+        """
+        The user's pooled client, if any, without counting it as a use.
+        """
+        with self._lock:
+            return self._clients.get(user_id)
+
+    def put(self, user_id, client: PooledTgtgClient) -> None:
+        evicted = []
+        with self._lock:
+            old = self._clients.pop(user_id, None)
+            if old is not None and old is not client:
+                evicted.append(old)
+            self._clients[user_id] = client
+            while len(self._clients) > self.max_clients:
+                evicted.append(self._clients.popitem(last=False)[1])
+        for c in evicted:
+            c.close()
+
+    def discard(self, user_id) -> None:
+        with self._lock:
+            client = self._clients.pop(user_id, None)
+        if client is not None:
+            client.close()
+
+    def _evict_idle(self, now: float) -> None:
+        # Oldest entries are at the front, stop at the first one still in use
+        while self._clients:
+            user_id, client = next(iter(self._clients.items()))
+            if now - client.last_used < self.idle_timeout:
+                break
+            del self._clients[user_id]
+            client.close()
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+
+class TGTGManager:
+    def __init__(self, store: CredentialStore = None, pool: ClientPool = None):
+        # Default backend comes from endpoints.yml (SQLite unless configured), opened on first use;
+        # pass a JsonCredentialStore for the legacy file
+        self._store = store
+        self.pool = pool if pool is not None else ClientPool()
+        # The library looks the app version up on the Play Store for every client built
+        # without a user agent: the first client's is reused
+        self._user_agent = None
+
+    @property
+    def store(self) -> CredentialStore:
+        if self._store is None:
+            self._store = load_credential_store()
+        return self._store
+
+    def save_credentials(self, user_id, credentials):
         """
         save user credentials
         user_id: WhatsApp sender_id
         credentials: dictionary returned after login
         """
-        self.db[user_id] = credentials
-        self._save_db()
+        self.store.put(user_id, credentials)
+        # A pooled client still holding other tokens is dropped
+        client = self.pool.peek(user_id)
+        if client is not None and client.tokens() == tuple(credentials.get(field) for field in TOKEN_FIELDS):
+            client.mark_clean()
+        else:
+            self.pool.discard(user_id)
+
+    # Old name, kept for scripts that still call it
+    save_credential = save_credentials
+
+    def get_credentials(self, user_id):
+        return self.store.get(user_id)
+
+    def delete_credentials(self, user_id):
+        self.store.delete(user_id)
+        self.pool.discard(user_id)
 
     def get_client(self, user_id):
         """
         get global client instance
+        Reuses the user's pooled client; only builds a new one (and reads storage) on a miss.
         """
-        creds = self.db.get(user_id)
-        
-        if not creds:
+        client = self.pool.get(user_id)
+        if client is not None:
+            return client
+
+        creds = self.store.get(user_id)
+
+        if not creds or creds.get("login_required"):
+            # Never logged in, or the refresh token died (see actions/token_refresher.py)
             return None
+        client = self._build_client(user_id, creds)
+        if client is not None:
+            self.pool.put(user_id, client)
+        return client
+
+    def _build_client(self, user_id, creds):
+        kwargs = {"user_agent": self._user_agent} if self._user_agent else {}
         try:
-            client = TgtgClient(
+            client = PooledTgtgClient(
             access_token=creds.get("access_token"),
             refresh_token=creds.get("refresh_token"),
-            cookie=creds.get("cookie")
+            cookie=creds.get("cookie"),
+            **kwargs
         )
-            return client
         except Exception as e:
-            print(f"Error creating client for {user_id}: {e}")
+            logger.error(f"Error creating client for {user_id}: {e}")
             return None
-        
-tgtg_manager = TGTGManager()
\ No newline at end of file
+        self._user_agent = client.user_agent
+        client.user_id = user_id
+        client.manager = self
+        refreshed_at = creds.get("refreshed_at")
+        if refreshed_at:
+            # Tokens refreshed recently (maybe by another replica) aren't refreshed again
+            client.last_time_token_refreshed = datetime.fromtimestamp(refreshed_at)
+        return client
+
+    def adopt_stored_tokens(self, user_id, client) -> bool:
+        """
+        Give `client` the tokens another replica stored since it was built, if they're still fresh.
+        Returns True if it did (the client then has nothing to refresh).
+        """
+        stored = self.store.get(user_id) or {}
+        refreshed_at = stored.get("refreshed_at")
+        lifetime = getattr(client, "access_token_lifetime", ACCESS_TOKEN_LIFETIME)
+        if not refreshed_at or time.time() - refreshed_at > lifetime:
+            return False
+        if tuple(stored.get(field) for field in TOKEN_FIELDS) == client.tokens():
+            return False
+        self._load_tokens(client, stored)
+        return True
+
+    @staticmethod
+    def _load_tokens(client, stored) -> None:
+        for field in TOKEN_FIELDS:
+            setattr(client, field, stored.get(field))
+        if stored.get("refreshed_at"):
+            client.last_time_token_refreshed = datetime.fromtimestamp(stored["refreshed_at"])
+        client.mark_clean()
+
+    def refresh_ahead(self, user_id, refreshed_before) -> bool:
+        """
+        Refresh the user's tokens now if they were last refreshed before `refreshed_before`,
+        and persist them. Returns False if there was nothing to do (no credentials, another
+        replica refreshed them meanwhile, or TGTG handed back the same access token).
+        Errors of the refresh call are raised.
+
+        A pooled client is refreshed in place. Other users get a transient client that
+        never enters the pool, so a refresher pass doesn't evict active users' clients.
+        """
+        if not hasattr(PooledTgtgClient, "refresh_now"):
+            return False
+        with user_lock(user_id):
+            stored = self.store.get(user_id) or {}
+            if not stored or stored.get("login_required") or (stored.get("refreshed_at") or 0) >= refreshed_before:
+                return False
+            client = self.pool.peek(user_id)
+            transient = client is None
+            if transient:
+                client = self._build_client(user_id, stored)
+                if client is None:
+                    return False
+            elif tuple(stored.get(field) for field in TOKEN_FIELDS) != client.tokens():
+                # The store has the newest refresh token, whoever rotated it last
+                self._load_tokens(client, stored)
+            try:
+                access_token = client.access_token
+                last = client.last_time_token_refreshed
+                with request_priority(Priority.BACKGROUND):
+                    client.refresh_now()
+                if client.access_token == access_token:
+                    # Nothing was rotated: don't record a refresh, the user stays due
+                    client.last_time_token_refreshed = last
+                    logger.warning(f"Proactive refresh for {user_id} returned the same access token")
+                    return False
+                inc("tgtg_token_refreshes_total")
+                self.save_credentials(user_id, {**stored, **dict(zip(TOKEN_FIELDS, client.tokens())),
+                                                "refreshed_at": client.last_time_token_refreshed.timestamp()})
+                return True
+            finally:
+                if transient:
+                    client.close()
+
+    def mark_login_required(self, user_id) -> None:
+        """
+        Flag the user's refresh token as dead: get_client returns None until they log in again.
+        """
+        stored = self.store.get(user_id)
+        if stored is not None:
+            self.store.put(user_id, {**stored, "login_required": True})
+        self.pool.discard(user_id)
+
+    def save_if_changed(self, user_id, client):
+        """
+        Persist the client's tokens if the library refreshed them during the last call.
+        Clean clients cost nothing: no storage read, no write.
+        """
+        if not client.dirty:
+            return False
+        inc("tgtg_token_refreshes_total")
+        stored = self.store.get(user_id) or {}
+        current = dict(zip(TOKEN_FIELDS, client.tokens()))
+        last = getattr(client, "last_time_token_refreshed", None)
+        current["refreshed_at"] = last.timestamp() if last else time.time()
+        self.store.put(user_id, {**stored, **current})
+        client.mark_clean()
+        return True
+
+tgtg_manager = TGTGManager()
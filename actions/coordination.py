@@ -0,0 +1,213 @@
+"""
+Coordination between replicas: action servers, and monitor workers.
+
+- `user_lock(user_id)`: cross-process lock taken around a token refresh. Two
+  replicas refreshing the same user would each rotate the refresh token, and
+  the slower one would be left with a dead token. Waiting polls with sleeps:
+  callers on a user's turn pass wait=0 and back off instead (see PooledTgtgClient).
+- leases (`Coordinator.try_acquire`) and heartbeats (`heartbeat` / `members`) let
+  the monitor workers split the watched items between them (see actions/monitor.py).
+- `HashRing`: consistent hashing of keys to the live workers, so a worker
+  joining or leaving only moves its own share of the items.
+
+Backends, selected with the `coordination` section of endpoints.yml:
+- sqlite (default): tables in the shared DB. Works for replicas on one host or volume,
+  and is the local stand-in for Redis in tests.
+- redis: SET NX locks and a sorted set of heartbeats, for replicas on different hosts.
+      coordination:
+        type: redis
+        url: localhost
+"""
+import bisect
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Text
+
+from actions.credential_store import DEFAULT_DB_PATH, SQLiteStore
+from actions.endpoints import endpoint_config, redis_client
+
+logger = logging.getLogger(__name__)
+
+# A refresh is a single HTTP call; the lock expires on its own if its holder dies
+USER_LOCK_TTL = 30.0
+USER_LOCK_WAIT = 10.0
+LOCK_POLL_INTERVAL = 0.05
+VIRTUAL_NODES = 64
+
+
+class Coordinator:
+
+    def try_acquire(self, key: Text, ttl: float) -> Optional[Text]:
+        """
+        Take the lock/lease `key` for `ttl` seconds if nobody holds it.
+        Returns a token to release it with, or None.
+        """
+        raise NotImplementedError
+
+    def release(self, key: Text, token: Text) -> None:
+        raise NotImplementedError
+
+    def heartbeat(self, worker_id: Text) -> None:
+        raise NotImplementedError
+
+    def members(self, max_age: float) -> List[Text]:
+        """
+        Workers that sent a heartbeat in the last `max_age` seconds.
+        """
+        raise NotImplementedError
+
+    def leave(self, worker_id: Text) -> None:
+        raise NotImplementedError
+
+    def acquire(self, key: Text, ttl: float, wait: float) -> Optional[Text]:
+        """
+        Like `try_acquire`, but waits up to `wait` seconds for the lock.
+        """
+        give_up = time.monotonic() + wait
+        while True:
+            token = self.try_acquire(key, ttl)
+            if token is not None or time.monotonic() >= give_up:
+                return token
+            time.sleep(LOCK_POLL_INTERVAL)
+
+
+class SQLiteCoordinator(SQLiteStore, Coordinator):
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS locks ("
+        " key TEXT PRIMARY KEY,"
+        " owner TEXT NOT NULL,"
+        " expires_at REAL NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS workers ("
+        " worker_id TEXT PRIMARY KEY,"
+        " last_seen REAL NOT NULL)",
+    )
+
+    def try_acquire(self, key: Text, ttl: float) -> Optional[Text]:
+        token = uuid.uuid4().hex
+        now = time.time()
+        with self._conn() as conn:
+            # Inserts a new lock, or takes over an expired one; a live lock is left alone
+            cursor = conn.execute(
+                "INSERT INTO locks (key, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE locks.expires_at <= ?",
+                (key, token, now + ttl, now),
+            )
+        return token if cursor.rowcount == 1 else None
+
+    def release(self, key: Text, token: Text) -> None:
+        with self._conn() as conn:
+            conn.execute("DELETE FROM locks WHERE key = ? AND owner = ?", (key, token))
+
+    def heartbeat(self, worker_id: Text) -> None:
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO workers (worker_id, last_seen) VALUES (?, ?) "
+                "ON CONFLICT(worker_id) DO UPDATE SET last_seen = excluded.last_seen",
+                (worker_id, time.time()),
+            )
+
+    def members(self, max_age: float) -> List[Text]:
+        rows = self._conn().execute(
+            "SELECT worker_id FROM workers WHERE last_seen >= ? ORDER BY worker_id", (time.time() - max_age,))
+        return [r[0] for r in rows]
+
+    def leave(self, worker_id: Text) -> None:
+        with self._conn() as conn:
+            conn.execute("DELETE FROM workers WHERE worker_id = ?", (worker_id,))
+
+
+class RedisCoordinator(Coordinator):
+    PREFIX = "tgtg:lock:"
+    WORKERS = "tgtg:workers"
+    # Delete the lock only if we still own it
+    _RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+    def __init__(self, config: Dict = None):
+        self._redis = redis_client(config or {})
+        self._release = self._redis.register_script(self._RELEASE)
+
+    def try_acquire(self, key: Text, ttl: float) -> Optional[Text]:
+        token = uuid.uuid4().hex
+        if self._redis.set(self.PREFIX + key, token, nx=True, px=int(ttl * 1000)):
+            return token
+        return None
+
+    def release(self, key: Text, token: Text) -> None:
+        self._release(keys=[self.PREFIX + key], args=[token])
+
+    def heartbeat(self, worker_id: Text) -> None:
+        self._redis.zadd(self.WORKERS, {worker_id: time.time()})
+
+    def members(self, max_age: float) -> List[Text]:
+        return sorted(m.decode() for m in self._redis.zrangebyscore(self.WORKERS, time.time() - max_age, "+inf"))
+
+    def leave(self, worker_id: Text) -> None:
+        self._redis.zrem(self.WORKERS, worker_id)
+
+
+def load_coordinator() -> Coordinator:
+    config = endpoint_config("coordination")
+    if config.get("type") == "redis":
+        try:
+            return RedisCoordinator(config)
+        except ImportError:
+            logger.error("coordination type is redis but the redis package isn't installed; using SQLite")
+    return SQLiteCoordinator(config.get("path", DEFAULT_DB_PATH))
+
+
+_coordinator: Optional[Coordinator] = None
+_coordinator_lock = threading.Lock()
+
+
+def get_coordinator() -> Coordinator:
+    global _coordinator
+    if _coordinator is None:
+        with _coordinator_lock:
+            if _coordinator is None:
+                _coordinator = load_coordinator()
+    return _coordinator
+
+
+@contextmanager
+def user_lock(user_id: Text, ttl: float = USER_LOCK_TTL, wait: float = USER_LOCK_WAIT):
+    """
+    Hold the user's lock for the block. Yields whether it was acquired: after `wait`
+    seconds the block runs anyway rather than failing the user's turn.
+    Blocks the calling thread while waiting; never call it from an event loop.
+    """
+    coordinator = get_coordinator()
+    key = f"user:{user_id}"
+    token = coordinator.acquire(key, ttl, wait)
+    if token is None and wait:
+        logger.warning(f"Couldn't lock user {user_id} within {wait:.0f}s, going ahead without the lock")
+    try:
+        yield token is not None
+    finally:
+        if token is not None:
+            coordinator.release(key, token)
+
+
+def _hash(key: Text) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Consistent hashing of keys to members, VIRTUAL_NODES points per member.
+    """
+
+    def __init__(self, members: Iterable[Text], virtual_nodes: int = VIRTUAL_NODES):
+        points = sorted((_hash(f"{m}#{i}"), m) for m in set(members) for i in range(virtual_nodes))
+        self._hashes = [h for h, _ in points]
+        self._members = [m for _, m in points]
+
+    def owner(self, key: Text) -> Optional[Text]:
+        if not self._hashes:
+            return None
+        i = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._members[i]
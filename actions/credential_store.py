@@ -0,0 +1,268 @@
+"""
+Credential storage backends for TGTGManager.
+
+- SQLiteCredentialStore (default): one row per user, WAL mode, upserts in a transaction.
+  Shared by every process on the same host / volume.
+- RedisCredentialStore: one hash field per user, shared by replicas on different hosts.
+  Selected in endpoints.yml:
+      credential_store:
+        type: redis
+        url: localhost
+- JsonCredentialStore: the legacy `user_credentials.json` file, kept for importing old data.
+
+Migrate old data with:
+    python -m actions.credential_store migrate --from user_credentials.json --to user_credentials.db
+    python -m actions.credential_store migrate --from user_credentials.json --to-configured
+"""
+import argparse
+import heapq
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Text, Tuple
+
+from actions.endpoints import endpoint_config, redis_client
+
+DEFAULT_DB_PATH = os.getenv("TGTG_CREDENTIAL_DB", "user_credentials.db")
+LEGACY_JSON_PATH = "user_credentials.json"
+
+
+def connect(path: Text) -> sqlite3.Connection:
+    """
+    Open a connection with the settings every store in this DB uses.
+    """
+    conn = sqlite3.connect(path, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class SQLiteStore:
+    """
+    Base of the stores sharing the SQLite DB: one connection per thread (sqlite3
+    connections can't be shared across threads), opened on first use. The
+    tables in SCHEMA are created (and columns added) by the first connection,
+    so building a store at import time costs no I/O.
+    """
+    SCHEMA: Tuple[Text, ...] = ()
+
+    def __init__(self, path: Text = DEFAULT_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = connect(self.path)
+            if not self._schema_ready:
+                with self._schema_lock:
+                    if not self._schema_ready:
+                        with conn:
+                            for statement in self.SCHEMA:
+                                try:
+                                    conn.execute(statement)
+                                except sqlite3.OperationalError as e:
+                                    # ADD COLUMN has no IF NOT EXISTS: the column is already there
+                                    if "duplicate column" not in str(e):
+                                        raise
+                        self._schema_ready = True
+        return conn
+
+    def open(self) -> None:
+        """
+        Connect (and create the tables) now instead of on first use.
+        """
+        self._conn()
+
+
+class CredentialStore:
+    """
+    Interface every backend implements. `credentials` is the dict returned by
+    `TgtgClient.get_credentials()` (access_token, refresh_token, cookie).
+    """
+
+    def get(self, user_id: Text) -> Optional[Dict[Text, Any]]:
+        raise NotImplementedError
+
+    def put(self, user_id: Text, credentials: Dict[Text, Any]) -> None:
+        raise NotImplementedError
+
+    def delete(self, user_id: Text) -> None:
+        raise NotImplementedError
+
+    def items(self) -> Iterator[Tuple[Text, Dict[Text, Any]]]:
+        raise NotImplementedError
+
+    def due(self, refreshed_before: float, limit: int) -> List[Text]:
+        """
+        Up to `limit` users whose tokens were last refreshed before `refreshed_before`
+        (never, for old records), oldest first. Users flagged `login_required` are left out.
+        """
+        candidates = ((creds.get("refreshed_at") or 0, user_id) for user_id, creds in self.items()
+                      if not creds.get("login_required"))
+        return [user_id for refreshed_at, user_id in heapq.nsmallest(limit, candidates)
+                if refreshed_at < refreshed_before]
+
+
+class SQLiteCredentialStore(SQLiteStore, CredentialStore):
+    """
+    Per-user rows in SQLite. Each write touches only that user's row, so a token
+    refresh is O(1) I/O no matter how many users are stored, and WAL mode lets
+    several action workers read while one writes. Nothing is loaded up front:
+    a user's row is read the first time their client is needed.
+    """
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS credentials ("
+        " user_id TEXT PRIMARY KEY,"
+        " data TEXT NOT NULL,"
+        " updated_at REAL NOT NULL)",
+    )
+
+    def get(self, user_id: Text) -> Optional[Dict[Text, Any]]:
+        row = self._conn().execute(
+            "SELECT data FROM credentials WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, user_id: Text, credentials: Dict[Text, Any]) -> None:
+        # `with conn` wraps the upsert in a transaction (commit / rollback)
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO credentials (user_id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                (user_id, json.dumps(credentials), time.time()),
+            )
+
+    def delete(self, user_id: Text) -> None:
+        with self._conn() as conn:
+            conn.execute("DELETE FROM credentials WHERE user_id = ?", (user_id,))
+
+    def items(self) -> Iterator[Tuple[Text, Dict[Text, Any]]]:
+        for user_id, data in self._conn().execute("SELECT user_id, data FROM credentials"):
+            yield user_id, json.loads(data)
+
+    def due(self, refreshed_before: float, limit: int) -> List[Text]:
+        # Filtered inside SQLite: no JSON is decoded in Python
+        rows = self._conn().execute(
+            "SELECT user_id FROM credentials"
+            " WHERE COALESCE(json_extract(data, '$.refreshed_at'), 0) < ?"
+            " AND COALESCE(json_extract(data, '$.login_required'), 0) = 0"
+            " ORDER BY COALESCE(json_extract(data, '$.refreshed_at'), 0) LIMIT ?",
+            (refreshed_before, limit))
+        return [r[0] for r in rows]
+
+
+class JsonCredentialStore(CredentialStore):
+    """
+    Legacy single-file store. Every write rewrites the whole file, so it's only
+    meant for reading old data; writes go through a temp file + atomic rename so
+    a crash never leaves a half-written file behind.
+    """
+
+    def __init__(self, path: Text = LEGACY_JSON_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.db = json.load(f)
+        else:
+            self.db = {}
+
+    def _save_db(self) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.db, f)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def get(self, user_id: Text) -> Optional[Dict[Text, Any]]:
+        return self.db.get(user_id)
+
+    def put(self, user_id: Text, credentials: Dict[Text, Any]) -> None:
+        with self._lock:
+            self.db[user_id] = credentials
+            self._save_db()
+
+    def delete(self, user_id: Text) -> None:
+        with self._lock:
+            if self.db.pop(user_id, None) is not None:
+                self._save_db()
+
+    def items(self) -> Iterator[Tuple[Text, Dict[Text, Any]]]:
+        return iter(list(self.db.items()))
+
+
+class RedisCredentialStore(CredentialStore):
+    """
+    All users in one Redis hash (user_id -> credentials JSON). Needs the `redis` package.
+    """
+    KEY = "tgtg:credentials"
+
+    def __init__(self, config: Dict[Text, Any] = None):
+        self._redis = redis_client(config or {})
+
+    def get(self, user_id: Text) -> Optional[Dict[Text, Any]]:
+        data = self._redis.hget(self.KEY, user_id)
+        return json.loads(data) if data else None
+
+    def put(self, user_id: Text, credentials: Dict[Text, Any]) -> None:
+        self._redis.hset(self.KEY, user_id, json.dumps(credentials))
+
+    def delete(self, user_id: Text) -> None:
+        self._redis.hdel(self.KEY, user_id)
+
+    def items(self) -> Iterator[Tuple[Text, Dict[Text, Any]]]:
+        for user_id, data in self._redis.hscan_iter(self.KEY):
+            yield user_id.decode(), json.loads(data)
+
+
+def load_credential_store() -> CredentialStore:
+    """
+    The store described by the `credential_store` section of endpoints.yml (SQLite by default).
+    """
+    config = endpoint_config("credential_store")
+    if config.get("type") == "redis":
+        return RedisCredentialStore(config)
+    return SQLiteCredentialStore(config.get("path", DEFAULT_DB_PATH))
+
+
+def migrate(source: CredentialStore, target: CredentialStore) -> int:
+    """
+    Copy every user from `source` into `target`. Returns the number of users copied.
+    """
+    count = 0
+    for user_id, credentials in source.items():
+        target.put(user_id, credentials)
+        count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the TGTG credential store")
+    sub = parser.add_subparsers(dest="command", required=True)
+    m = sub.add_parser("migrate", help="Import the legacy JSON file into SQLite")
+    m.add_argument("--from", dest="source", default=LEGACY_JSON_PATH)
+    m.add_argument("--to", dest="target", default=DEFAULT_DB_PATH)
+    m.add_argument("--to-configured", action="store_true",
+                   help="Import into the store set in endpoints.yml instead of --to")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        if not os.path.exists(args.source):
+            parser.error(f"{args.source} does not exist")
+        target = load_credential_store() if args.to_configured else SQLiteCredentialStore(args.target)
+        count = migrate(JsonCredentialStore(args.source), target)
+        print(f"Migrated {count} users from {args.source} to {type(target).__name__}")
+
+
+if __name__ == "__main__":
+    main()
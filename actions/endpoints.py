@@ -0,0 +1,33 @@
+"""
+Reads our own sections of endpoints.yml (stock_cache, credential_store, coordination),
+written in the same style as Rasa's tracker_store section.
+"""
+import os
+from typing import Any, Dict, Text
+
+ENDPOINTS_FILE = os.getenv("RASA_ENDPOINTS", "endpoints.yml")
+
+
+def endpoint_config(section: Text, endpoints_file: Text = ENDPOINTS_FILE) -> Dict[Text, Any]:
+    """
+    The `section` mapping of endpoints.yml, or {} if the file or the section is missing.
+    """
+    if not os.path.exists(endpoints_file):
+        return {}
+    import yaml
+    with open(endpoints_file) as f:
+        return (yaml.safe_load(f) or {}).get(section) or {}
+
+
+def redis_client(config: Dict[Text, Any]):
+    """
+    Client for a `type: redis` section. Raises ImportError without the redis package.
+    """
+    import redis
+    return redis.Redis(
+        host=config.get("url", "localhost"),
+        port=config.get("port", 6379),
+        db=config.get("db", 0),
+        password=config.get("password"),
+        ssl=config.get("use_ssl", False),
+    )
@@ -0,0 +1,201 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Text
+
+from actions.metrics import inc, span
+from actions.stock_cache import StockCache, get_stock_cache, item_id_of
+from actions.store_index import StoreIndex
+
+# How long a favorites snapshot is considered fresh (seconds).
+# Short enough that stock numbers don't drift much between turns of one conversation.
+DEFAULT_TTL = 45
+# How long we trust the *list* of a user's favorites (which items, not their stock).
+# Within it, a stale snapshot is rebuilt from the shared stock cache instead of get_items().
+MEMBERSHIP_TTL = 10 * 60
+# Up to this many items missing from the stock cache are fetched one by one;
+# more than that and a single get_items() call is cheaper.
+PARTIAL_REFRESH_MAX = 3
+# Max number of users we keep snapshots for (least recently used are dropped).
+DEFAULT_MAX_USERS = 1000
+
+logger = logging.getLogger(__name__)
+
+
+class FavoritesSnapshot:
+    """
+    One user's favorites payload list plus the times it was fetched.
+    - fetched_at: when the stock numbers were last known fresh
+    - listed_at: when the list of favorites itself was last fetched with get_items()
+    """
+    __slots__ = ("items", "fetched_at", "listed_at", "_index", "_by_id")
+
+    def __init__(self, items: List[Dict[Text, Any]], fetched_at: float,
+                 listed_at: Optional[float] = None, index: Optional[StoreIndex] = None):
+        self.items = items
+        self.fetched_at = fetched_at
+        self.listed_at = listed_at if listed_at is not None else fetched_at
+        self._index = index
+        self._by_id = None
+
+    @property
+    def index(self) -> StoreIndex:
+        # Built lazily, at most once per favorites list (store names don't change with stock)
+        if self._index is None:
+            self._index = StoreIndex(self.items)
+        return self._index
+
+    @property
+    def item_ids(self) -> List[Text]:
+        return [item_id_of(item) for item in self.items]
+
+    def current(self, payload: Optional[Dict[Text, Any]]) -> Optional[Dict[Text, Any]]:
+        """
+        The payload in this snapshot for the same item as `payload`
+        (the index may hold the one from an older snapshot of the same list).
+        """
+        if payload is None:
+            return None
+        if self._by_id is None:
+            self._by_id = {item_id_of(item): item for item in self.items}
+        return self._by_id.get(item_id_of(payload), payload)
+
+    def age(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+
+class FavoritesCache:
+    """
+    Per-user cache of the favorites payload list.
+    - Entries older than `ttl` are refreshed on the next read: from the shared
+      stock cache when possible, with get_items() otherwise.
+    - At most `max_users` entries are kept (LRU eviction).
+    - `force_refresh=True` always goes upstream (used right before checkout).
+    - Subscribers (`subscribe`) hear about every list fetched with get_items(),
+      on a thread of their own.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL, max_users: int = DEFAULT_MAX_USERS,
+                 stock: StockCache = None, membership_ttl: float = MEMBERSHIP_TTL):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._stock = stock
+        self.membership_ttl = membership_ttl
+        self._entries: "OrderedDict[Text, FavoritesSnapshot]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[Text, List[Dict[Text, Any]]], None]] = []
+        self._notifier: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def stock(self) -> StockCache:
+        return self._stock or get_stock_cache()
+
+    def get_items(self, user_id: Text, client, force_refresh: bool = False) -> List[Dict[Text, Any]]:
+        """
+        Return the cached favorites for `user_id`, fetching them with `client` if missing or stale.
+        """
+        return self.get_snapshot(user_id, client, force_refresh).items
+
+    def get_index(self, user_id: Text, client, force_refresh: bool = False) -> StoreIndex:
+        """
+        Same as `get_items` but returns the store-name index of the snapshot.
+        """
+        return self.get_snapshot(user_id, client, force_refresh).index
+
+    def get_snapshot(self, user_id: Text, client, force_refresh: bool = False) -> FavoritesSnapshot:
+        if not force_refresh:
+            snapshot = self.peek(user_id)
+            if snapshot is not None:
+                inc("tgtg_favorites_cache_total", result="hit")
+                return snapshot
+            snapshot = self._resolve(user_id, client)
+            if snapshot is not None:
+                inc("tgtg_favorites_cache_total", result="stock_cache")
+                return snapshot
+
+        inc("tgtg_favorites_cache_total", result="refresh" if force_refresh else "miss")
+        with span("get_items"):
+            items = client.get_items()
+        self.stock.put_many(items)
+        snapshot = self.put(user_id, items)
+        self._publish(user_id, items)
+        return snapshot
+
+    def subscribe(self, listener: Callable[[Text, List[Dict[Text, Any]]], None]) -> None:
+        """
+        Call `listener(user_id, items)` whenever a user's favorites list is fetched.
+        Listeners run on a background thread: the turn that fetched never waits for them.
+        """
+        with self._lock:
+            self._listeners.append(listener)
+            if self._notifier is None:
+                self._notifier = ThreadPoolExecutor(1, thread_name_prefix="favorites-listeners")
+
+    def _publish(self, user_id: Text, items: List[Dict[Text, Any]]) -> None:
+        for listener in self._listeners:
+            self._notifier.submit(self._notify, listener, user_id, items)
+
+    @staticmethod
+    def _notify(listener, user_id: Text, items: List[Dict[Text, Any]]) -> None:
+        try:
+            listener(user_id, items)
+        except Exception as e:
+            logger.error(f"Favorites listener {listener} failed for {user_id}: {e}")
+
+    def _resolve(self, user_id: Text, client) -> Optional[FavoritesSnapshot]:
+        """
+        Rebuild a stale snapshot from the shared stock cache, if we still trust the
+        user's list of favorites and (nearly) all of its items are cached.
+        """
+        with self._lock:
+            old = self._entries.get(user_id)
+        if old is None or time.monotonic() - old.listed_at > self.membership_ttl:
+            return None
+
+        item_ids = old.item_ids
+        cached = self.stock.get_many(item_ids)
+        missing = [i for i in item_ids if i not in cached]
+        if len(missing) > PARTIAL_REFRESH_MAX:
+            return None
+        for item_id in missing:
+            with span("get_item"):
+                payload = client.get_item(item_id)
+            self.stock.put(payload)
+            cached[item_id] = payload
+
+        snapshot = FavoritesSnapshot([cached[i] for i in item_ids], time.monotonic(),
+                                     listed_at=old.listed_at, index=old._index)
+        self._store(user_id, snapshot)
+        return snapshot
+
+    def peek(self, user_id: Text) -> Optional[FavoritesSnapshot]:
+        """
+        Return the fresh snapshot for `user_id` without going upstream, or None.
+        """
+        with self._lock:
+            snapshot = self._entries.get(user_id)
+            if snapshot is None or snapshot.age() > self.ttl:
+                return None
+            self._entries.move_to_end(user_id)
+            return snapshot
+
+    def put(self, user_id: Text, items: List[Dict[Text, Any]]) -> FavoritesSnapshot:
+        snapshot = FavoritesSnapshot(items, time.monotonic())
+        self._store(user_id, snapshot)
+        return snapshot
+
+    def _store(self, user_id: Text, snapshot: FavoritesSnapshot) -> None:
+        with self._lock:
+            self._entries[user_id] = snapshot
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: Text) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+favorites_cache = FavoritesCache()
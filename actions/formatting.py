@@ -0,0 +1,64 @@
+from datetime import datetime
+from functools import lru_cache
+from typing import Optional, Text
+
+from actions.items_summary import DATETIME_FORMAT, get_tz, parse_pickup  # noqa: F401 (re-exported)
+from actions.user_prefs import UserPrefs
+
+# (symbol, symbol goes before the amount?)
+CURRENCY_SYMBOLS = {
+    "GBP": ("£", True),
+    "USD": ("$", True),
+    "CAD": ("$", True),
+    "AUD": ("$", True),
+    "EUR": ("€", False),
+    "CHF": ("CHF", True),
+    "DKK": ("kr.", False),
+    "NOK": ("kr", False),
+    "SEK": ("kr", False),
+    "PLN": ("zł", False),
+}
+
+TIME_FORMAT = "%H:%M"
+
+
+class Formatter:
+    """
+    Formats times and prices for one (timezone, currency) preference.
+    Instances are shared between users with the same preferences, see `get_formatter`.
+    """
+
+    def __init__(self, timezone: Text, currency: Text):
+        self.tz = get_tz(timezone)
+        self.currency = currency
+
+    def localize(self, dt: datetime) -> datetime:
+        return dt.astimezone(self.tz)
+
+    def format_time(self, dt: Optional[datetime]) -> Optional[Text]:
+        return self.localize(dt).strftime(TIME_FORMAT) if dt else None
+
+    def format_datetime(self, dt: Optional[datetime]) -> Optional[Text]:
+        return self.localize(dt).strftime(DATETIME_FORMAT) if dt else None
+
+    def format_window(self, start: Optional[datetime], end: Optional[datetime]) -> Optional[Text]:
+        if not (start and end):
+            return None
+        return f"{self.format_datetime(start)} → {self.format_datetime(end)}"
+
+    def format_price(self, amount: float, currency: Optional[Text] = None) -> Text:
+        # The bag's own currency wins; the user's preference is only the fallback
+        code = (currency or self.currency).upper()
+        symbol, before = CURRENCY_SYMBOLS.get(code, (code, False))
+        if before:
+            return f"{symbol}{amount:.2f}"
+        return f"{amount:.2f} {symbol}"
+
+
+@lru_cache(maxsize=256)
+def get_formatter(timezone: Text, currency: Text) -> Formatter:
+    return Formatter(timezone, currency)
+
+
+def formatter_for(prefs: UserPrefs) -> Formatter:
+    return get_formatter(prefs.timezone, prefs.currency)
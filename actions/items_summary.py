@@ -1,37 +1,43 @@
-
-from datetime import datetime, timezone
+from datetime import datetime
+from functools import lru_cache
+from collections import OrderedDict
 from zoneinfo import ZoneInfo
 import re
-import time
+import threading
 
-def summarize_magic_bag(payload: dict) -> dict:
-    item = payload["item"]
-    store = payload["store"]
-    pickup = payload.get("pickup_interval", {})
-    address = store["store_location"]["address"]["address_line"]
+DEFAULT_TZ = "Europe/London"
+DATETIME_FORMAT = "%Y-%m-%d %H:%M"
+# Parsed descriptions kept in memory (descriptions rarely change between fetches)
+FOODS_CACHE_SIZE = 4096
 
-    # 1) Restaurant name
-    id = item["item_id"]
-    restaurant_name = store["store_name"]
-    branch = store.get("branch")
-    if branch and branch.lower() not in restaurant_name.lower():
-        restaurant_name = f"{restaurant_name} — {branch}"
+# Compiled once at import instead of on every call
+_SUCH_AS = re.compile(r"(?:such as|e\.g\.,?|like|include)\s+(.*)", re.IGNORECASE)
+_EITHER = re.compile(r"either:\s*(.*)", re.IGNORECASE | re.DOTALL)
+_SPLIT = re.compile(r",|\bor\b|/|、")
+_LEADING_AND = re.compile(r"^and\s+")
+_PLEASE_NOTE = re.compile(r"^(please note.*)$")
 
-    # 2) Address
-    full_address = address
+_foods_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+_foods_lock = threading.Lock()
 
-    # 3) What food (from description; naive parse)
-    desc = (item.get("description") or "").strip()
-   
+
+@lru_cache(maxsize=None)
+def get_tz(name: str = DEFAULT_TZ) -> ZoneInfo:
+    return ZoneInfo(name)
+
+
+def _parse_foods(desc: str) -> tuple:
+    """
+    Returns (candidates, foods): the text after "such as ..." (or the whole
+    description) and the de-duplicated list of foods split out of it.
+    """
     # Try to pull items after phrases like "You could receive items such as ..." etc.
     foods = []
-    m = re.search(r"(?:such as|e\.g\.,?|like|include)\s+(.*)", desc, re.IGNORECASE)
-    # print("match:", m)
+    m = _SUCH_AS.search(desc)
     if m:
-        # print("matched:", m.group(1))
         if m.group(1).strip().endswith(":"):
             # remove trailing period
-            m = re.search(r"either:\s*(.*)", desc, re.IGNORECASE | re.DOTALL)
+            m = _EITHER.search(desc)
             candidates = m.group(1).strip() if m else desc
         else:
             candidates = m.group(1)
@@ -39,15 +45,14 @@ def summarize_magic_bag(payload: dict) -> dict:
         # fallback: use the whole description
         candidates = desc
     # split by commas and "or"
-    parts = re.split(r",|\bor\b|/|、", candidates)
-    for p in parts:
+    for p in _SPLIT.split(candidates):
         p = p.strip(" .!?:;").lower()
         if not p:
             continue
         # basic cleanups
-        p = re.sub(r"^and\s+", "", p)
+        p = _LEADING_AND.sub("", p)
         # avoid trailing commentary
-        p = re.sub(r"^(please note.*)$", "", p)
+        p = _PLEASE_NOTE.sub("", p)
         if p and len(p) <= 60:
             foods.append(p)
     # de-dup while keeping order
@@ -55,35 +60,149 @@ def summarize_magic_bag(payload: dict) -> dict:
     foods = [f for f in foods if not (f in seen or seen.add(f))]
     if not foods and desc:
         foods = [desc]  # fallback: keep the raw description
-    
+    return candidates, tuple(foods)
+
+
+def parse_foods(item_id, desc: str) -> tuple:
+    """
+    Cached `_parse_foods`, keyed by (item_id, description hash) so an edited
+    description is parsed again.
+    """
+    key = (item_id, hash(desc))
+    with _foods_lock:
+        hit = _foods_cache.get(key)
+        if hit is not None:
+            _foods_cache.move_to_end(key)
+            return hit
+    parsed = _parse_foods(desc)
+    with _foods_lock:
+        _foods_cache[key] = parsed
+        if len(_foods_cache) > FOODS_CACHE_SIZE:
+            _foods_cache.popitem(last=False)
+    return parsed
+
+
+@lru_cache(maxsize=4096)
+def parse_pickup(iso_z):
+    """
+    ISO timestamp from the TGTG API ('2023-10-27T18:00:00Z') -> tz-aware datetime.
+    Cached: the same pickup time is parsed once, not on every turn.
+    """
+    if not iso_z:
+        return None
+    return datetime.fromisoformat(iso_z.replace("Z", "+00:00"))
+
+
+def to_local(iso_z, tz):
+    dt = parse_pickup(iso_z)
+    return dt.astimezone(tz) if dt else None
+
+
+class MagicBagSummary:
+    """
+    Summary of one favorites payload.
+    Still readable like the dict it used to be (`summary["restaurant"]`,
+    `summary.get("remaining", 0)`), without a dict per item.
+    """
+    __slots__ = ("restaurant", "id", "category", "address", "foods", "food_items",
+                 "remaining", "price", "value", "currency", "pickup_start", "pickup_end",
+                 "bring_own_bag")
+
+    # Legacy dict keys that don't map 1:1 to an attribute name
+    _ALIASES = {"need to bring own bag?": "bring_own_bag"}
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    @property
+    def pickup_window(self):
+        # pickup_start / pickup_end are tz-aware datetimes in the summary's timezone
+        if self.pickup_start and self.pickup_end:
+            return f"{self.pickup_start.strftime(DATETIME_FORMAT)} → {self.pickup_end.strftime(DATETIME_FORMAT)}"
+        return None
+
+    def _attr(self, key):
+        return self._ALIASES.get(key, key)
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, self._attr(key))
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        value = getattr(self, self._attr(key), None)
+        return default if value is None else value
+
+    def as_dict(self) -> dict:
+        return {
+            "restaurant": self.restaurant,
+            "id": self.id,
+            "category": self.category,
+            "address": self.address,
+            "foods": self.foods,
+            "remaining": self.remaining,
+            "price": self.price,
+            "value": self.value,
+            "pickup_window": self.pickup_window,
+            "need to bring own bag?": self.bring_own_bag,
+        }
+
+
+def summarize_magic_bag(payload: dict, tz=None) -> MagicBagSummary:
+    item = payload["item"]
+    store = payload["store"]
+    pickup = payload.get("pickup_interval", {})
+    tz_local = tz or get_tz()
+
+    # 1) Restaurant name
+    id = item["item_id"]
+    restaurant_name = store["store_name"]
+    branch = store.get("branch")
+    if branch and branch.lower() not in restaurant_name.lower():
+        restaurant_name = f"{restaurant_name} — {branch}"
+
+    # 2) Address
+    full_address = store["store_location"]["address"]["address_line"]
+
+    # 3) What food (from description; naive parse, cached per description)
+    desc = (item.get("description") or "").strip()
+    candidates, foods = parse_foods(id, desc)
+
     # 4) Remaining quantity
     remaining = payload.get("items_available", 0)
     # 5) Item price
     item_price = item["item_price"]["minor_units"] / (10 ** item["item_price"]["decimals"])
     item_value = item["item_value"]["minor_units"] / (10 ** item["item_value"]["decimals"])
-    # 6) Pickup window → local time (Europe/London)
-    tz_local = ZoneInfo("Europe/London")
-    def to_local(iso_z):
-        if not iso_z:
-            return None
-        dt = datetime.fromisoformat(iso_z.replace("Z", "+00:00"))
-        return dt.astimezone(tz_local).strftime("%Y-%m-%d %H:%M")
-
-    pickup_start = to_local(pickup.get("start"))
-    pickup_end = to_local(pickup.get("end"))
+    currency = item["item_price"].get("code")
+    # 6) Pickup window → local time (Europe/London unless the caller passes the user's tz)
+    pickup_start = to_local(pickup.get("start"), tz_local)
+    pickup_end = to_local(pickup.get("end"), tz_local)
     # 7) Packaging info
     packaging = "No" if item.get("packaging_option") == "BAG_ALLOWED" else "Yes"
     # 8) item category
     category = item.get("item_category", "N/A")
-    return {
-        "restaurant": restaurant_name,
-        "id": id,
-        "category": category,
-        "address": full_address,
-        "foods": candidates,
-        "remaining": remaining,
-        "price": item_price,
-        "value": item_value,
-        "pickup_window": f"{pickup_start} → {pickup_end}" if pickup_start and pickup_end else None,
-        "need to bring own bag?": packaging,
-    }
\ No newline at end of file
+    return MagicBagSummary(
+        restaurant=restaurant_name,
+        id=id,
+        category=category,
+        address=full_address,
+        foods=candidates,
+        food_items=foods,
+        remaining=remaining,
+        price=item_price,
+        value=item_value,
+        currency=currency,
+        pickup_start=pickup_start,
+        pickup_end=pickup_end,
+        bring_own_bag=packaging,
+    )
+
+
+def summarize_favorites(payloads, tz=None) -> list:
+    """
+    Summarize a whole favorites list in one pass.
+    """
+    tz_local = tz or get_tz()
+    return [summarize_magic_bag(payload, tz_local) for payload in payloads]
@@ -0,0 +1,245 @@
+"""
+Pre-NLU router for the formulaic TGTG commands ("check Greggs", "reserve a bag at
+Pret", "what's available right now?").
+
+Templates are built from the examples in data/nlu.yml: an example with a single
+[store](store) annotation becomes a prefix/suffix pair around the store, an
+example without entities an exact phrase. A message matching a template is
+resolved against the user's own favorites (the gazetteer, written by the action
+server whenever it lists a user's favorites: see `follow_favorites`), and rewritten to Rasa's
+`/intent{"store": ...}` form, which skips the NLU pipeline entirely.
+
+Anything else goes to the full model unchanged: no template, a store that isn't
+among the user's favorites or matches several equally, or a user the action
+server hasn't listed favorites for yet.
+
+The router runs in the Rasa server, through the routed_rest channel (channels/routed_rest.py),
+and reads the gazetteer from the same SQLite DB as the action server.
+Compare it with the trained model with:
+    python -m benchmarks.nlu_router --model models/
+"""
+import hashlib
+import json
+import re
+import time
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Text, Tuple
+
+from actions.credential_store import SQLiteStore
+from actions.local_cache import LocalCache
+from actions.store_index import StoreIndex, normalize
+
+NLU_FILE = "data/nlu.yml"
+# Intents the router may answer; the others always go through the model
+ROUTED_INTENTS = (
+    "check_availability", "reserve_order", "set_reminder", "monitor_stock",
+    "enable_auto_reserve", "list_available", "more_results",
+)
+# Below this store-match score the message goes to the model
+MIN_STORE_SCORE = 0.8
+# How long the router trusts a user's gazetteer before reading it again (seconds)
+GAZETTEER_TTL = 60
+# How long a writer trusts that the DB still holds what it last wrote (another
+# replica may have written since); past it, an unchanged list is written again
+GAZETTEER_WRITE_TTL = 10 * 60
+GAZETTEER_MAX_USERS = 10000
+# The store slot may come from either annotation style: [Greggs](store) or M&S (store)
+ANNOTATION = re.compile(r"\[([^\]]+)\]\((\w+)\)|(\S+) \((store)\)")
+_PLACEHOLDER = "\x00"
+_UNKNOWN = object()
+
+
+class Route(NamedTuple):
+    intent: Text
+    store: Optional[Text]
+    confidence: float
+
+    def message(self) -> Text:
+        """
+        The message in Rasa's `/intent{entities}` form.
+        """
+        if self.store is None:
+            return f"/{self.intent}"
+        return f"/{self.intent}{json.dumps({'store': self.store})}"
+
+
+class Templates:
+    """
+    Exact phrases and (prefix, suffix) pairs around a store, per intent.
+    """
+
+    def __init__(self):
+        self.exact: Dict[Text, Text] = {}
+        self.affixes: List[Tuple[Text, Text, Text]] = []
+
+    def add(self, intent: Text, example: Text) -> None:
+        annotations = ANNOTATION.findall(example)
+        if not annotations:
+            phrase = normalize(example)
+            if phrase:
+                self.exact[phrase] = intent
+            return
+        if len(annotations) > 1 or (annotations[0][1] or annotations[0][3]) != "store":
+            return  # other entities (quantity, timezone...) are left to the model
+        text = ANNOTATION.sub(_PLACEHOLDER, example)
+        prefix, _, suffix = text.partition(_PLACEHOLDER)
+        affix = (normalize(prefix), normalize(suffix), intent)
+        if affix not in self.affixes:
+            self.affixes.append(affix)
+            # Most specific first: "check availability for X" before "check X"
+            self.affixes.sort(key=lambda a: -(len(a[0]) + len(a[1])))
+
+    def match(self, text: Text) -> Optional[Tuple[Text, Optional[Text]]]:
+        """
+        (intent, store text or None) of the first template `text` fits.
+        """
+        phrase = normalize(text)
+        intent = self.exact.get(phrase)
+        if intent is not None:
+            return intent, None
+        for prefix, suffix, intent in self.affixes:
+            if not (phrase.startswith(prefix) and phrase.endswith(suffix)):
+                continue
+            start = len(prefix) + (1 if prefix else 0)
+            end = len(phrase) - len(suffix) - (1 if suffix else 0)
+            # Prefixes and suffixes must end on a word boundary
+            if (prefix and phrase[start - 1:start] != " ") or (suffix and phrase[end:end + 1] != " "):
+                continue
+            store = phrase[start:end].strip()
+            if store:
+                return intent, store
+        return None
+
+
+def load_templates(path: Text = NLU_FILE, intents: Iterable[Text] = ROUTED_INTENTS) -> Templates:
+    import yaml
+    with open(path) as f:
+        data = yaml.safe_load(f) or {}
+    return build_templates(data.get("nlu") or [], intents)
+
+
+def build_templates(nlu: List[Dict[Text, Any]], intents: Iterable[Text] = ROUTED_INTENTS) -> Templates:
+    intents = set(intents)
+    templates = Templates()
+    for block in nlu:
+        intent = block.get("intent")
+        if intent not in intents:
+            continue
+        for line in (block.get("examples") or "").splitlines():
+            example = line.strip()
+            if example.startswith("- "):
+                templates.add(intent, example[2:].strip())
+    return templates
+
+
+class GazetteerStore(SQLiteStore):
+    """
+    Store names of each user's favorites: written by the action server, read by the router.
+    """
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS favorite_stores ("
+        " user_id TEXT PRIMARY KEY,"
+        " stores TEXT NOT NULL,"
+        " updated_at REAL NOT NULL)",
+    )
+
+    def __init__(self, *args, ttl: float = GAZETTEER_TTL, max_users: int = GAZETTEER_MAX_USERS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ttl = ttl
+        self._written = LocalCache(GAZETTEER_WRITE_TTL, max_users)
+        self._indexes = LocalCache(ttl, max_users)
+
+    def put(self, user_id: Text, items: List[Dict[Text, Any]]) -> None:
+        """
+        Record the store names of `items`. Costs nothing when they didn't change.
+        """
+        stores = sorted({((i.get("store") or {}).get("store_name") or "", (i.get("store") or {}).get("branch") or "")
+                         for i in items})
+        data = json.dumps(stores)
+        digest = hashlib.sha1(data.encode()).hexdigest()
+        if self._written.get(user_id) == digest:
+            return
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO favorite_stores (user_id, stores, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET stores = excluded.stores, updated_at = excluded.updated_at",
+                (user_id, data, time.time()))
+        self._written.put(user_id, digest)
+        self._indexes.pop(user_id)
+
+    def index(self, user_id: Text) -> Optional[StoreIndex]:
+        """
+        StoreIndex over the user's favorite stores, None if they're unknown.
+        """
+        cached = self._indexes.get(user_id, _UNKNOWN)
+        if cached is not _UNKNOWN:
+            return cached
+        row = self._conn().execute("SELECT stores FROM favorite_stores WHERE user_id = ?", (user_id,)).fetchone()
+        index = None
+        if row:
+            index = StoreIndex([{"store": {"store_name": name, "branch": branch or None}}
+                                for name, branch in json.loads(row[0])])
+        self._indexes.put(user_id, index)
+        return index
+
+
+gazetteer = GazetteerStore()
+
+
+def follow_favorites(cache) -> None:
+    """
+    Record the store names of every favorites list `cache` (a FavoritesCache) fetches.
+    Called by the action server at startup; the writes happen off the turn's path.
+    """
+    cache.subscribe(gazetteer.put)
+
+
+class KeywordRouter:
+
+    def __init__(self, templates: Templates = None, store: GazetteerStore = None,
+                 min_store_score: float = MIN_STORE_SCORE):
+        self._templates = templates
+        self.store = store or gazetteer
+        self.min_store_score = min_store_score
+        self.stats = {"routed": 0, "fallback": 0}
+
+    @property
+    def templates(self) -> Templates:
+        # data/nlu.yml is read on first use, not when the channel is imported
+        if self._templates is None:
+            self._templates = load_templates()
+        return self._templates
+
+    def route(self, user_id: Optional[Text], text: Optional[Text]) -> Optional[Route]:
+        """
+        The intent (and store) of `text` if the router is confident, None otherwise.
+        """
+        if not text or text.startswith("/"):
+            return None
+        matched = self.templates.match(text)
+        if matched is None:
+            return None
+        intent, store_text = matched
+        if store_text is None:
+            return Route(intent, None, 1.0)
+        index = self.store.index(user_id) if user_id else None
+        if index is None:
+            return None
+        lookup = index.lookup(store_text)
+        if lookup.match is None or lookup.is_ambiguous or lookup.candidates[0].score < self.min_store_score:
+            return None
+        best = lookup.candidates[0]
+        return Route(intent, best.name, best.score)
+
+    def rewrite(self, user_id: Optional[Text], text: Optional[Text]) -> Optional[Text]:
+        """
+        `text` in the `/intent{...}` form if routed, unchanged otherwise.
+        """
+        route = self.route(user_id, text)
+        if route is None:
+            self.stats["fallback"] += 1
+            return text
+        self.stats["routed"] += 1
+        return route.message()
+
+
+keyword_router = KeywordRouter()
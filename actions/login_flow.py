@@ -0,0 +1,70 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Text
+
+from actions.client_manager import tgtg_manager
+from actions.metrics import inc, span, trace_request
+from actions.notifier import push_message
+from actions.rate_limiter import RateLimitedTgtgClient
+
+logger = logging.getLogger(__name__)
+
+# Each pending login holds a thread while tgtg-python polls for the email click,
+# so they get their own pool instead of starving the loop's default executor.
+MAX_PENDING_LOGINS = 32
+
+
+class LoginPoller:
+    """
+    Runs the email verification in the background.
+    `start` returns immediately; when the user clicks the link the credentials
+    are saved and the user gets a proactive message.
+    """
+
+    def __init__(self, max_pending: int = MAX_PENDING_LOGINS):
+        self._executor = ThreadPoolExecutor(max_workers=max_pending, thread_name_prefix="tgtg-login")
+        self._pending: Dict[Text, asyncio.Task] = {}
+
+    def is_pending(self, user_id: Text) -> bool:
+        task = self._pending.get(user_id)
+        return task is not None and not task.done()
+
+    def start(self, user_id: Text, email: Text) -> bool:
+        """
+        Kick off the login for `user_id`. Must be called from the action server's loop.
+        Returns False if a login for this user is already in progress.
+        """
+        if self.is_pending(user_id):
+            return False
+        loop = asyncio.get_running_loop()
+        self._pending[user_id] = loop.create_task(self._complete(user_id, email))
+        return True
+
+    async def _complete(self, user_id: Text, email: Text) -> None:
+        loop = asyncio.get_running_loop()
+        with trace_request("login_exchange", user_id) as trace:
+            try:
+                # BLOCKING CALL (in a worker thread): sends the email, then waits for the click
+                with span("get_credentials"):
+                    credentials = await loop.run_in_executor(self._executor, self._exchange, user_id, email)
+                with span("save_credentials"):
+                    tgtg_manager.save_credentials(user_id, credentials)
+            except Exception as e:
+                trace.outcome = "auth_failure"
+                inc("tgtg_auth_failures_total", action="login_exchange")
+                logger.error(f"Login failed for {user_id}: {e}")
+                await push_message(user_id, "⚠️ Verification timed out or failed. Please try again.")
+            else:
+                await push_message(user_id, "Authentication successful! You can now use the bot.")
+            finally:
+                self._pending.pop(user_id, None)
+
+    @staticmethod
+    def _exchange(user_id: Text, email: Text) -> Dict[Text, Text]:
+        client = RateLimitedTgtgClient(email=email)
+        client.user_id = user_id
+        return client.get_credentials()
+
+
+login_poller = LoginPoller()
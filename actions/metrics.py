@@ -0,0 +1,236 @@
+"""
+In-process metrics for the action server: counters, latency histograms and
+per-request traces. Cheap enough to leave on (a lock and a few dict updates per
+event, no dependencies).
+
+- `span("get_items")` times one phase. The duration goes into the
+  tgtg_phase_seconds histogram, and into the trace of the current request.
+- `trace_request("action_check_tgtg", user_id)` wraps one action run. On exit it
+  writes one structured (JSON) log line with the outcome, the total time, every
+  span, and the upstream calls made.
+- `inc("tgtg_upstream_calls_total", endpoint=..., status=...)` bumps a counter.
+
+Prometheus text format is served on METRICS_PORT (default 9105, 0 disables):
+    curl localhost:9105/metrics
+Other modules can serve more paths there with `add_endpoint` (see actions/startup.py).
+"""
+import bisect
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Text, Tuple
+
+logger = logging.getLogger(__name__)
+request_logger = logging.getLogger("actions.requests")
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9105"))
+# Seconds; covers cache hits (sub-ms) up to slow checkouts
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_DIGITS = re.compile(r"(?<=/)\d+(?=/|$)")
+
+LabelKey = Tuple[Tuple[Text, Text], ...]
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+
+    def __init__(self):
+        self._counters: Dict[Text, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[Text, Dict[LabelKey, Histogram]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: Text, value: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: Text, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    def value(self, name: Text, **labels) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(tuple(sorted(labels.items())), 0)
+
+    def series(self, name: Text) -> Dict[LabelKey, float]:
+        with self._lock:
+            return dict(self._counters.get(name, {}))
+
+    def render(self) -> Text:
+        """
+        Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_labels(key)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, h in series.items():
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS + (float("inf"),), h.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                        lines.append(f"{name}_bucket{_labels(key + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(key)} {h.total:.6f}")
+                    lines.append(f"{name}_count{_labels(key)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(key: LabelKey) -> Text:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in key) + "}"
+
+
+registry = Registry()
+inc = registry.inc
+
+
+class RequestTrace:
+    __slots__ = ("action", "user_id", "started", "spans", "upstream_calls", "outcome")
+
+    def __init__(self, action: Text, user_id: Optional[Text]):
+        self.action = action
+        self.user_id = user_id
+        self.started = time.perf_counter()
+        self.spans: List[Tuple[Text, float]] = []
+        self.upstream_calls = 0
+        self.outcome = "ok"
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("tgtg_request_trace", default=None)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(phase: Text):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        trace = _current_trace.get()
+        action = trace.action if trace is not None else "background"
+        registry.observe("tgtg_phase_seconds", elapsed, action=action, phase=phase)
+        if trace is not None:
+            trace.spans.append((phase, elapsed))
+
+
+@contextmanager
+def trace_request(action: Text, user_id: Optional[Text] = None):
+    """
+    Trace one action run. Set `trace.outcome` to record how it ended
+    ("error" is set automatically if the block raises).
+    """
+    trace = RequestTrace(action, user_id)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    except BaseException:
+        trace.outcome = "error"
+        raise
+    finally:
+        _current_trace.reset(token)
+        elapsed = time.perf_counter() - trace.started
+        registry.observe("tgtg_action_seconds", elapsed, action=action)
+        inc("tgtg_actions_total", action=action, outcome=trace.outcome)
+        if request_logger.isEnabledFor(logging.INFO):
+            request_logger.info(json.dumps({
+                "action": action,
+                "user_id": user_id,
+                "outcome": trace.outcome,
+                "ms": round(elapsed * 1000, 2),
+                "upstream_calls": trace.upstream_calls,
+                "spans": {phase: round(seconds * 1000, 2) for phase, seconds in trace.spans},
+            }, ensure_ascii=False))
+
+
+def record_upstream_call(path, status) -> None:
+    """
+    Count one HTTP call to TGTG. Item ids are folded out of the path to keep the label set small.
+    """
+    endpoint = _DIGITS.sub(":id", path) if isinstance(path, str) else "unknown"
+    inc("tgtg_upstream_calls_total", endpoint=endpoint, status=str(status))
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.upstream_calls += 1
+
+
+# path -> callable returning (HTTP status, content type, body)
+_endpoints: Dict[Text, Callable[[], Tuple[int, Text, Text]]] = {
+    "/metrics": lambda: (200, "text/plain; version=0.0.4", registry.render()),
+}
+
+
+def add_endpoint(path: Text, handler: Callable[[], Tuple[int, Text, Text]]) -> None:
+    _endpoints[path] = handler
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        handler = _endpoints.get(self.path.split("?")[0])
+        if handler is None:
+            self.send_error(404)
+            return
+        status, content_type, text = handler()
+        body = text.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes every few seconds would drown the action server's log
+
+
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_http_server(port: int = METRICS_PORT) -> Optional[ThreadingHTTPServer]:
+    """
+    Serve /metrics from a daemon thread. Safe to call more than once.
+    """
+    global _server
+    if _server is not None or not port:
+        return _server
+    try:
+        _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    except OSError as e:
+        logger.warning(f"Metrics endpoint not started on port {port}: {e}")
+        return None
+    threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+    return _server
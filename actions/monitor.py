@@ -0,0 +1,340 @@
+"""
+Background stock monitoring.
+
+Watches live in SQLite next to the credentials (the action server adds them through
+action_monitor_stock). The monitor runs as its own process:
+    python -m actions.monitor
+
+Each item is fetched once per tick no matter how many users watch it, using the
+client of one of its watchers, and everyone watching it is notified when
+`items_available` goes from 0 to >0 (or crosses their own threshold).
+
+Several workers can run side by side (any host sharing the coordination backend,
+see actions/coordination.py): live workers split the items by consistent hashing,
+and a short lease per item makes sure a handover never polls an item twice.
+
+The monitor also refreshes users' tokens before they expire (actions/token_refresher.py)
+and syncs their calendar feeds with their orders (actions/calendar_feed.py).
+"""
+import asyncio
+import heapq
+import logging
+import os
+import random
+import socket
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Text
+
+from tgtg import TgtgAPIError, TgtgLoginError
+
+from actions.auto_reserve import WARM_INTERVAL, AutoReserver
+from actions.calendar_feed import CALENDAR_REFRESH_INTERVAL, refresh_all as refresh_calendars
+from actions.client_manager import tgtg_manager
+from actions.coordination import Coordinator, HashRing, get_coordinator
+from actions.credential_store import SQLiteStore
+from actions.metrics import start_http_server
+from actions.notifications import NotificationDispatcher, relogin_event, restock_event
+from actions.rate_limiter import Priority, RequestShedError, request_priority
+from actions.restock_history import AdaptivePolicy, HistoryStore
+from actions.stock_cache import get_stock_cache
+from actions.token_refresher import REFRESH_CHECK_INTERVAL, TokenRefresher
+
+logger = logging.getLogger(__name__)
+
+# Base time between two checks of the same item (seconds), as promised in the README
+POLL_INTERVAL = 30 * 60
+# +/- share of the interval added at random so items don't all fire together
+POLL_JITTER = 0.1
+# Upper bound on upstream requests, whatever the number of watches
+MAX_REQUESTS_PER_SECOND = 2.0
+MAX_CONCURRENT_FETCHES = 8
+# How often new/removed watches are picked up from the DB (seconds)
+RELOAD_INTERVAL = 60
+# Workers without a heartbeat for this long lose their items to the others
+WORKER_TIMEOUT = 3 * RELOAD_INTERVAL
+# Nobody polls an item again within this many seconds, whoever owns it
+POLL_LEASE = 60
+
+
+class Watch:
+    __slots__ = ("user_id", "item_id", "store_name", "min_available")
+
+    def __init__(self, user_id: Text, item_id: Text, store_name: Text, min_available: int = 1):
+        self.user_id = user_id
+        self.item_id = item_id
+        self.store_name = store_name
+        self.min_available = min_available
+
+
+class WatchStore(SQLiteStore):
+    """
+    Persistent watch table: one row per (user, item).
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS watches ("
+        " user_id TEXT NOT NULL,"
+        " item_id TEXT NOT NULL,"
+        " store_name TEXT NOT NULL,"
+        " min_available INTEGER NOT NULL DEFAULT 1,"
+        " created_at REAL NOT NULL,"
+        " PRIMARY KEY (user_id, item_id))",
+        "CREATE INDEX IF NOT EXISTS watches_item ON watches (item_id)",
+    )
+
+    def add(self, user_id: Text, item_id: Text, store_name: Text, min_available: int = 1) -> None:
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO watches (user_id, item_id, store_name, min_available, created_at) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(user_id, item_id) DO UPDATE SET "
+                "store_name = excluded.store_name, min_available = excluded.min_available",
+                (user_id, str(item_id), store_name, min_available, time.time()),
+            )
+
+    def remove(self, user_id: Text, item_id: Text) -> None:
+        with self._conn() as conn:
+            conn.execute("DELETE FROM watches WHERE user_id = ? AND item_id = ?", (user_id, str(item_id)))
+
+    def for_user(self, user_id: Text) -> List[Watch]:
+        rows = self._conn().execute(
+            "SELECT user_id, item_id, store_name, min_available FROM watches WHERE user_id = ?",
+            (user_id,),
+        )
+        return [Watch(*row) for row in rows]
+
+    def by_item(self) -> Dict[Text, List[Watch]]:
+        grouped = defaultdict(list)
+        for row in self._conn().execute("SELECT user_id, item_id, store_name, min_available FROM watches"):
+            grouped[row[1]].append(Watch(*row))
+        return dict(grouped)
+
+
+class StockMonitor:
+    """
+    Polls every watched item on its own jittered schedule.
+    - watches on the same item are coalesced into one fetch
+    - fetches are spaced to stay under MAX_REQUESTS_PER_SECOND
+    - every observation is recorded, and the interval adapts to the item's
+      learned restock windows (see actions/restock_history.py)
+    - armed items are reserved automatically before anyone is notified
+      (see actions/auto_reserve.py)
+    - restock alerts are fanned out by the notification dispatcher
+      (see actions/notifications.py)
+    """
+
+    def __init__(self, watches: WatchStore = None, manager=None,
+                 interval: float = POLL_INTERVAL, jitter: float = POLL_JITTER,
+                 max_rps: float = MAX_REQUESTS_PER_SECOND,
+                 max_concurrent: int = MAX_CONCURRENT_FETCHES,
+                 history: HistoryStore = None, auto_reserver: AutoReserver = None,
+                 notifications: NotificationDispatcher = None,
+                 worker_id: Text = None, coordinator: Coordinator = None,
+                 token_refresher: TokenRefresher = None):
+        self.watches = watches or WatchStore()
+        self.manager = manager or tgtg_manager
+        self.auto_reserver = auto_reserver or AutoReserver(manager=self.manager)
+        self.history = history or HistoryStore()
+        self.notifications = notifications or NotificationDispatcher()
+        self.policy = AdaptivePolicy(self.history, interval)
+        self.interval = interval
+        self.jitter = jitter
+        self.min_spacing = 1.0 / max_rps
+        self.max_concurrent = max_concurrent
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.coordinator = coordinator or get_coordinator()
+        self.token_refresher = token_refresher or TokenRefresher(self.manager)
+
+        self._watchers: Dict[Text, List[Watch]] = {}
+        self._schedule: List = []            # heap of (due_at, item_id)
+        self._scheduled = set()              # items queued or being checked
+        self._tasks = set()
+        self._last_available: Dict[Text, int] = {}
+        self._next_slot = 0.0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def run_forever(self) -> None:
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        await self.notifications.start()
+        next_reload = 0.0
+        next_warm = 0.0
+        next_refresh = 0.0
+        next_calendars = 0.0
+        try:
+            while True:
+                now = time.monotonic()
+                if now >= next_reload:
+                    self.reload()
+                    next_reload = now + RELOAD_INTERVAL
+                if now >= next_warm:
+                    # Keep auto-reserve clients hot without blocking the schedule
+                    asyncio.create_task(self.warm_auto_reserve())
+                    next_warm = now + WARM_INTERVAL
+                if now >= next_refresh:
+                    asyncio.create_task(self.refresh_tokens())
+                    next_refresh = now + REFRESH_CHECK_INTERVAL
+                if now >= next_calendars:
+                    asyncio.create_task(self.refresh_calendars())
+                    next_calendars = now + CALENDAR_REFRESH_INTERVAL
+
+                # Checks run as tasks so a slow fetch never delays the next due item
+                while self._schedule and self._schedule[0][0] <= now:
+                    _, item_id = heapq.heappop(self._schedule)
+                    task = asyncio.create_task(self.check_item(item_id))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+
+                wake_at = min(next_reload, self._schedule[0][0]) if self._schedule else next_reload
+                await asyncio.sleep(max(0.0, wake_at - time.monotonic()))
+        finally:
+            self.history.flush()
+            self.coordinator.leave(self.worker_id)
+            await self.notifications.close()
+
+    async def warm_auto_reserve(self) -> None:
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.auto_reserver.warm, set(self._watchers))
+        except Exception as e:
+            logger.error(f"Auto-reserve warm-up failed: {e}")
+
+    async def refresh_tokens(self) -> None:
+        # One worker per pass; the lease expires before the next one
+        if self.coordinator.try_acquire("token_refresher", REFRESH_CHECK_INTERVAL * 0.9) is None:
+            return
+        try:
+            dead = await asyncio.get_running_loop().run_in_executor(None, self.token_refresher.run_once)
+        except Exception as e:
+            logger.error(f"Token refresh pass failed: {e}")
+            return
+        if dead:
+            await self.notifications.publish(relogin_event(), dead)
+
+    async def refresh_calendars(self) -> None:
+        if self.coordinator.try_acquire("calendar_refresh", CALENDAR_REFRESH_INTERVAL * 0.9) is None:
+            return
+        try:
+            stats = await asyncio.get_running_loop().run_in_executor(None, refresh_calendars, self.manager)
+            logger.info(f"Calendar feeds refreshed: {stats}")
+        except Exception as e:
+            logger.error(f"Calendar refresh pass failed: {e}")
+
+    def reload(self) -> None:
+        """
+        Pick up watches added/removed by the action server, and the items this worker owns.
+        New items get a random first check within the next reload period to spread the load.
+        """
+        self.history.flush()
+        self.coordinator.heartbeat(self.worker_id)
+        ring = HashRing(self.coordinator.members(WORKER_TIMEOUT) or [self.worker_id])
+        self._watchers = {item_id: watchers for item_id, watchers in self.watches.by_item().items()
+                          if ring.owner(item_id) == self.worker_id}
+        self.auto_reserver.reload()
+
+        # Items handed over by another worker (or seen before a restart) continue
+        # from their last recorded stock, so their next restock isn't missed
+        new_items = [i for i in self._watchers if i not in self._last_available]
+        if new_items:
+            latest = self.history.latest()
+            for item_id in new_items:
+                if item_id in latest:
+                    self._last_available[item_id] = latest[item_id]
+
+        now = time.monotonic()
+        for item_id in self._watchers:
+            if item_id not in self._scheduled:
+                self._push(item_id, now + random.uniform(0, min(self.interval, RELOAD_INTERVAL)))
+        for item_id in list(self._last_available):
+            if item_id not in self._watchers:
+                del self._last_available[item_id]
+                self.policy.forget(item_id)
+
+    def next_interval(self, item_id: Text) -> float:
+        return self.policy.interval(item_id) * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _push(self, item_id: Text, due_at: float) -> None:
+        heapq.heappush(self._schedule, (due_at, item_id))
+        self._scheduled.add(item_id)
+
+    async def _throttle(self) -> None:
+        # Reserve the next free request slot, then wait for it
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.min_spacing
+        await asyncio.sleep(slot - now)
+
+    async def check_item(self, item_id: Text) -> None:
+        watchers = self._watchers.get(item_id)
+        if not watchers:
+            self._scheduled.discard(item_id)  # watch removed since it was scheduled
+            return
+
+        loop = asyncio.get_running_loop()
+        try:
+            async with self._semaphore:
+                await self._throttle()
+                payload = await loop.run_in_executor(None, self._fetch, item_id, watchers)
+                detected_at = time.monotonic()
+        finally:
+            self._push(item_id, time.monotonic() + self.next_interval(item_id))
+
+        if payload is not None:
+            await self.observe(item_id, payload, detected_at)
+
+    async def observe(self, item_id: Text, payload: Dict[Text, Any], detected_at: Optional[float] = None) -> None:
+        available = payload.get("items_available", 0)
+        self.history.record(item_id, available, (payload.get("pickup_interval") or {}).get("start"))
+        self.policy.set_timezone(item_id, (payload.get("store") or {}).get("store_time_zone"))
+        previous = self._last_available.get(item_id)
+        self._last_available[item_id] = available
+        if previous is None:
+            return  # first look at this item, nothing to compare against yet
+
+        # Race for the bags first, talk later
+        reserved_for = set()
+        if previous == 0 and available > 0 and self.auto_reserver.is_armed(item_id):
+            reserved_for = set(await self.auto_reserver.fire(item_id, payload, detected_at or time.monotonic()))
+
+        to_notify = [w for w in self._watchers.get(item_id, ())
+                     if previous < w.min_available <= available and w.user_id not in reserved_for]
+        if to_notify:
+            logger.info(f"Item {item_id} restocked ({previous} -> {available}), notifying {len(to_notify)} users")
+            # Watchers share the store name the first of them saved
+            event = restock_event(item_id, to_notify[0].store_name, available)
+            await self.notifications.publish(event, [w.user_id for w in to_notify])
+
+    def _fetch(self, item_id: Text, watchers: List[Watch]) -> Optional[Dict[Text, Any]]:
+        if self.coordinator.try_acquire(f"poll:{item_id}", POLL_LEASE) is None:
+            return None  # just polled by the worker that owned it before the last reload
+        # Any watcher's session can read the item; use the first one that's logged in
+        for watch in watchers:
+            client = self.manager.get_client(watch.user_id)
+            if client is None:
+                continue
+            try:
+                # Background traffic only gets what user turns leave over
+                with request_priority(Priority.BACKGROUND):
+                    payload = client.get_item(item_id)
+                self.manager.save_if_changed(watch.user_id, client)
+                # Every user with this item in their favorites gets the fresh stock for free
+                get_stock_cache().put(payload)
+                return payload
+            except RequestShedError as e:
+                logger.warning(f"Monitor fetch of {item_id} shed: {e}")
+                return None
+            except (TgtgAPIError, TgtgLoginError) as e:
+                logger.error(f"Monitor fetch of {item_id} as {watch.user_id} failed: {e}")
+                return None
+        logger.warning(f"No logged-in watcher left for item {item_id}")
+        return None
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    # Separate port from the action server's, which may run on the same host
+    start_http_server(int(os.getenv("MONITOR_METRICS_PORT", "9106")))
+    asyncio.run(StockMonitor().run_forever())
+
+
+if __name__ == "__main__":
+    main()
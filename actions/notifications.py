@@ -0,0 +1,246 @@
+"""
+Fan-out of proactive alerts (restocks) to many users at once.
+
+`NotificationDispatcher.publish(event, user_ids)`:
+- drops users already told about the same event within DEDUP_WINDOW
+- renders the message once per locale, not once per user
+- queues one delivery per user; a fixed pool of workers sends them concurrently
+  over one shared HTTP session, retrying failed pushes with backoff
+
+Messages go out through `RasaChannel` (Rasa's trigger_intent API, delivered on the
+channel set by RASA_OUTPUT_CHANNEL, i.e. the one configured in credentials.yml).
+`StubChannel` records messages locally instead, for trying the fan-out without Rasa:
+    python -m actions.notifications bench --alerts 10000
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+from collections import defaultdict
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Text, Tuple
+
+from actions.notifier import push_message
+
+if TYPE_CHECKING:
+    import aiohttp
+
+logger = logging.getLogger(__name__)
+
+MAX_WORKERS = 64
+# Deliveries waiting for a worker; publish() waits when the queue is full
+MAX_QUEUED = 20000
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 0.5
+# The same user isn't told about the same event twice within this window (seconds)
+DEDUP_WINDOW = 5 * 60
+DEFAULT_LOCALE = "en"
+
+TEMPLATES = {
+    "restock": {
+        "en": "🔔 {store_name} has {available} bags available right now!",
+    },
+    "relogin": {
+        "en": "Your TGTG session has expired. Send me a message when you have a minute to log in again.",
+    },
+}
+
+
+class NotificationEvent:
+    __slots__ = ("template", "key", "params")
+
+    def __init__(self, template: Text, key: Text, **params):
+        self.template = template
+        self.key = key          # identifies the event for dedup
+        self.params = params
+
+    def render(self, locale: Text = DEFAULT_LOCALE) -> Text:
+        templates = TEMPLATES[self.template]
+        return templates.get(locale, templates[DEFAULT_LOCALE]).format(**self.params)
+
+
+def restock_event(item_id: Text, store_name: Text, available: int) -> NotificationEvent:
+    return NotificationEvent("restock", f"restock:{item_id}", store_name=store_name, available=available)
+
+
+def relogin_event() -> NotificationEvent:
+    return NotificationEvent("relogin", "relogin")
+
+
+class Channel:
+
+    async def open(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def send(self, user_id: Text, text: Text) -> bool:
+        raise NotImplementedError
+
+
+class RasaChannel(Channel):
+
+    def __init__(self, max_connections: int = MAX_WORKERS):
+        self.max_connections = max_connections
+        self._session: Optional["aiohttp.ClientSession"] = None
+
+    async def open(self) -> None:
+        import aiohttp
+        self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.max_connections))
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def send(self, user_id: Text, text: Text) -> bool:
+        return await push_message(user_id, text, self._session)
+
+
+class StubChannel(Channel):
+    """
+    Records messages instead of sending them, with optional latency and failures.
+    """
+
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.sent: List[Tuple[Text, Text]] = []
+        self.attempts = 0
+
+    async def send(self, user_id: Text, text: Text) -> bool:
+        self.attempts += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            return False
+        self.sent.append((user_id, text))
+        return True
+
+
+class NotificationDispatcher:
+
+    def __init__(self, channel: Channel = None, max_workers: int = MAX_WORKERS,
+                 max_queued: int = MAX_QUEUED, max_attempts: int = MAX_ATTEMPTS,
+                 retry_delay: float = RETRY_DELAY, dedup_window: float = DEDUP_WINDOW,
+                 locale_of: Callable[[Text], Text] = None):
+        self.channel = channel or RasaChannel(max_workers)
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.dedup_window = dedup_window
+        self.locale_of = locale_of or (lambda user_id: DEFAULT_LOCALE)
+        self.stats = {"sent": 0, "failed": 0, "retried": 0, "deduped": 0}
+
+        self._seen: Dict[Tuple[Text, Text], float] = {}
+        self._next_prune = 0.0
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        await self.channel.open()
+        self._queue = asyncio.Queue(self.max_queued)
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.max_workers)]
+
+    async def close(self) -> None:
+        """
+        Deliver what's queued, then stop the workers.
+        """
+        if self._queue is not None:
+            await self._queue.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        await self.channel.close()
+
+    async def drain(self) -> None:
+        await self._queue.join()
+
+    async def publish(self, event: NotificationEvent, user_ids: Iterable[Text]) -> int:
+        """
+        Queue `event` for every user in `user_ids`. Returns how many deliveries were queued.
+        """
+        now = time.monotonic()
+        self._prune(now)
+        by_locale = defaultdict(list)
+        for user_id in user_ids:
+            seen_key = (user_id, event.key)
+            if self._seen.get(seen_key, 0) > now:
+                self.stats["deduped"] += 1
+                continue
+            self._seen[seen_key] = now + self.dedup_window
+            by_locale[self.locale_of(user_id)].append(user_id)
+
+        queued = 0
+        for locale, users in by_locale.items():
+            text = event.render(locale)
+            for user_id in users:
+                await self._queue.put((user_id, text))
+                queued += 1
+        return queued
+
+    def _prune(self, now: float) -> None:
+        if now < self._next_prune:
+            return
+        self._seen = {k: expires for k, expires in self._seen.items() if expires > now}
+        self._next_prune = now + self.dedup_window
+
+    async def _work(self) -> None:
+        while True:
+            user_id, text = await self._queue.get()
+            try:
+                await self._deliver(user_id, text)
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.exception(f"Notification to {user_id} crashed: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, user_id: Text, text: Text) -> None:
+        delay = self.retry_delay
+        for attempt in range(1, self.max_attempts + 1):
+            if await self.channel.send(user_id, text):
+                self.stats["sent"] += 1
+                return
+            if attempt < self.max_attempts:
+                self.stats["retried"] += 1
+                await asyncio.sleep(delay)
+                delay *= 2
+        self.stats["failed"] += 1
+        logger.error(f"Gave up notifying {user_id} after {self.max_attempts} attempts")
+
+
+async def bench(alerts: int, latency: float, failure_rate: float, workers: int) -> Dict:
+    channel = StubChannel(latency=latency, failure_rate=failure_rate)
+    dispatcher = NotificationDispatcher(channel, max_workers=workers, retry_delay=0.01)
+    await dispatcher.start()
+    started = time.monotonic()
+    await dispatcher.publish(restock_event("bench", "Bench Bakery", 5), (f"user-{i}" for i in range(alerts)))
+    await dispatcher.drain()
+    elapsed = time.monotonic() - started
+    await dispatcher.close()
+    return {**dispatcher.stats, "attempts": channel.attempts, "seconds": elapsed,
+            "per_second": alerts / elapsed if elapsed else float("inf")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Notification fan-out tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("bench", help="Fan one restock out to many users through the stub channel")
+    b.add_argument("--alerts", type=int, default=10000)
+    b.add_argument("--latency", type=float, default=0.01, help="Simulated seconds per send")
+    b.add_argument("--failure-rate", type=float, default=0.01)
+    b.add_argument("--workers", type=int, default=MAX_WORKERS)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        result = asyncio.run(bench(args.alerts, args.latency, args.failure_rate, args.workers))
+        for key, value in result.items():
+            print(f"{key:>10}: {value:.2f}" if isinstance(value, float) else f"{key:>10}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import logging
+import os
+from typing import TYPE_CHECKING, Optional, Text
+
+if TYPE_CHECKING:
+    import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Rasa server (must run with --enable-api) used to push messages outside of a user turn
+RASA_URL = os.getenv("RASA_URL", "http://localhost:5005")
+RASA_TOKEN = os.getenv("RASA_TOKEN")
+# External intent handled by action_deliver_notification (see data/rules.yml)
+NOTIFY_INTENT = "EXTERNAL_notify"
+NOTIFY_ENTITY = "notification_text"
+OUTPUT_CHANNEL = os.getenv("RASA_OUTPUT_CHANNEL", "latest")
+
+
+async def push_message(user_id: Text, text: Text,
+                       session: Optional["aiohttp.ClientSession"] = None) -> bool:
+    """
+    Send a proactive message to a user.
+    Triggers NOTIFY_INTENT on the user's conversation, and Rasa delivers the text
+    through the channel the user last wrote from (WhatsApp in production).
+    Returns True if Rasa accepted the request.
+    """
+    url = f"{RASA_URL}/conversations/{user_id}/trigger_intent"
+    params = {"output_channel": OUTPUT_CHANNEL}
+    if RASA_TOKEN:
+        params["token"] = RASA_TOKEN
+    body = {"name": NOTIFY_INTENT, "entities": {NOTIFY_ENTITY: text}}
+    # Imported on first push rather than at action server startup
+    import aiohttp
+
+    own_session = session is None
+    if own_session:
+        session = aiohttp.ClientSession()
+    try:
+        async with session.post(url, params=params, json=body) as resp:
+            if resp.status >= 400:
+                logger.error(f"Push to {user_id} failed: HTTP {resp.status} {await resp.text()}")
+                return False
+            return True
+    except aiohttp.ClientError as e:
+        logger.error(f"Push to {user_id} failed: {e}")
+        return False
+    finally:
+        if own_session:
+            await session.close()
@@ -0,0 +1,160 @@
+"""
+Follows freshly created orders until TGTG settles them.
+
+Each reservation is an asyncio task on the action server's loop: it sleeps with
+exponential backoff between `get_order_status` calls (run in the default executor
+only for the duration of the HTTP call), stops on a terminal state or at the
+deadline, and pushes the outcome to the user. Actions running in worker threads
+hand the task over to the tracker's loop (see `OrderTracker.track`).
+"""
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional, Text, Union
+
+from actions.client_manager import tgtg_manager
+from actions.notifier import push_message
+from actions.rate_limiter import Priority, request_priority
+
+logger = logging.getLogger(__name__)
+
+INITIAL_DELAY = 1.0
+MAX_DELAY = 15.0
+BACKOFF_FACTOR = 2.0
+DEADLINE = 120.0
+
+# Terminal order states -> did the reservation succeed?
+TERMINAL_STATES = {
+    "RESERVED": True,
+    "CANCELLED": False,
+    "EXPIRED": False,
+    "FAILED": False,
+    "ABORTED": False,
+}
+TIMEOUT_STATE = "TIMEOUT"
+
+
+class OrderOutcome:
+    __slots__ = ("order_id", "state", "elapsed")
+
+    def __init__(self, order_id: Text, state: Text, elapsed: float):
+        self.order_id = order_id
+        self.state = state
+        self.elapsed = elapsed
+
+    @property
+    def succeeded(self) -> bool:
+        return TERMINAL_STATES.get(self.state, False)
+
+
+class OrderTracker:
+
+    def __init__(self, initial_delay: float = INITIAL_DELAY, max_delay: float = MAX_DELAY,
+                 deadline: float = DEADLINE, notify: Optional[Callable] = push_message,
+                 loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.notify = notify
+        # Where orders tracked from threads without a running loop are followed;
+        # a loop of the tracker's own is started on first need if None
+        self.loop = loop
+        self._tasks: Dict[Text, asyncio.Task] = {}
+        self._lock = threading.Lock()
+
+    def track(self, user_id: Text, order_id: Text, client,
+              label: Text = "your bag") -> Union[asyncio.Task, concurrent.futures.Future]:
+        """
+        Start watching an order in the background. From a running loop (and `self.loop`
+        if set) it's a task on that loop; from any other thread, e.g. an action run in
+        an executor, it's handed to `self.loop` and a concurrent Future is returned.
+        Tracking the same order twice doesn't start a second task.
+        """
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is not None and (self.loop is None or running is self.loop):
+            return self._start(user_id, order_id, client, label)
+        return asyncio.run_coroutine_threadsafe(self._follow(user_id, order_id, client, label), self._get_loop())
+
+    def _start(self, user_id: Text, order_id: Text, client, label: Text) -> asyncio.Task:
+        # On the loop the task runs on
+        with self._lock:
+            task = self._tasks.get(order_id)
+            if task is not None and not task.done():
+                return task
+            task = asyncio.get_running_loop().create_task(self._track(user_id, order_id, client, label))
+            self._tasks[order_id] = task
+        task.add_done_callback(lambda _: self._forget(order_id))
+        return task
+
+    async def _follow(self, user_id: Text, order_id: Text, client, label: Text) -> OrderOutcome:
+        return await self._start(user_id, order_id, client, label)
+
+    def _forget(self, order_id: Text) -> None:
+        with self._lock:
+            self._tasks.pop(order_id, None)
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self.loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="order-tracker", daemon=True).start()
+                self.loop = loop
+            return self.loop
+
+    @property
+    def active(self) -> int:
+        return len(self._tasks)
+
+    async def _track(self, user_id: Text, order_id: Text, client, label: Text) -> OrderOutcome:
+        outcome = await self.wait(order_id, client)
+        # The status polls may have refreshed the user's tokens
+        if hasattr(client, "dirty"):
+            tgtg_manager.save_if_changed(user_id, client)
+        if outcome.succeeded:
+            text = f"🎉 {label} is reserved! Please complete payment in the TGTG app."
+        elif outcome.state == TIMEOUT_STATE:
+            text = f"⚠️ TGTG hasn't confirmed {label} yet. Please check the TGTG app."
+        else:
+            text = f"⚠️ The reservation for {label} didn't go through ({outcome.state.lower()})."
+        if self.notify is not None:
+            await self.notify(user_id, text)
+        return outcome
+
+    async def wait(self, order_id: Text, client) -> OrderOutcome:
+        """
+        Poll until the order reaches a terminal state or the deadline passes.
+        """
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        delay = self.initial_delay
+        state = None
+        while True:
+            try:
+                status = await loop.run_in_executor(None, self._status, client, order_id)
+                state = status.get("state")
+            except Exception as e:
+                # Transient errors just cost one poll; the deadline still applies
+                logger.warning(f"Status check for order {order_id} failed: {e}")
+
+            elapsed = time.monotonic() - started
+            if state in TERMINAL_STATES:
+                return OrderOutcome(order_id, state, elapsed)
+            if elapsed + delay > self.deadline:
+                logger.error(f"Order {order_id} not settled after {elapsed:.0f}s (last state: {state})")
+                return OrderOutcome(order_id, TIMEOUT_STATE, elapsed)
+
+            await asyncio.sleep(delay)
+            delay = min(delay * BACKOFF_FACTOR, self.max_delay)
+
+    @staticmethod
+    def _status(client, order_id: Text) -> Dict:
+        with request_priority(Priority.CHECKOUT):
+            return client.get_order_status(order_id)
+
+
+order_tracker = OrderTracker()
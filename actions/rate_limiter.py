@@ -0,0 +1,293 @@
+"""
+Central scheduler for every request we send to TGTG.
+
+All clients (actions, monitor, login, utils scripts) go through RateLimitedTgtgClient,
+whose HTTP session asks the process-wide `request_scheduler` for a slot before each
+request the library sends, token refreshes, login polls and captcha retries included:
+- a token bucket per user, then a global one shared by everybody
+- priority classes: CHECKOUT > INTERACTIVE > BACKGROUND; background requests
+  can't drain the last tokens of the global bucket, so user turns stay fast
+- exponential backoff for everyone after a 429/403 (rate limit / captcha)
+- requests still waiting after their deadline are shed with RequestShedError
+
+Set the priority of the calls made in a block with:
+    with request_priority(Priority.CHECKOUT):
+        client.create_order(item_id, 1)
+
+Identical read calls made at the same time are sent once (see actions/single_flight.py).
+Set TGTG_RECORD_DIR to record the traffic for offline replays (see actions/recorder.py).
+"""
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Dict, Optional, Text
+
+import requests
+from tgtg import TgtgClient
+
+from actions.metrics import record_upstream_call
+from actions.recorder import get_recorder
+from actions.single_flight import flights
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_RATE = 5.0          # requests per second, all users together
+GLOBAL_BURST = 10
+USER_RATE = 1.0            # requests per second for a single user
+USER_BURST = 5
+# Share of the global bucket only CHECKOUT / INTERACTIVE requests may use
+INTERACTIVE_RESERVE = 0.3
+# Backoff after 429/403: BACKOFF_BASE * 2^(strikes-1), capped
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 120.0
+BACKOFF_STATUSES = (429, 403)
+# Send every request to another TGTG API, e.g. the local stand-in of the benchmarks
+# (python -m benchmarks.fake_tgtg). Unset in production.
+TGTG_API_URL = os.getenv("TGTG_API_URL")
+# Used instead of looking up the current app version on the Play Store when TGTG_API_URL is set
+OFFLINE_USER_AGENT = "TGTG/24.1.0 Dalvik/2.1.0 (Linux; U; Android 12; Pixel 6 Build/SP1A.210812.016)"
+
+
+class Priority(IntEnum):
+    CHECKOUT = 0
+    INTERACTIVE = 1
+    BACKGROUND = 2
+
+
+# How long a request may wait for a slot before being shed (seconds)
+DEADLINES = {
+    Priority.CHECKOUT: 15.0,
+    Priority.INTERACTIVE: 5.0,
+    Priority.BACKGROUND: 60.0,
+}
+
+_current_priority: ContextVar = ContextVar("tgtg_request_priority", default=Priority.INTERACTIVE)
+
+
+@contextmanager
+def request_priority(priority: Priority):
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class RequestShedError(Exception):
+    """
+    Raised when a request couldn't get a slot before its deadline.
+    """
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def refund(self) -> None:
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def try_take(self, now: float, keep: float = 0.0) -> bool:
+        """
+        Take one token if that leaves at least `keep` tokens in the bucket.
+        """
+        self._refill(now)
+        if self.tokens - 1 >= keep:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self, now: float, keep: float = 0.0) -> float:
+        self._refill(now)
+        missing = keep + 1 - self.tokens
+        return max(0.0, missing / self.rate)
+
+
+class RequestScheduler:
+    """
+    Thread-safe, and waiting is done with a Condition: `acquire` blocks its thread.
+    Callers are never on an event loop: TGTG actions run their bodies in
+    `actions.actions.action_executor`, and the monitor, order tracker and auto-reserve
+    make their calls through run_in_executor.
+    """
+
+    def __init__(self, global_rate: float = GLOBAL_RATE, global_burst: float = GLOBAL_BURST,
+                 user_rate: float = USER_RATE, user_burst: float = USER_BURST):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self._global = TokenBucket(global_rate, global_burst)
+        self._users: Dict[Text, TokenBucket] = {}
+        self._cond = threading.Condition()
+        self._waiting = []                # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._blocked_until = 0.0
+        self._strikes = 0
+
+    def acquire(self, user_id: Optional[Text] = None, priority: Optional[Priority] = None,
+                deadline: Optional[float] = None) -> None:
+        """
+        Block until the request may be sent.
+        Raises RequestShedError if that doesn't happen before the deadline.
+        """
+        if priority is None:
+            priority = _current_priority.get()
+        expires = time.monotonic() + (deadline if deadline is not None else DEADLINES[priority])
+        keep = self._global.capacity * INTERACTIVE_RESERVE if priority == Priority.BACKGROUND else 0.0
+
+        with self._cond:
+            # 1. The user's own bucket: waiting here doesn't hold up anybody else
+            bucket = None
+            if user_id is not None:
+                bucket = self._users.get(user_id)
+                if bucket is None:
+                    bucket = self._users[user_id] = TokenBucket(self.user_rate, self.user_burst)
+                while not bucket.try_take(time.monotonic()):
+                    self._wait(expires, bucket.wait_time(time.monotonic()), priority)
+
+            # 2. The global queue; a request shed here gives its user token back
+            try:
+                self._acquire_global(expires, priority, keep)
+            except RequestShedError:
+                if bucket is not None:
+                    bucket.refund()
+                raise
+
+    def _acquire_global(self, expires: float, priority: Priority, keep: float) -> None:
+        # Served by priority then arrival. The caller holds the condition.
+        entry = (priority, next(self._seq))
+        heapq.heappush(self._waiting, entry)
+        try:
+            while True:
+                now = time.monotonic()
+                if self._waiting[0] == entry and now >= self._blocked_until \
+                        and self._global.try_take(now, keep):
+                    return
+                if self._waiting[0] == entry:
+                    timeout = max(self._blocked_until - now, self._global.wait_time(now, keep))
+                else:
+                    timeout = None  # woken up when the head is served
+                self._wait(expires, timeout, priority)
+        finally:
+            self._waiting.remove(entry)
+            heapq.heapify(self._waiting)
+            self._cond.notify_all()
+
+    def _wait(self, expires: float, timeout: Optional[float], priority: Priority) -> None:
+        remaining = expires - time.monotonic()
+        if remaining <= 0:
+            raise RequestShedError(f"{priority.name} request shed after waiting for a TGTG slot")
+        self._cond.wait(remaining if timeout is None else min(remaining, max(timeout, 0.001)))
+
+    def report(self, status_code: Optional[int]) -> None:
+        """
+        Feed back the upstream answer: 429/403 start (or extend) the backoff, anything else resets it.
+        """
+        with self._cond:
+            if status_code in BACKOFF_STATUSES:
+                self._strikes += 1
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (self._strikes - 1))
+                self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+                logger.warning(f"TGTG answered {status_code}, backing off all requests for {delay:.0f}s")
+            elif self._strikes:
+                self._strikes = 0
+            self._cond.notify_all()
+
+
+request_scheduler = RequestScheduler()
+
+
+class ScheduledSession(requests.Session):
+    """
+    The client's requests session. The library sends everything through it, also
+    from inside its own helpers (token refresh, login polling, captcha retries),
+    so scheduling here covers every request and the backoff sees every status.
+    """
+
+    def __init__(self, client: "RateLimitedTgtgClient"):
+        super().__init__()
+        self.client = client
+
+    def request(self, method, url, *args, **kwargs):
+        return self.client._scheduled(super().request, method, url, *args, **kwargs)
+
+
+class RateLimitedTgtgClient(TgtgClient):
+    """
+    TgtgClient whose HTTP calls all go through `request_scheduler`.
+    `user_id` selects the per-user bucket (None for scripts / shared clients).
+    """
+    user_id: Optional[Text] = None
+
+    def __init__(self, *args, **kwargs):
+        if TGTG_API_URL:
+            kwargs.setdefault("url", TGTG_API_URL)
+            kwargs.setdefault("user_agent", OFFLINE_USER_AGENT)
+        super().__init__(*args, **kwargs)
+        session = ScheduledSession(self)
+        session.headers = self.session.headers
+        self.session.close()
+        self.session = session
+
+    # Reads coalesced with identical calls in flight: account data per user,
+    # item data across users (any session sees the same item, but a failure may be
+    # the leader's own session's, so only results are shared)
+    def get_items(self, *args, **kwargs):
+        return self._coalesced(("get_items", self._owner()), super().get_items, *args, **kwargs)
+
+    def get_item(self, *args, **kwargs):
+        return self._coalesced(("get_item",), super().get_item, *args, share_errors=False, **kwargs)
+
+    def get_order_status(self, *args, **kwargs):
+        return self._coalesced(("get_order_status", self._owner()), super().get_order_status, *args, **kwargs)
+
+    if hasattr(TgtgClient, "get_favorites"):
+        def get_favorites(self, *args, **kwargs):
+            return self._coalesced(("get_favorites", self._owner()), super().get_favorites, *args, **kwargs)
+
+    def _owner(self):
+        # Scripts' clients have no user_id; they only coalesce with themselves
+        return self.user_id if self.user_id is not None else id(self)
+
+    @staticmethod
+    def _coalesced(key, call, *args, share_errors=True, **kwargs):
+        # repr() since some arguments are lists (item_categories, diet_categories...)
+        key = key + (repr(args), repr(sorted(kwargs.items())))
+        return flights.do(key, lambda: call(*args, **kwargs), _current_priority.get(), share_errors)
+
+    def _scheduled(self, call, method, url, *args, **kwargs):
+        request_scheduler.acquire(self.user_id)
+        # Relative to the API root, like the library's endpoint constants
+        path = url[len(self.base_url):] if url.startswith(self.base_url) else url
+        started = time.monotonic()
+        try:
+            response = call(method, url, *args, **kwargs)
+        except requests.RequestException:
+            # No answer: nothing for the backoff, but the call still counts
+            record_upstream_call(path, None)
+            self._record(path, kwargs, None, None, started)
+            raise
+        status = getattr(response, "status_code", None)
+        request_scheduler.report(status)
+        record_upstream_call(path, status)
+        self._record(path, kwargs, status, getattr(response, "content", None), started)
+        return response
+
+    def _record(self, path, kwargs, status, body, started) -> None:
+        recorder = get_recorder()
+        if recorder is not None:
+            recorder.record(path, kwargs.get("json"), status, body, time.monotonic() - started,
+                            self.user_id, _current_priority.get().name)
@@ -0,0 +1,222 @@
+"""
+Recording of upstream TGTG traffic, for replaying real workloads offline
+(python -m benchmarks.replay).
+
+Off unless TGTG_RECORD_DIR is set. Then every request sent by RateLimitedTgtgClient
+is written as one JSON line to gzip segments in that directory:
+    {"ts": ..., "user": "<hash>", "priority": "INTERACTIVE", "path": "item/v8/",
+     "request": {...}, "status": 200, "elapsed": 0.21, "response": {...}}
+
+- The action path only queues the raw response; parsing, redaction, compression
+  and I/O happen on a writer thread. When the writer falls behind, records are
+  dropped (tgtg_recorder_dropped_total) rather than slowing a turn down.
+- Tokens, cookies, emails and the like are replaced by "[redacted]", and user ids
+  are replaced by an HMAC keyed with TGTG_RECORD_KEY, so segments can be copied off
+  the server: the key never goes with them, and without it the hash of a phone
+  number can't be brute-forced. Unset, a random key is drawn per process (users
+  then can't be followed across processes or restarts).
+- A segment is closed after SEGMENT_BYTES (uncompressed) or SEGMENT_SECONDS, and
+  renamed from .part to .jsonl.gz; only the newest MAX_SEGMENTS are kept.
+"""
+import atexit
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Text
+
+from actions.metrics import inc
+
+logger = logging.getLogger(__name__)
+
+RECORD_DIR = os.getenv("TGTG_RECORD_DIR")
+# Secret of the user pseudonyms; keep it out of the recording directory
+RECORD_KEY = os.getenv("TGTG_RECORD_KEY")
+SEGMENT_BYTES = 64 * 1024 * 1024
+SEGMENT_SECONDS = 60 * 60
+MAX_SEGMENTS = 48
+# Records waiting for the writer thread; more are dropped
+MAX_QUEUED = 10000
+SEGMENT_SUFFIX = ".jsonl.gz"
+PART_SUFFIX = ".part"
+REDACTED = "[redacted]"
+# Keys whose values never leave the server, wherever they appear in a request or response
+REDACTED_KEYS = frozenset((
+    "access_token", "refresh_token", "cookie", "email", "polling_id",
+    "user_id", "phone_number", "payment_method", "authorization",
+))
+
+
+def redact(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: REDACTED if k.lower() in REDACTED_KEYS else redact(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [redact(v) for v in value]
+    return value
+
+
+def hash_user(user_id: Optional[Text], key: bytes) -> Optional[Text]:
+    """
+    Stable pseudonym under `key`: replays keep per-user behaviour without the phone number.
+    """
+    if user_id is None:
+        return None
+    return hmac.new(key, user_id.encode(), hashlib.sha256).hexdigest()[:16]
+
+
+def _decode(body: Any) -> Any:
+    if isinstance(body, (bytes, bytearray)):
+        body = body.decode("utf-8", "replace")
+    if isinstance(body, str):
+        try:
+            return json.loads(body) if body else None
+        except ValueError:
+            return body
+    return body
+
+
+class TrafficRecorder:
+
+    def __init__(self, directory: Text, segment_bytes: int = SEGMENT_BYTES,
+                 segment_seconds: float = SEGMENT_SECONDS, max_segments: int = MAX_SEGMENTS,
+                 max_queued: int = MAX_QUEUED, key: Optional[bytes] = None):
+        self.directory = directory
+        if key is None:
+            logger.warning("TGTG_RECORD_KEY isn't set: user pseudonyms only hold within this process")
+            key = secrets.token_bytes(32)
+        self._key = key
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.max_segments = max_segments
+        self._queue: "queue.Queue" = queue.Queue(max_queued)
+        self._file = None
+        self._path: Optional[Text] = None
+        self._written = 0
+        self._opened_at = 0.0
+        self._seq = 0
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="tgtg-recorder", daemon=True)
+        self._thread.start()
+
+    def record(self, path: Text, request: Any, status: Optional[int], body: Any, elapsed: float,
+               user_id: Optional[Text] = None, priority: Optional[Text] = None) -> None:
+        """
+        Queue one request/response. Never blocks.
+        """
+        try:
+            self._queue.put_nowait((time.time(), path, request, status, body, elapsed, user_id, priority))
+        except queue.Full:
+            inc("tgtg_recorder_dropped_total")
+
+    def close(self) -> None:
+        """
+        Write what's queued and close the current segment.
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                entry = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                entry = ()
+            if entry is None:
+                self._close_segment()
+                return
+            if self._file is not None and time.time() - self._opened_at >= self.segment_seconds:
+                self._close_segment()
+            if not entry:
+                continue
+            try:
+                self._write(entry)
+            except Exception as e:
+                inc("tgtg_recorder_dropped_total")
+                logger.error(f"Couldn't record TGTG traffic: {e}")
+
+    def _write(self, entry) -> None:
+        ts, path, request, status, body, elapsed, user_id, priority = entry
+        line = json.dumps({
+            "ts": ts,
+            "user": hash_user(user_id, self._key),
+            "priority": priority,
+            "path": path,
+            "request": redact(request),
+            "status": status,
+            "elapsed": round(elapsed, 4),
+            "response": redact(_decode(body)),
+        }, separators=(",", ":")).encode() + b"\n"
+        if self._file is None:
+            self._open_segment()
+        self._file.write(line)
+        self._written += len(line)
+        inc("tgtg_recorder_records_total")
+        if self._written >= self.segment_bytes:
+            self._close_segment()
+
+    def _open_segment(self) -> None:
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        self._seq += 1
+        name = f"tgtg-{stamp}-{os.getpid()}-{self._seq:04d}{SEGMENT_SUFFIX}"
+        self._path = os.path.join(self.directory, name)
+        self._file = gzip.open(self._path + PART_SUFFIX, "wb")
+        self._written = 0
+        self._opened_at = time.time()
+
+    def _close_segment(self) -> None:
+        if self._file is None:
+            return
+        self._file.close()
+        os.replace(self._path + PART_SUFFIX, self._path)
+        self._file = None
+        for old in segments(self.directory)[:-self.max_segments]:
+            os.unlink(old)
+
+
+_recorder: Optional[TrafficRecorder] = None
+_recorder_lock = threading.Lock()
+
+
+def get_recorder() -> Optional[TrafficRecorder]:
+    """
+    The process-wide recorder, or None when TGTG_RECORD_DIR isn't set.
+    """
+    global _recorder
+    if RECORD_DIR is None:
+        return None
+    if _recorder is None:
+        with _recorder_lock:
+            if _recorder is None:
+                _recorder = TrafficRecorder(RECORD_DIR, key=RECORD_KEY.encode() if RECORD_KEY else None)
+                atexit.register(_recorder.close)
+    return _recorder
+
+
+def segments(directory: Text) -> List[Text]:
+    """
+    Closed segments in `directory`, oldest first.
+    """
+    names = sorted(n for n in os.listdir(directory) if n.endswith(SEGMENT_SUFFIX))
+    return [os.path.join(directory, n) for n in names]
+
+
+def iter_records(paths: Iterable[Text]) -> Iterator[Dict[Text, Any]]:
+    """
+    Stream the records of the segments at `paths` (files or directories), in order.
+    One line in memory at a time, whatever the size of the recording.
+    """
+    for path in paths:
+        files = segments(path) if os.path.isdir(path) else [path]
+        for file in files:
+            with gzip.open(file, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
@@ -0,0 +1,260 @@
+"""
+Restock history and adaptive polling for the stock monitor.
+
+Every check the monitor makes is stored as one compact row (item, time, stock,
+pickup start). From the 0 -> >0 transitions we learn, per item, at which times of
+day it usually restocks, and poll densely only around those windows. Times of day
+are the store's local time, so the windows don't move at DST changes.
+
+Compare against fixed-interval polling with:
+    python -m actions.restock_history report --days 14
+"""
+import argparse
+import statistics
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, tzinfo
+from typing import Dict, Iterator, List, Optional, Text, Tuple
+
+from actions.credential_store import DEFAULT_DB_PATH, SQLiteStore
+from actions.items_summary import DEFAULT_TZ, get_tz
+
+# Size of a time-of-day bucket (minutes)
+BUCKET_MINUTES = 15
+BUCKETS_PER_DAY = 24 * 60 // BUCKET_MINUTES
+# Only restocks from the last N days are used to learn the windows
+HISTORY_DAYS = 28
+# Below this many restocks we don't trust the pattern and poll at the base interval
+MIN_RESTOCKS = 3
+# A bucket is a "drop window" if it holds at least this share of the item's restocks
+WINDOW_SHARE = 0.15
+# Start polling densely this long before a predicted window (seconds)
+LEAD_TIME = 10 * 60
+DENSE_INTERVAL = 2 * 60
+MAX_INTERVAL = 2 * 60 * 60
+# Models are rebuilt from the DB at most this often per item (seconds)
+MODEL_TTL = 60 * 60
+# Detection counts as a "hit" if the restock happened at most this long before we saw it
+HIT_TARGET = 5 * 60
+
+
+def bucket_of(ts: float, tz: Optional[tzinfo] = None) -> int:
+    dt = datetime.fromtimestamp(ts, tz=tz or get_tz())
+    return (dt.hour * 60 + dt.minute) // BUCKET_MINUTES
+
+
+def store_tz(name: Optional[Text]) -> tzinfo:
+    """
+    The zone of a payload's store_time_zone, the default one if missing or unknown.
+    """
+    try:
+        return get_tz(name or DEFAULT_TZ)
+    except Exception:
+        return get_tz()
+
+
+def parse_iso(value: Optional[Text]) -> Optional[int]:
+    if not value:
+        return None
+    return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp())
+
+
+class HistoryStore(SQLiteStore):
+    """
+    Time series of monitor observations.
+    Rows are buffered in memory and written in one transaction by `flush`.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS observations ("
+        " item_id TEXT NOT NULL,"
+        " observed_at INTEGER NOT NULL,"
+        " items_available INTEGER NOT NULL,"
+        " pickup_start INTEGER,"
+        " PRIMARY KEY (item_id, observed_at)) WITHOUT ROWID",
+    )
+
+    def __init__(self, path: Text = DEFAULT_DB_PATH):
+        super().__init__(path)
+        self._buffer: List[Tuple] = []
+
+    def record(self, item_id: Text, items_available: int, pickup_start: Optional[Text] = None,
+               observed_at: Optional[float] = None) -> None:
+        self._buffer.append((str(item_id), int(observed_at or time.time()),
+                             int(items_available), parse_iso(pickup_start)))
+
+    def flush(self) -> None:
+        rows, self._buffer = self._buffer, []
+        if rows:
+            with self._conn() as conn:
+                conn.executemany("INSERT OR REPLACE INTO observations VALUES (?, ?, ?, ?)", rows)
+
+    def latest(self) -> Dict[Text, int]:
+        """
+        Last recorded items_available of every item.
+        """
+        rows = self._conn().execute(
+            "SELECT o.item_id, o.items_available FROM observations o "
+            "JOIN (SELECT item_id, MAX(observed_at) AS observed_at FROM observations GROUP BY item_id) m "
+            "ON o.item_id = m.item_id AND o.observed_at = m.observed_at")
+        return dict(rows)
+
+    def series(self, item_id: Optional[Text] = None, since: float = 0) -> Iterator[Tuple[Text, int, int]]:
+        """
+        (item_id, observed_at, items_available) ordered by item then time.
+        """
+        if item_id is None:
+            rows = self._conn().execute(
+                "SELECT item_id, observed_at, items_available FROM observations "
+                "WHERE observed_at >= ? ORDER BY item_id, observed_at", (int(since),))
+        else:
+            rows = self._conn().execute(
+                "SELECT item_id, observed_at, items_available FROM observations "
+                "WHERE item_id = ? AND observed_at >= ? ORDER BY observed_at", (str(item_id), int(since)))
+        yield from rows
+
+
+def restocks(series) -> Iterator[Tuple[Text, int, int]]:
+    """
+    (item_id, last_empty_at, first_stocked_at) for every 0 -> >0 transition.
+    The restock happened somewhere in between.
+    """
+    prev_item, prev_ts, prev_available = None, None, None
+    for item_id, ts, available in series:
+        if item_id == prev_item and prev_available == 0 and available > 0:
+            yield item_id, prev_ts, ts
+        prev_item, prev_ts, prev_available = item_id, ts, available
+
+
+class RestockModel:
+    """
+    Time-of-day buckets (store local time) in which one item tends to restock.
+    """
+    __slots__ = ("windows", "restock_count", "built_at", "tz")
+
+    def __init__(self, transitions: List[Tuple[Text, int, int]], tz: Optional[tzinfo] = None):
+        self.tz = tz or get_tz()
+        counts = Counter(bucket_of((empty_at + stocked_at) / 2, self.tz) for _, empty_at, stocked_at in transitions)
+        self.restock_count = len(transitions)
+        self.windows = sorted(b for b, c in counts.items() if c >= WINDOW_SHARE * self.restock_count)
+        self.built_at = time.monotonic()
+
+    @property
+    def trusted(self) -> bool:
+        return self.restock_count >= MIN_RESTOCKS and bool(self.windows)
+
+    def seconds_until_window(self, now: float) -> float:
+        """
+        Time until the next predicted window starts (0 if we're in one,
+        or in the bucket right after one, for late restocks).
+        """
+        local = datetime.fromtimestamp(now, tz=self.tz)
+        current = bucket_of(now, self.tz)
+        into_bucket = (local.minute % BUCKET_MINUTES) * 60 + local.second + local.microsecond / 1e6
+        best = None
+        for b in self.windows:
+            ahead = (b - current) % BUCKETS_PER_DAY
+            in_window = ahead in (0, BUCKETS_PER_DAY - 1)
+            wait = 0.0 if in_window else ahead * BUCKET_MINUTES * 60 - into_bucket
+            best = wait if best is None else min(best, wait)
+        return best
+
+
+class AdaptivePolicy:
+    """
+    Picks the next poll interval of an item from its restock model:
+    dense around predicted drops, backing off (up to MAX_INTERVAL) elsewhere,
+    and the monitor's base interval when there's not enough history yet.
+    """
+
+    def __init__(self, history: HistoryStore, base_interval: float):
+        self.history = history
+        self.base_interval = base_interval
+        self._models: Dict[Text, RestockModel] = {}
+        self._timezones: Dict[Text, Text] = {}
+
+    def set_timezone(self, item_id: Text, name: Optional[Text]) -> None:
+        """
+        Record the store_time_zone of the item's payload; the model is rebuilt if it changed.
+        """
+        if name and self._timezones.get(item_id) != name:
+            self._timezones[item_id] = name
+            self._models.pop(item_id, None)
+
+    def forget(self, item_id: Text) -> None:
+        self._models.pop(item_id, None)
+        self._timezones.pop(item_id, None)
+
+    def model(self, item_id: Text) -> RestockModel:
+        model = self._models.get(item_id)
+        if model is None or time.monotonic() - model.built_at > MODEL_TTL:
+            since = time.time() - HISTORY_DAYS * 86400
+            model = RestockModel(list(restocks(self.history.series(item_id, since))),
+                                 store_tz(self._timezones.get(item_id)))
+            self._models[item_id] = model
+        return model
+
+    def interval(self, item_id: Text, now: Optional[float] = None) -> float:
+        model = self.model(item_id)
+        if not model.trusted:
+            return self.base_interval
+        wait = model.seconds_until_window(now or time.time()) - LEAD_TIME
+        if wait <= 0:
+            return DENSE_INTERVAL
+        return min(max(wait, DENSE_INTERVAL), MAX_INTERVAL)
+
+
+def report(history: HistoryStore, days: float, fixed_interval: float) -> Dict[Text, float]:
+    """
+    Compare what the monitor actually did over the last `days` with fixed-interval polling.
+    - polls / restocks: what we observed
+    - hit_rate: share of restocks seen within HIT_TARGET of happening
+    - fixed_*: the same numbers for polling every `fixed_interval` seconds
+    """
+    since = time.time() - days * 86400
+    polls = 0
+    spans = defaultdict(lambda: [None, None])
+    detection_windows = []
+    prev_item, prev_ts, prev_available = None, None, None
+    for item_id, ts, available in history.series(since=since):
+        polls += 1
+        span = spans[item_id]
+        span[0] = ts if span[0] is None else span[0]
+        span[1] = ts
+        if item_id == prev_item and prev_available == 0 and available > 0:
+            detection_windows.append(ts - prev_ts)
+        prev_item, prev_ts, prev_available = item_id, ts, available
+
+    fixed_polls = sum((end - start) / fixed_interval + 1 for start, end in spans.values())
+    hits = sum(1 for w in detection_windows if w <= HIT_TARGET)
+    restock_count = len(detection_windows)
+    return {
+        "items": len(spans),
+        "polls": polls,
+        "restocks": restock_count,
+        "hit_rate": hits / restock_count if restock_count else 0.0,
+        "median_detection_window_s": statistics.median(detection_windows) if detection_windows else 0.0,
+        "fixed_polls": round(fixed_polls),
+        # Worst-case delay of fixed polling is the interval itself
+        "fixed_hit_rate": min(1.0, HIT_TARGET / fixed_interval),
+        "calls_saved": round(fixed_polls) - polls,
+    }
+
+
+def main():
+    from actions.monitor import POLL_INTERVAL
+
+    parser = argparse.ArgumentParser(description="Restock history tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    r = sub.add_parser("report", help="Adaptive vs fixed-interval polling stats")
+    r.add_argument("--days", type=float, default=7)
+    r.add_argument("--fixed-interval", type=float, default=POLL_INTERVAL)
+    args = parser.parse_args()
+
+    if args.command == "report":
+        for key, value in report(HistoryStore(), args.days, args.fixed_interval).items():
+            print(f"{key:>28}: {value:.2f}" if isinstance(value, float) else f"{key:>28}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Single-flight coalescing of identical TGTG calls.
+
+When the same call is already in flight (a user sending three messages in a
+row, or many users opening the same store), later callers wait for that call
+and get its result instead of sending their own request. Nothing is cached:
+a flight is forgotten as soon as it lands, so a result is never older than
+the call each waiter would have made itself.
+
+Keys are built by RateLimitedTgtgClient:
+- per user for account data: ("get_items", user_id, args), ("get_order_status", user_id, order_id), ...
+- shared for item data any session can read: ("get_item", item_id). Only results are
+  shared there: an error of the leader (say its session expired) is its own, and
+  the other callers then make their own call (`share_errors=False`).
+
+A caller only joins a flight of the same or a more urgent priority, so a user
+turn never ends up waiting behind a background request's longer deadline.
+Waiters share the result object: treat it as read-only.
+Waiting blocks the thread: callers are worker threads, never an event loop
+(TGTG actions run in actions.actions.action_executor).
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from actions.metrics import inc
+
+
+class _Flight:
+    __slots__ = ("priority", "done", "result", "error")
+
+    def __init__(self, priority: int):
+        self.priority = priority
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Thread-safe: actions run on the action server's threads and the monitor
+    fetches in executor threads.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, call: Callable[[], Any], priority: int = 0, share_errors: bool = True) -> Any:
+        """
+        Run `call`, or wait for the identical call already in flight under `key`.
+        Exceptions of the call are raised to every waiter, or with `share_errors=False`
+        each waiter runs `call` itself instead.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and flight.priority <= priority:
+                joined = True
+            else:
+                # Nothing to join, or only a less urgent flight: this caller leads a new one
+                flight = self._flights[key] = _Flight(priority)
+                joined = False
+
+        if joined:
+            inc("tgtg_single_flight_total", result="joined")
+            flight.done.wait()
+            if flight.error is None:
+                return flight.result
+            if share_errors:
+                raise flight.error
+            inc("tgtg_single_flight_total", result="retried")
+            return call()
+
+        inc("tgtg_single_flight_total", result="leader")
+        try:
+            flight.result = call()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                # A more urgent caller may have replaced the flight under this key
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.done.set()
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+
+# Process-wide: coalescing only helps if every client goes through the same group
+flights = SingleFlight()
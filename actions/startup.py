@@ -0,0 +1,139 @@
+"""
+Action server warm-up and readiness.
+
+Importing the actions does no I/O: stores open the DB on first use, credentials are
+read per user when their client is first needed, the stock cache reads
+endpoints.yml on first use, and no port is opened. So the server listens as soon
+as Python has imported the modules, whatever the number of users, and other
+processes (benchmarks, the routed_rest channel, tests) can import them too.
+
+Start the action server through this module instead of `rasa run actions`:
+
+    python -m actions.startup --port 5055     # any `rasa run actions` argument
+
+`begin()` then serves the metrics port and the calendar feeds, has the keyword
+router's gazetteer follow the favorites cache, and warms the shared resources in a
+background thread while the metrics port reports the progress:
+
+    curl localhost:9105/ready     # 503 while warming up, 200 once warm
+    curl localhost:9105/health    # 200 as long as the process is up
+
+Point the orchestrator's readiness check at /ready. During a rolling deploy, Rasa
+then keeps calling the old replicas until the new ones are warm, so no webhook
+turn lands on a cold action server.
+"""
+import json
+import logging
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Text, Tuple
+
+from actions.calendar_feed import start_server as start_calendar_server
+from actions.metrics import add_endpoint, start_http_server
+
+logger = logging.getLogger(__name__)
+
+
+def _open_credentials():
+    from actions.client_manager import tgtg_manager
+    open_store = getattr(tgtg_manager.store, "open", None)
+    if open_store is not None:
+        open_store()
+
+
+def _open_prefs():
+    from actions.user_prefs import prefs_store
+    prefs_store.open()
+
+
+def _load_stock_cache():
+    from actions.stock_cache import get_stock_cache
+    get_stock_cache()
+
+
+def _load_timezones():
+    from actions.formatting import formatter_for
+    from actions.user_prefs import UserPrefs
+    formatter_for(UserPrefs())
+
+
+# Run in order by `warm_up`; each one only fills caches, none is required to serve a turn
+WARM_UP_STEPS: List[Tuple[Text, Callable[[], None]]] = [
+    ("credential_store", _open_credentials),
+    ("user_prefs", _open_prefs),
+    ("stock_cache", _load_stock_cache),
+    ("timezones", _load_timezones),
+]
+
+
+class Readiness:
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.steps: Dict[Text, Optional[Text]] = {name: None for name, _ in WARM_UP_STEPS}
+        self.ready_after: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_after is not None
+
+    def probe(self) -> Tuple[int, Text, Text]:
+        body = {
+            "ready": self.ready,
+            "ready_after_s": round(self.ready_after, 3) if self.ready else None,
+            "steps": {name: state or "pending" for name, state in self.steps.items()},
+        }
+        return 200 if self.ready else 503, "application/json", json.dumps(body)
+
+
+readiness = Readiness()
+_begun = False
+_begin_lock = threading.Lock()
+
+
+def warm_up() -> None:
+    for name, step in WARM_UP_STEPS:
+        started = time.monotonic()
+        try:
+            step()
+            readiness.steps[name] = f"ok ({(time.monotonic() - started) * 1000:.0f}ms)"
+        except Exception as e:
+            # Whatever failed will be retried on first use; don't keep the replica out of rotation
+            readiness.steps[name] = f"failed: {e}"
+            logger.error(f"Warm-up step {name} failed: {e}")
+    readiness.ready_after = time.monotonic() - readiness.started
+    logger.info(f"Action server warm after {readiness.ready_after:.2f}s")
+
+
+def begin() -> None:
+    """
+    Serve /metrics, /health and /ready (and the calendar feeds on their own port),
+    and warm up in the background. Safe to call more than once.
+    """
+    global _begun
+    with _begin_lock:
+        if _begun:
+            return
+        _begun = True
+    from actions.favorites_cache import favorites_cache
+    from actions.keyword_router import follow_favorites
+    follow_favorites(favorites_cache)
+    add_endpoint("/health", lambda: (200, "text/plain", "ok\n"))
+    add_endpoint("/ready", readiness.probe)
+    start_http_server()
+    start_calendar_server()
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+
+def main():
+    begin()
+    # The action package defaults to this one, like `rasa run actions` from the project root
+    if not any(arg == "--actions" or arg.startswith("--actions=") for arg in sys.argv[1:]):
+        sys.argv[1:1] = ["--actions", "actions"]
+    from rasa_sdk.__main__ import main as run_action_server
+    run_action_server()
+
+
+if __name__ == "__main__":
+    main()
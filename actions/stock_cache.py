@@ -0,0 +1,144 @@
+"""
+Process-wide (or Redis-shared) cache of item payloads keyed by item_id.
+
+Users who favorite the same store share one entry: any user's `get_items()`,
+a single `get_item()`, or the monitor's polling refreshes it for everybody.
+
+Configured in endpoints.yml, in the same style as `tracker_store`:
+
+    stock_cache:
+      type: redis          # or in_memory (default)
+      url: localhost
+      port: 6379
+      db: 1
+      password: <optional>
+      ttl: 45
+"""
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Text
+
+from actions.endpoints import ENDPOINTS_FILE, endpoint_config, redis_client
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 45
+MAX_ITEMS = 50000
+
+
+def item_id_of(payload: Dict[Text, Any]) -> Text:
+    return str(payload["item"]["item_id"])
+
+
+class StockCache:
+
+    def __init__(self, ttl: float = DEFAULT_TTL):
+        self.ttl = ttl
+
+    def get_many(self, item_ids: Iterable[Text]) -> Dict[Text, Dict[Text, Any]]:
+        raise NotImplementedError
+
+    def put_many(self, payloads: Iterable[Dict[Text, Any]]) -> None:
+        raise NotImplementedError
+
+    def get(self, item_id: Text) -> Optional[Dict[Text, Any]]:
+        return self.get_many([item_id]).get(str(item_id))
+
+    def put(self, payload: Dict[Text, Any]) -> None:
+        self.put_many([payload])
+
+
+class InMemoryStockCache(StockCache):
+
+    def __init__(self, ttl: float = DEFAULT_TTL, max_items: int = MAX_ITEMS):
+        super().__init__(ttl)
+        self.max_items = max_items
+        self._entries: Dict[Text, tuple] = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, item_ids: Iterable[Text]) -> Dict[Text, Dict[Text, Any]]:
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for item_id in item_ids:
+                entry = self._entries.get(str(item_id))
+                if entry is not None and entry[1] > now:
+                    found[str(item_id)] = entry[0]
+        return found
+
+    def put_many(self, payloads: Iterable[Dict[Text, Any]]) -> None:
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            for payload in payloads:
+                self._entries[item_id_of(payload)] = (payload, expires)
+            if len(self._entries) > self.max_items:
+                self._prune()
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        for item_id in [k for k, (_, expires) in self._entries.items() if expires <= now]:
+            del self._entries[item_id]
+        # Still too big: drop the entries closest to expiry
+        overflow = len(self._entries) - self.max_items
+        if overflow > 0:
+            for item_id in sorted(self._entries, key=lambda k: self._entries[k][1])[:overflow]:
+                del self._entries[item_id]
+
+
+class RedisStockCache(StockCache):
+    """
+    Shared between action server replicas and the monitor process.
+    Needs the `redis` package.
+    """
+    PREFIX = "tgtg:item:"
+
+    def __init__(self, ttl: float = DEFAULT_TTL, config: Dict[Text, Any] = None):
+        super().__init__(ttl)
+        self._redis = redis_client(config or {})
+
+    def get_many(self, item_ids: Iterable[Text]) -> Dict[Text, Dict[Text, Any]]:
+        ids = [str(i) for i in item_ids]
+        if not ids:
+            return {}
+        values = self._redis.mget([self.PREFIX + i for i in ids])
+        return {i: json.loads(v) for i, v in zip(ids, values) if v is not None}
+
+    def put_many(self, payloads: Iterable[Dict[Text, Any]]) -> None:
+        pipe = self._redis.pipeline(transaction=False)
+        for payload in payloads:
+            pipe.set(self.PREFIX + item_id_of(payload), json.dumps(payload), ex=max(1, int(self.ttl)))
+        pipe.execute()
+
+
+def load_stock_cache(endpoints_file: Text = ENDPOINTS_FILE) -> StockCache:
+    """
+    Build the cache described by the `stock_cache` section of endpoints.yml.
+    Falls back to the in-memory cache when the section is missing or Redis is unavailable.
+    """
+    config = endpoint_config("stock_cache", endpoints_file)
+    ttl = config.get("ttl", DEFAULT_TTL)
+    if config.get("type") == "redis":
+        try:
+            return RedisStockCache(ttl=ttl, config=config)
+        except ImportError:
+            logger.error("stock_cache type is redis but the redis package isn't installed; using in-memory cache")
+    return InMemoryStockCache(ttl=ttl)
+
+
+_stock_cache: Optional[StockCache] = None
+_stock_cache_lock = threading.Lock()
+
+
+def get_stock_cache() -> StockCache:
+    """
+    The process-wide cache, built from endpoints.yml on first use
+    (keeps yaml / redis out of the action server's import path).
+    """
+    global _stock_cache
+    if _stock_cache is None:
+        with _stock_cache_lock:
+            if _stock_cache is None:
+                _stock_cache = load_stock_cache()
+    return _stock_cache
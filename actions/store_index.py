@@ -0,0 +1,181 @@
+import heapq
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Set, Text
+
+# Candidates scoring within this margin of the best one are considered a tie
+AMBIGUITY_MARGIN = 0.05
+# Below this score we'd rather say "not found" than guess
+MIN_SCORE = 0.35
+# Share of the query's trigrams an entry must contain before we bother scoring it
+MIN_GRAM_HITS = 0.4
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def normalize(text: Optional[Text]) -> Text:
+    """
+    Lowercase, strip accents/punctuation and collapse whitespace.
+    "Café Nero — King's Rd" -> "cafe nero king s rd"
+    """
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return _NON_ALNUM.sub(" ", text.lower()).strip()
+
+
+def trigrams(text: Text) -> Set[Text]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class StoreMatch:
+    __slots__ = ("score", "name", "payload")
+
+    def __init__(self, score: float, name: Text, payload: Dict[Text, Any]):
+        self.score = score
+        self.name = name
+        self.payload = payload
+
+
+class StoreLookup:
+    """
+    Result of `StoreIndex.lookup`.
+    - `match`: the payload to use, or None if nothing matched / it's ambiguous
+    - `candidates`: ranked matches (best first)
+    """
+    __slots__ = ("match", "candidates")
+
+    def __init__(self, match: Optional[Dict[Text, Any]], candidates: List[StoreMatch]):
+        self.match = match
+        self.candidates = candidates
+
+    @property
+    def is_ambiguous(self) -> bool:
+        return self.match is None and len(self.candidates) > 1
+
+
+class _Entry:
+    __slots__ = ("display_name", "names", "tokens", "grams", "payload")
+
+    def __init__(self, display_name, names, payload):
+        self.display_name = display_name
+        self.names = names
+        self.tokens = set()
+        self.grams = set()
+        for n in names:
+            self.tokens.update(n.split())
+            self.grams.update(trigrams(n))
+        self.payload = payload
+
+
+class StoreIndex:
+    """
+    Store-name index over one favorites snapshot.
+    Built once per `get_items()` result; lookups only touch the entries sharing
+    a token or trigram with the query instead of scanning every favorite.
+    """
+
+    def __init__(self, items: List[Dict[Text, Any]]):
+        self._entries: List[_Entry] = []
+        self._exact: Dict[Text, List[int]] = defaultdict(list)
+        self._by_token: Dict[Text, Set[int]] = defaultdict(set)
+        self._by_gram: Dict[Text, Set[int]] = defaultdict(set)
+
+        for payload in items:
+            store = payload.get("store") or {}
+            store_name = store.get("store_name") or ""
+            branch = store.get("branch")
+            # Same display name as summarize_magic_bag builds ("Store — Branch")
+            display_name = store_name
+            if branch and branch.lower() not in store_name.lower():
+                display_name = f"{store_name} — {branch}"
+
+            names = {normalize(store_name), normalize(display_name)}
+            if branch:
+                names.add(normalize(branch))
+            names.discard("")
+            if not names:
+                continue
+
+            idx = len(self._entries)
+            entry = _Entry(display_name, names, payload)
+            self._entries.append(entry)
+            for n in names:
+                self._exact[n].append(idx)
+            for t in entry.tokens:
+                self._by_token[t].add(idx)
+            for g in entry.grams:
+                self._by_gram[g].add(idx)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def search(self, query: Text, limit: int = 5) -> List[StoreMatch]:
+        """
+        Ranked fuzzy matches for `query`, best first.
+        """
+        q = normalize(query)
+        if not q:
+            return []
+
+        q_tokens = set(q.split())
+        q_grams = trigrams(q)
+
+        scores: Dict[int, float] = {}
+        for idx in self._exact.get(q, ()):
+            scores[idx] = 1.0
+
+        candidates: Set[int] = set()
+        for t in q_tokens:
+            candidates.update(self._by_token.get(t, ()))
+        gram_hits: Counter = Counter()
+        for g in q_grams:
+            gram_hits.update(self._by_gram.get(g, ()))
+        min_hits = MIN_GRAM_HITS * len(q_grams)
+        candidates.update(idx for idx, hits in gram_hits.items() if hits >= min_hits)
+
+        for idx in candidates:
+            if idx in scores:
+                continue
+            scores[idx] = self._score(self._entries[idx], q, q_tokens, q_grams)
+
+        top = heapq.nlargest(limit, ((s, i) for i, s in scores.items() if s >= MIN_SCORE))
+        return [StoreMatch(s, self._entries[i].display_name, self._entries[i].payload) for s, i in top]
+
+    def lookup(self, query: Text) -> StoreLookup:
+        """
+        Resolve `query` to a single payload if there's a clear winner.
+        """
+        # Fast path: the query is exactly one store's name (e.g. the `store` slot we set ourselves)
+        exact = self._exact.get(normalize(query), ())
+        if len(exact) == 1:
+            entry = self._entries[exact[0]]
+            return StoreLookup(entry.payload, [StoreMatch(1.0, entry.display_name, entry.payload)])
+
+        ranked = self.search(query)
+        if not ranked:
+            return StoreLookup(None, [])
+
+        best = ranked[0]
+        ties = [m for m in ranked if best.score - m.score <= AMBIGUITY_MARGIN]
+        if len(ties) > 1:
+            return StoreLookup(None, ties)
+        return StoreLookup(best.payload, ranked)
+
+    @staticmethod
+    def _score(entry: _Entry, q: Text, q_tokens: Set[Text], q_grams: Set[Text]) -> float:
+        best = 0.0
+        for name in entry.names:
+            # Whole query appears inside the name (the old `in` check), weighted by coverage
+            if q in name:
+                best = max(best, 0.8 + 0.15 * len(q) / len(name))
+        token_overlap = len(q_tokens & entry.tokens) / len(q_tokens)
+        gram_overlap = len(q_grams & entry.grams) / len(q_grams | entry.grams)
+        return max(best, 0.7 * token_overlap + 0.3 * gram_overlap, gram_overlap)
+
+
+def describe_candidates(candidates: List[StoreMatch], limit: int = 5) -> Text:
+    return "\n".join(f"- {m.name}" for m in candidates[:limit])
@@ -0,0 +1,102 @@
+"""
+Proactive TGTG token refreshes.
+
+The library refreshes an access token lazily, inside whatever call first finds
+it expired, so the refresh used to land in the middle of a user's turn (or
+checkout), and a dead refresh token surfaced only then. `TokenRefresher.run_once`
+instead refreshes the users whose tokens expire within REFRESH_LEAD:
+- the most overdue first, at most BATCH_SIZE per pass, at BACKGROUND priority
+  so user turns keep their share of the rate limit
+- under the same per-user lock as lazy refreshes, and persisted to the credential store
+- with the user's pooled client if they're active, otherwise with a transient client
+  that never enters the pool (a pass would evict the active users' warm clients)
+- a refresh token TGTG rejects flags the user `login_required`: their next
+  turn starts the login flow before touching TGTG, and the monitor pushes them
+  a message asking to log in again
+
+The monitor runs a pass every REFRESH_CHECK_INTERVAL (one worker per pass, see
+actions/monitor.py). Without a monitor, run it on its own:
+    python -m actions.token_refresher
+    python -m actions.token_refresher --once     # e.g. from cron
+"""
+import argparse
+import logging
+import time
+from typing import List, Text
+
+from tgtg import TgtgAPIError, TgtgLoginError
+
+from actions.client_manager import ACCESS_TOKEN_LIFETIME, TGTGManager, tgtg_manager
+from actions.metrics import inc
+from actions.rate_limiter import RequestShedError
+
+logger = logging.getLogger(__name__)
+
+# Tokens are refreshed this long before they expire (seconds)
+REFRESH_LEAD = 30 * 60
+REFRESH_CHECK_INTERVAL = 60
+# Users refreshed per pass; BATCH_SIZE / REFRESH_CHECK_INTERVAL must keep up with
+# users / (ACCESS_TOKEN_LIFETIME - REFRESH_LEAD)
+BATCH_SIZE = 200
+# Answers to a refresh that mean the refresh token itself is dead
+DEAD_TOKEN_STATUSES = (400, 401)
+
+
+class TokenRefresher:
+
+    def __init__(self, manager: TGTGManager = None, lead: float = REFRESH_LEAD,
+                 batch_size: int = BATCH_SIZE, lifetime: float = ACCESS_TOKEN_LIFETIME):
+        self.manager = manager or tgtg_manager
+        self.lead = lead
+        self.batch_size = batch_size
+        self.lifetime = lifetime
+
+    def run_once(self) -> List[Text]:
+        """
+        Refresh one batch of due users. Runs in a worker thread.
+        Returns the users whose refresh token turned out to be dead.
+        """
+        refreshed_before = time.time() + self.lead - self.lifetime
+        dead = []
+        for user_id in self.manager.store.due(refreshed_before, self.batch_size):
+            try:
+                if self.manager.refresh_ahead(user_id, refreshed_before):
+                    inc("tgtg_proactive_refreshes_total", result="ok")
+            except RequestShedError:
+                # The rate limit is busy with user turns: the rest waits for the next pass
+                inc("tgtg_proactive_refreshes_total", result="shed")
+                break
+            except (TgtgAPIError, TgtgLoginError) as e:
+                status = e.args[0] if e.args else None
+                if isinstance(e, TgtgLoginError) or status in DEAD_TOKEN_STATUSES:
+                    logger.warning(f"Refresh token of {user_id} is dead ({e}), asking them to log in again")
+                    self.manager.mark_login_required(user_id)
+                    dead.append(user_id)
+                    inc("tgtg_proactive_refreshes_total", result="dead")
+                else:
+                    logger.warning(f"Proactive refresh for {user_id} failed: {e}")
+                    inc("tgtg_proactive_refreshes_total", result="error")
+            except Exception as e:
+                logger.error(f"Proactive refresh for {user_id} crashed: {e}")
+                inc("tgtg_proactive_refreshes_total", result="error")
+        return dead
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh TGTG tokens before they expire")
+    parser.add_argument("--once", action="store_true", help="Run a single pass and exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    refresher = TokenRefresher()
+    while True:
+        dead = refresher.run_once()
+        if dead:
+            logger.info(f"{len(dead)} users need to log in again")
+        if args.once:
+            break
+        time.sleep(REFRESH_CHECK_INTERVAL)
+
+
+if __name__ == "__main__":
+    main()
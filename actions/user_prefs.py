@@ -0,0 +1,70 @@
+from typing import Optional, Text
+
+from actions.credential_store import DEFAULT_DB_PATH, SQLiteStore
+from actions.local_cache import LocalCache
+
+DEFAULT_TIMEZONE = "Europe/London"
+DEFAULT_CURRENCY = "GBP"
+# A change made through another replica shows up here within this time (seconds)
+PREFS_TTL = 60
+PREFS_MAX_USERS = 10000
+
+
+class UserPrefs:
+    __slots__ = ("timezone", "currency", "spend_cap")
+
+    def __init__(self, timezone: Text = DEFAULT_TIMEZONE, currency: Text = DEFAULT_CURRENCY,
+                 spend_cap: Optional[float] = None):
+        self.timezone = timezone
+        self.currency = currency
+        # Auto-reserve daily spend cap; None means the default one
+        self.spend_cap = spend_cap
+
+
+class PrefsStore(SQLiteStore):
+    """
+    Per-user display preferences and auto-reserve spend cap, in the same SQLite
+    DB as the credentials.
+    Reads are served from memory for PREFS_TTL after each lookup.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS user_prefs ("
+        " user_id TEXT PRIMARY KEY,"
+        " timezone TEXT,"
+        " currency TEXT)",
+        # Tables created before the spend cap existed
+        "ALTER TABLE user_prefs ADD COLUMN spend_cap REAL",
+    )
+
+    def __init__(self, path: Text = DEFAULT_DB_PATH, ttl: float = PREFS_TTL, max_users: int = PREFS_MAX_USERS):
+        super().__init__(path)
+        self._cache = LocalCache(ttl, max_users)
+
+    def get(self, user_id: Text) -> UserPrefs:
+        prefs = self._cache.get(user_id)
+        if prefs is None:
+            row = self._conn().execute(
+                "SELECT timezone, currency, spend_cap FROM user_prefs WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            prefs = UserPrefs(row[0] or DEFAULT_TIMEZONE, row[1] or DEFAULT_CURRENCY, row[2]) if row else UserPrefs()
+            self._cache.put(user_id, prefs)
+        return prefs
+
+    def set(self, user_id: Text, timezone: Optional[Text] = None, currency: Optional[Text] = None,
+            spend_cap: Optional[float] = None) -> UserPrefs:
+        current = self.get(user_id)
+        prefs = UserPrefs(timezone or current.timezone, (currency or current.currency).upper(),
+                          spend_cap if spend_cap is not None else current.spend_cap)
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO user_prefs (user_id, timezone, currency, spend_cap) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET timezone = excluded.timezone, currency = excluded.currency, "
+                "spend_cap = excluded.spend_cap",
+                (user_id, prefs.timezone, prefs.currency, prefs.spend_cap),
+            )
+        self._cache.put(user_id, prefs)
+        return prefs
+
+
+prefs_store = PrefsStore()
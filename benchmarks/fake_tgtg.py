@@ -0,0 +1,212 @@
+"""
+Local stand-in for the TGTG API, serving synthetic favorites.
+
+Speaks just enough of the API for the bot: token refresh, favorites (get_items /
+get_favorites), single items, order creation and order status. Every user
+(identified by their bearer token, "access-<user_id>") gets a fixed random sample
+of the catalog as favorites. Latency and 429 answers can be injected, and a share
+of the orders stay PENDING for a moment before they're RESERVED, like TGTG's
+asynchronous confirmations.
+
+Run it on its own and point the bot at it:
+    python -m benchmarks.fake_tgtg --port 8765
+    TGTG_API_URL=http://localhost:8765/api/ python -m actions.startup
+"""
+import argparse
+import asyncio
+import random
+import re
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Text, Tuple
+
+from aiohttp import web
+
+BRANDS = ("Greggs", "Pret A Manger", "Costa Coffee", "Starbucks", "Caffè Nero", "Itsu", "Wasabi",
+          "Gail's Bakery", "Paul", "Leon", "Co-op", "Sainsbury's", "Tesco Express", "Waitrose",
+          "M&S Food", "Planet Organic", "Crosstown", "Le Pain Quotidien", "Ole & Steen", "Boots")
+BRANCHES = ("Oxford Street", "King's Cross", "Canary Wharf", "Shoreditch", "Camden", "Brixton",
+            "Reading Station", "Broad Street", "Angel", "Victoria", "Waterloo", "Hammersmith",
+            "Richmond", "Clapham Junction", "Stratford", "Islington", "Soho", "Holborn")
+FOODS = ("croissants", "sandwiches", "wraps", "pastries", "salads", "sushi", "bread", "cakes",
+         "muffins", "soup", "fruit", "yoghurt pots", "cookies", "bagels", "baguettes", "sausage rolls")
+CATEGORIES = ("BAKED_GOODS", "MEAL", "GROCERIES", "OTHER")
+
+TOKEN_PREFIX = "access-"
+REFRESH_PREFIX = "refresh-"
+
+_ROUTES = (
+    ("refresh", re.compile(r"(auth|token)/v\d+/(token/)?refresh")),
+    ("get_items", re.compile(r"item/v\d+/?$")),
+    ("get_item", re.compile(r"item/v\d+/(?P<item_id>\w+)/?$")),
+    ("get_favorites", re.compile(r"discover/v\d+/bucket")),
+    ("create_order", re.compile(r"order/v\d+/create/(?P<item_id>\w+)")),
+    ("order_status", re.compile(r"order/v\d+/(?P<order_id>[\w-]+)/status")),
+)
+
+
+def make_item(item_id: int, rng: random.Random, description_length: int, in_stock: float) -> Dict[Text, Any]:
+    foods = rng.sample(FOODS, 4)
+    description = f"You could receive items such as {', '.join(foods[:-1])} or {foods[-1]}."
+    filler = " Please note that the contents of your bag will vary from day to day."
+    while len(description) < description_length:
+        description += filler
+    start = datetime.now(timezone.utc).replace(second=0, microsecond=0) + timedelta(hours=rng.randint(1, 30))
+    price = rng.choice((299, 350, 399, 450, 500))
+    return {
+        "item": {
+            "item_id": str(item_id),
+            "item_price": {"code": "GBP", "minor_units": price, "decimals": 2},
+            "item_value": {"code": "GBP", "minor_units": price * 3, "decimals": 2},
+            "description": description[:description_length],
+            "packaging_option": rng.choice(("BAG_ALLOWED", "MUST_BRING_BAG")),
+            "item_category": rng.choice(CATEGORIES),
+        },
+        "store": {
+            "store_name": rng.choice(BRANDS),
+            "branch": rng.choice(BRANCHES),
+            "store_location": {"address": {"address_line": f"{rng.randint(1, 300)} High Street, London"}},
+            "store_time_zone": "Europe/London",
+        },
+        "pickup_interval": {
+            "start": start.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "end": (start + timedelta(minutes=30)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        },
+        "items_available": rng.randint(1, 5) if rng.random() < in_stock else 0,
+    }
+
+
+class FakeTgtgServer:
+
+    def __init__(self, catalog: int = 1000, favorites: int = 50, description_length: int = 300,
+                 latency: float = 0.05, jitter: float = 0.5, rate_429: float = 0.0,
+                 in_stock: float = 0.7, seed: int = 1, pending_orders: float = 0.3,
+                 settle_time: float = 1.0):
+        rng = random.Random(seed)
+        self.items = {str(i): make_item(i, rng, description_length, in_stock) for i in range(1, catalog + 1)}
+        self.favorites = favorites
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.pending_orders = pending_orders
+        self.settle_time = settle_time
+        self.seed = seed
+        self.calls = Counter()
+        self._rng = random.Random(seed + 1)
+        self._favorites: Dict[Text, List[Text]] = {}
+        # order id -> (final state, monotonic time it's reached)
+        self._orders: Dict[Text, Tuple[Text, float]] = {}
+        self._runner: Optional[web.AppRunner] = None
+
+    def favorites_of(self, user_id: Text) -> List[Dict[Text, Any]]:
+        ids = self._favorites.get(user_id)
+        if ids is None:
+            rng = random.Random(f"{self.seed}:{user_id}")
+            ids = self._favorites[user_id] = rng.sample(sorted(self.items), min(self.favorites, len(self.items)))
+        return [self.items[i] for i in ids]
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/api/{path:.*}", self.handle)
+        return app
+
+    async def start(self, host: Text = "127.0.0.1", port: int = 0) -> Text:
+        """
+        Serve on the running loop. Returns the base URL to give the client.
+        """
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        return f"http://{host}:{port}/api/"
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        path = request.match_info["path"]
+        if self.latency:
+            await asyncio.sleep(self.latency * self._rng.uniform(1 - self.jitter, 1 + self.jitter))
+
+        for endpoint, pattern in _ROUTES:
+            m = pattern.search(path)
+            if m:
+                break
+        else:
+            self.calls["unknown"] += 1
+            return web.json_response({"errors": [{"code": "NOT_FOUND"}]}, status=404)
+
+        self.calls[endpoint] += 1
+        if self.rate_429 and self._rng.random() < self.rate_429:
+            self.calls["429"] += 1
+            return web.json_response({"errors": [{"code": "TOO_MANY_REQUESTS"}]}, status=429)
+
+        body = await request.json() if request.can_read_body else {}
+        if endpoint == "refresh":
+            user_id = (body.get("refresh_token") or "").replace(REFRESH_PREFIX, "", 1)
+            return web.json_response({
+                "access_token": TOKEN_PREFIX + user_id,
+                "refresh_token": REFRESH_PREFIX + user_id,
+                "access_token_ttl_seconds": 172800,
+            }, headers={"Set-Cookie": f"datadome={user_id}"})
+
+        user_id = request.headers.get("Authorization", "").replace("Bearer ", "").replace(TOKEN_PREFIX, "", 1)
+        if not user_id:
+            return web.json_response({"errors": [{"code": "UNAUTHORIZED"}]}, status=401)
+
+        if endpoint == "get_items":
+            return web.json_response({"items": self.favorites_of(user_id)})
+        if endpoint == "get_favorites":
+            return web.json_response({"mobile_bucket": {"items": self.favorites_of(user_id)}})
+        if endpoint == "get_item":
+            item = self.items.get(m.group("item_id"))
+            return web.json_response(item) if item else web.json_response({}, status=404)
+        if endpoint == "create_order":
+            item = self.items.get(m.group("item_id"))
+            if item is None or item["items_available"] <= 0:
+                return web.json_response({"state": "SOLD_OUT"})
+            order_id = f"order-{len(self._orders) + 1}"
+            pending = self.pending_orders and self._rng.random() < self.pending_orders
+            settles_at = time.monotonic() + (self.settle_time if pending else 0.0)
+            self._orders[order_id] = ("RESERVED", settles_at)
+            if pending:
+                self.calls["pending_orders"] += 1
+            return web.json_response({"state": "SUCCESS",
+                                      "order": {"id": order_id, "state": "PENDING" if pending else "RESERVED"}})
+        state, settles_at = self._orders.get(m.group("order_id"), ("FAILED", 0.0))
+        return web.json_response({"state": state if time.monotonic() >= settles_at else "PENDING"})
+
+
+def credentials_for(user_id: Text) -> Dict[Text, Text]:
+    """
+    Credentials the fake server accepts for `user_id`.
+    """
+    return {
+        "access_token": TOKEN_PREFIX + user_id,
+        "refresh_token": REFRESH_PREFIX + user_id,
+        "cookie": f"datadome={user_id}",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the TGTG API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--catalog", type=int, default=1000, help="Items in the whole catalog")
+    parser.add_argument("--favorites", type=int, default=50, help="Favorites per user")
+    parser.add_argument("--description-length", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.05, help="Mean seconds per answer")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Share of requests answered 429")
+    parser.add_argument("--pending-orders", type=float, default=0.3, help="Share of orders confirmed later")
+    args = parser.parse_args()
+
+    server = FakeTgtgServer(args.catalog, args.favorites, args.description_length, args.latency,
+                            rate_429=args.rate_429, pending_orders=args.pending_orders)
+    web.run_app(server.app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Accuracy and latency of the keyword router (actions/keyword_router.py) against
+the trained NLU model:
+
+    python -m benchmarks.nlu_router                   # router only
+    python -m benchmarks.nlu_router --model models/   # router vs model vs router + model fallback
+
+Two test sets, both built from data/nlu.yml:
+- held_out: every example of every intent, routed with templates built from the
+  *other* examples (leave-one-out), so phrasing the router hasn't seen counts.
+  Examples of intents the router doesn't handle measure its false positives.
+- favorites: every routed template filled with each store of a synthetic
+  favorites list (the fake API's brands), resolved through the gazetteer.
+
+A case is correct when the intent matches and, if a store is expected, the
+predicted store names the same store. "coverage" is the share of messages the
+router answers itself; the rest would go to the model.
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Optional, Text, Tuple
+
+from actions.keyword_router import (ANNOTATION, NLU_FILE, ROUTED_INTENTS, KeywordRouter, Templates,
+                                    build_templates)
+from actions.store_index import StoreIndex, normalize
+from benchmarks.fake_tgtg import BRANCHES, BRANDS
+from benchmarks.run import percentile
+
+# (text, expected intent, expected store or None)
+Case = Tuple[Text, Text, Optional[Text]]
+
+
+class StaticGazetteer:
+    """
+    Same favorites for every user, no DB.
+    """
+
+    def __init__(self, stores: List[Tuple[Text, Optional[Text]]]):
+        self._index = StoreIndex([{"store": {"store_name": name, "branch": branch}} for name, branch in stores])
+
+    def index(self, user_id: Text) -> StoreIndex:
+        return self._index
+
+
+def load_nlu(path: Text = NLU_FILE) -> List[Dict[Text, Any]]:
+    import yaml
+    with open(path) as f:
+        return (yaml.safe_load(f) or {}).get("nlu") or []
+
+
+def examples_of(nlu: List[Dict[Text, Any]]) -> List[Tuple[Text, Text]]:
+    pairs = []
+    for block in nlu:
+        for line in (block.get("examples") or "").splitlines():
+            line = line.strip()
+            if block.get("intent") and line.startswith("- "):
+                pairs.append((block["intent"], line[2:].strip()))
+    return pairs
+
+
+def plain(example: Text) -> Tuple[Text, Optional[Text]]:
+    """
+    The example as a user would type it, and its store annotation if any.
+    """
+    store = None
+    for match in ANNOTATION.finditer(example):
+        if (match.group(2) or match.group(4)) == "store":
+            store = match.group(1) or match.group(3)
+    return ANNOTATION.sub(lambda m: m.group(1) or m.group(3), example), store
+
+
+def held_out_cases(nlu: List[Dict[Text, Any]]) -> List[Tuple[Case, Templates]]:
+    examples = examples_of(nlu)
+    cases = []
+    for i, (intent, example) in enumerate(examples):
+        others = [{"intent": it, "examples": f"- {ex}"} for j, (it, ex) in enumerate(examples) if j != i]
+        text, store = plain(example)
+        cases.append(((text, intent, store), build_templates(others)))
+    return cases
+
+
+def favorites_cases(nlu: List[Dict[Text, Any]], stores: List[Tuple[Text, Text]]) -> List[Case]:
+    cases = []
+    for intent, example in examples_of(nlu):
+        if intent not in ROUTED_INTENTS:
+            continue
+        _, store = plain(example)
+        if store is None:
+            continue
+        for name, _ in stores:
+            filled = ANNOTATION.sub(lambda m: name, example, count=1)
+            cases.append((filled, intent, name))
+    return cases
+
+
+def same_store(predicted: Optional[Text], expected: Optional[Text]) -> bool:
+    if expected is None:
+        return predicted is None
+    if predicted is None:
+        return False
+    p, e = normalize(predicted), normalize(expected)
+    return e in p or p in e
+
+
+def score(predictions: List[Optional[Tuple[Text, Optional[Text]]]], cases: List[Case]) -> Dict[Text, float]:
+    answered = [(p, c) for p, c in zip(predictions, cases) if p is not None]
+    correct = sum(1 for (intent, store), (_, exp_intent, exp_store) in answered
+                  if intent == exp_intent and same_store(store, exp_store))
+    return {
+        "cases": len(cases),
+        "coverage": len(answered) / len(cases) if cases else 0.0,
+        "accuracy": correct / len(answered) if answered else 0.0,
+    }
+
+
+def run_router(cases: List[Case], routers: List[KeywordRouter]) -> Dict[Text, Any]:
+    predictions, latencies = [], []
+    for (text, _, _), router in zip(cases, routers):
+        started = time.perf_counter()
+        route = router.route("bench-user", text)
+        latencies.append(time.perf_counter() - started)
+        predictions.append((route.intent, route.store) if route else None)
+    latencies.sort()
+    return {**score(predictions, cases), "p50_us": percentile(latencies, 0.5) * 1e6,
+            "p99_us": percentile(latencies, 0.99) * 1e6, "predictions": predictions, "latencies": latencies}
+
+
+def run_model(cases: List[Case], model: Text) -> Dict[Text, Any]:
+    from rasa.core.agent import Agent
+    agent = Agent.load(model)
+
+    async def parse_all():
+        results = []
+        for text, _, _ in cases:
+            started = time.perf_counter()
+            parsed = await agent.parse_message(text)
+            elapsed = time.perf_counter() - started
+            store = next((e["value"] for e in parsed.get("entities", []) if e.get("entity") == "store"), None)
+            results.append(((parsed["intent"]["name"], store), elapsed))
+        return results
+
+    results = asyncio.run(parse_all())
+    predictions = [p for p, _ in results]
+    latencies = sorted(t for _, t in results)
+    return {**score(predictions, cases), "p50_us": percentile(latencies, 0.5) * 1e6,
+            "p99_us": percentile(latencies, 0.99) * 1e6, "predictions": predictions,
+            "latencies": [t for _, t in results]}
+
+
+def combined(router: Dict[Text, Any], model: Dict[Text, Any], cases: List[Case]) -> Dict[Text, Any]:
+    """
+    Router first, model on fallback: what the routed_rest channel does.
+    """
+    predictions, latencies = [], []
+    for routed, routed_time, parsed, parsed_time in zip(router["predictions"], router["latencies"],
+                                                        model["predictions"], model["latencies"]):
+        predictions.append(routed if routed is not None else parsed)
+        latencies.append(routed_time + (parsed_time if routed is None else 0.0))
+    mean = sum(latencies) / len(latencies) if latencies else 0.0
+    latencies.sort()
+    return {**score(predictions, cases), "p50_us": percentile(latencies, 0.5) * 1e6,
+            "p99_us": percentile(latencies, 0.99) * 1e6, "mean_us": mean * 1e6}
+
+
+def evaluate(nlu_file: Text = NLU_FILE, model: Optional[Text] = None) -> Dict[Text, Dict[Text, Any]]:
+    nlu = load_nlu(nlu_file)
+    annotated = {plain(example)[1] for _, example in examples_of(nlu)} - {None}
+    favorites = [(brand, BRANCHES[i % len(BRANCHES)]) for i, brand in enumerate(BRANDS)]
+    gazetteer = StaticGazetteer(favorites + [(name, None) for name in sorted(annotated)])
+
+    held_out = held_out_cases(nlu)
+    full = build_templates(nlu)
+    sets = {
+        "held_out": ([case for case, _ in held_out], [KeywordRouter(t, gazetteer) for _, t in held_out]),
+        "favorites": (favorites_cases(nlu, favorites), None),
+    }
+    results = {}
+    for name, (cases, routers) in sets.items():
+        routers = routers or [KeywordRouter(full, gazetteer)] * len(cases)
+        result = {"router": run_router(cases, routers)}
+        if model:
+            result["model"] = run_model(cases, model)
+            result["router+model"] = combined(result["router"], result["model"], cases)
+        for r in result.values():
+            r.pop("predictions", None)
+            r.pop("latencies", None)
+        results[name] = result
+    return results
+
+
+def print_report(results: Dict[Text, Dict[Text, Any]]) -> None:
+    print(f"{'set':<11}{'pipeline':<14}{'cases':>7}{'coverage':>10}{'accuracy':>10}{'p50 us':>10}{'p99 us':>10}")
+    for name, result in results.items():
+        for pipeline, r in result.items():
+            print(f"{name:<11}{pipeline:<14}{r['cases']:>7}{r['coverage']:>10.1%}{r['accuracy']:>10.1%}"
+                  f"{r['p50_us']:>10.1f}{r['p99_us']:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keyword router vs NLU model: accuracy and latency")
+    parser.add_argument("--nlu", default=NLU_FILE)
+    parser.add_argument("--model", help="Trained model (file or models/ directory) to compare against")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = evaluate(args.nlu, args.model)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+
+
+if __name__ == "__main__":
+    main()
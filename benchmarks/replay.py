@@ -0,0 +1,283 @@
+"""
+Replays TGTG traffic recorded in production (actions/recorder.py) through the
+bot's own code, at N times real time:
+
+    python -m benchmarks.replay recordings/
+    python -m benchmarks.replay recordings/ --speed 20 --stages scheduler
+    python -m benchmarks.replay recordings/tgtg-20260101T120000-41-0001.jsonl.gz --speed 0 --json
+
+Records are streamed from the gzip segments one at a time (generators end to
+end, latencies go into fixed-size histograms), so memory stays flat whatever
+the size of the recording. `--speed 0` replays as fast as possible.
+
+Stages, each fed every record:
+- summarize: favorites lists go through summarize_favorites and a StoreIndex
+  with a lookup per store; single items through summarize_magic_bag
+- stock_cache: favorites lists fill an InMemoryStockCache, and single-item
+  fetches count as hits when the cache already had the item (its TTL is
+  divided by the speed, so hit rates match real time)
+- scheduler: each request asks a RequestScheduler for a slot with its recorded
+  user and priority (rates multiplied by the speed); reports waits (in real
+  time) and sheds
+
+`lag_p99_ms` is how far the replay fell behind the recorded timeline: above a few
+milliseconds, the stages can't keep up with that speed.
+"""
+import argparse
+import json
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Text
+
+from actions.metrics import BUCKETS, Histogram
+from actions.recorder import iter_records
+
+STAGES = ("summarize", "stock_cache", "scheduler")
+# Scheduler requests waiting for a slot at once; bounds the replay's own memory
+MAX_IN_FLIGHT = 1024
+
+
+def quantile(histogram: Histogram, q: float) -> float:
+    """
+    Upper bound of the bucket holding the q-quantile, in seconds (inf past the last bucket).
+    """
+    rank = q * histogram.count
+    seen = 0
+    for bound, count in zip(BUCKETS + (float("inf"),), histogram.counts):
+        seen += count
+        if count and seen >= rank:
+            return bound
+    return 0.0
+
+
+def favorites_in(response: Any) -> Optional[List[Dict[Text, Any]]]:
+    """
+    The items of a get_items / get_favorites answer, None for anything else.
+    """
+    if not isinstance(response, dict):
+        return None
+    if isinstance(response.get("items"), list):
+        return response["items"]
+    bucket = response.get("mobile_bucket")
+    if isinstance(bucket, dict) and isinstance(bucket.get("items"), list):
+        return bucket["items"]
+    return None
+
+
+def item_in(response: Any) -> Optional[Dict[Text, Any]]:
+    """
+    The payload of a get_item answer, None for anything else.
+    """
+    if isinstance(response, dict) and isinstance(response.get("item"), dict) and "store" in response:
+        return response
+    return None
+
+
+def paced(records: Iterable[Dict[Text, Any]], speed: float, lag: Histogram) -> Iterator[Dict[Text, Any]]:
+    """
+    Yield each record at its recorded time divided by `speed`. Segments of
+    several processes may overlap; records already due are yielded at once.
+    """
+    started = time.monotonic()
+    first_ts = None
+    for record in records:
+        if speed > 0:
+            if first_ts is None:
+                first_ts = record["ts"]
+            delay = started + (record["ts"] - first_ts) / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            lag.observe(max(0.0, -delay))
+        yield record
+
+
+class Stage:
+    name = ""
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.counts = Counter()
+
+    def timed(self, call: Callable[[], Any]) -> None:
+        started = time.perf_counter()
+        try:
+            call()
+        except Exception:
+            # A payload the code can't handle is a finding of the replay, not a reason to stop it
+            self.counts["errors"] += 1
+        self.latency.observe(time.perf_counter() - started)
+
+    def feed(self, record: Dict[Text, Any]) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def report(self) -> Dict[Text, Any]:
+        return {
+            "p50_ms": quantile(self.latency, 0.50) * 1000,
+            "p99_ms": quantile(self.latency, 0.99) * 1000,
+            "mean_ms": self.latency.total / self.latency.count * 1000 if self.latency.count else 0.0,
+            **self.counts,
+        }
+
+
+class SummarizeStage(Stage):
+    name = "summarize"
+
+    def feed(self, record: Dict[Text, Any]) -> None:
+        from actions.items_summary import summarize_favorites, summarize_magic_bag
+        from actions.store_index import StoreIndex
+
+        response = record.get("response")
+        items = favorites_in(response)
+        if items:
+            def run():
+                summarize_favorites(items)
+                index = StoreIndex(items)
+                for payload in items:
+                    index.lookup((payload.get("store") or {}).get("store_name") or "")
+            self.timed(run)
+            self.counts["favorites_lists"] += 1
+            self.counts["items"] += len(items)
+        elif item_in(response):
+            self.timed(lambda: summarize_magic_bag(response))
+            self.counts["single_items"] += 1
+
+
+class StockCacheStage(Stage):
+    name = "stock_cache"
+
+    def __init__(self, speed: float):
+        from actions.stock_cache import DEFAULT_TTL, InMemoryStockCache
+        super().__init__()
+        self.cache = InMemoryStockCache(ttl=DEFAULT_TTL / speed if speed > 0 else DEFAULT_TTL)
+
+    def feed(self, record: Dict[Text, Any]) -> None:
+        from actions.stock_cache import item_id_of
+
+        response = record.get("response")
+        items = favorites_in(response)
+        if items:
+            self.timed(lambda: self.cache.put_many(items))
+        elif item_in(response):
+            hit = self.cache.get(item_id_of(response)) is not None
+            self.counts["get_item_hits" if hit else "get_item_misses"] += 1
+            self.timed(lambda: self.cache.put(response))
+
+    def report(self) -> Dict[Text, Any]:
+        report = super().report()
+        fetches = self.counts["get_item_hits"] + self.counts["get_item_misses"]
+        report["hit_rate"] = self.counts["get_item_hits"] / fetches if fetches else 0.0
+        return report
+
+
+class SchedulerStage(Stage):
+    name = "scheduler"
+
+    def __init__(self, speed: float, concurrency: int = MAX_IN_FLIGHT):
+        from actions.rate_limiter import (DEADLINES, GLOBAL_BURST, GLOBAL_RATE, USER_BURST, USER_RATE,
+                                          RequestScheduler)
+        super().__init__()
+        self.speed = speed if speed > 0 else 1.0
+        self.scheduler = RequestScheduler(GLOBAL_RATE * self.speed, GLOBAL_BURST,
+                                          USER_RATE * self.speed, USER_BURST)
+        self.deadlines = {priority: deadline / self.speed for priority, deadline in DEADLINES.items()}
+        self._executor = ThreadPoolExecutor(concurrency, thread_name_prefix="replay-scheduler")
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+
+    def feed(self, record: Dict[Text, Any]) -> None:
+        if not self._slots.acquire(blocking=False):
+            # Blocking here would stall the timeline; more waiters than this is an overload anyway
+            self.counts["over_in_flight"] += 1
+            return
+        self._executor.submit(self._acquire, record.get("user"), record.get("priority"))
+
+    def _acquire(self, user: Optional[Text], priority_name: Optional[Text]) -> None:
+        from actions.rate_limiter import Priority, RequestShedError
+        priority = Priority[priority_name] if priority_name in Priority.__members__ else Priority.INTERACTIVE
+        started = time.perf_counter()
+        try:
+            self.scheduler.acquire(user, priority, self.deadlines[priority])
+            outcome = "granted"
+        except RequestShedError:
+            outcome = "shed"
+        finally:
+            self._slots.release()
+        with self._lock:
+            # Waits are reported in recorded (real) time
+            self.latency.observe((time.perf_counter() - started) * self.speed)
+            self.counts[f"{priority.name.lower()}_{outcome}"] += 1
+
+    def close(self) -> None:
+        self._executor.shutdown()
+
+
+def build_stages(names: Iterable[Text], speed: float) -> List[Stage]:
+    stages = []
+    for name in names:
+        if name == "summarize":
+            stages.append(SummarizeStage())
+        elif name == "stock_cache":
+            stages.append(StockCacheStage(speed))
+        elif name == "scheduler":
+            stages.append(SchedulerStage(speed))
+    return stages
+
+
+def replay(paths: Iterable[Text], stages: List[Stage], speed: float = 1.0,
+           limit: Optional[int] = None) -> Dict[Text, Any]:
+    lag = Histogram()
+    statuses = Counter()
+    count = 0
+    started = time.monotonic()
+    for record in paced(iter_records(paths), speed, lag):
+        statuses[str(record.get("status"))] += 1
+        for stage in stages:
+            stage.feed(record)
+        count += 1
+        if limit is not None and count >= limit:
+            break
+    for stage in stages:
+        stage.close()
+    elapsed = time.monotonic() - started
+    return {
+        "records": count,
+        "seconds": elapsed,
+        "records_per_second": count / elapsed if elapsed else 0.0,
+        "lag_p99_ms": quantile(lag, 0.99) * 1000,
+        "statuses": dict(statuses),
+        "stages": {stage.name: stage.report() for stage in stages},
+    }
+
+
+def print_report(result: Dict[Text, Any]) -> None:
+    print(f"{result['records']} records in {result['seconds']:.1f}s "
+          f"({result['records_per_second']:.0f}/s), lag p99 {result['lag_p99_ms']:.0f}ms")
+    print(f"statuses: {', '.join(f'{k}={v}' for k, v in sorted(result['statuses'].items()))}")
+    for name, report in result["stages"].items():
+        values = ", ".join(f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}" for k, v in report.items())
+        print(f"{name:<12} {values}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded TGTG traffic through the bot's code")
+    parser.add_argument("paths", nargs="+", help="Segments, or directories of segments")
+    parser.add_argument("--speed", type=float, default=1.0, help="Multiple of real time; 0 for no pacing")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--limit", type=int, help="Stop after this many records")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    result = replay(args.paths, build_stages(args.stages, args.speed), args.speed, args.limit)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""
+Offline load benchmarks for the TGTG actions.
+
+Starts the fake TGTG API (benchmarks/fake_tgtg.py) on a local port, points the bot's
+clients at it through TGTG_API_URL, logs in `--users` synthetic users, and drives
+the real actions the way the action server does, `--concurrency` turns at a time
+on the event loop with as many action worker threads:
+
+    python -m benchmarks.run
+    python -m benchmarks.run --scenarios availability reserve --users 500 --requests 5000
+    python -m benchmarks.run --json > baseline.json
+    python -m benchmarks.run --compare baseline.json     # exit 1 on a p99/throughput regression
+
+Scenarios:
+- availability: ActionCheckAvailability with a store entity
+- pickup: ActionCheckPickupTime with the store slot (the follow-up turn)
+- reserve: ActionReserveOrder with item_id/store slots; orders the fake API leaves
+  pending are followed by the order tracker on the benchmark's loop, as on the
+  action server, and the scenario ends once they've settled
+- summarize: summarize_favorites over a user's whole favorites list, no I/O
+
+Reported per scenario: p50/p99/max latency, throughput, action outcomes and
+upstream calls by endpoint (as seen by the fake server).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Text
+
+from benchmarks.fake_tgtg import FakeTgtgServer, credentials_for
+
+SCENARIOS = ("availability", "pickup", "reserve", "summarize")
+# A regression is flagged when p99 grows, or throughput drops, by more than this share
+REGRESSION_TOLERANCE = 0.2
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def tracker_for(user_id: Text, slots: Dict[Text, Any] = None, entities: List[Dict] = None):
+    from rasa_sdk import Tracker
+    return Tracker.from_dict({
+        "sender_id": user_id,
+        "slots": slots or {},
+        "latest_message": {"intent": {"name": "bench"}, "entities": entities or [], "text": ""},
+        "events": [],
+        "paused": False,
+        "followup_action": None,
+        "active_loop": {},
+        "latest_action_name": None,
+    })
+
+
+class Bench:
+
+    def __init__(self, server: FakeTgtgServer, users: int, seed: int = 1):
+        self.server = server
+        self.user_ids = [f"bench-user-{i}" for i in range(users)]
+        self.rng = random.Random(seed)
+
+    def setup(self) -> None:
+        from actions.client_manager import tgtg_manager
+        for user_id in self.user_ids:
+            tgtg_manager.save_credentials(user_id, credentials_for(user_id))
+
+    def pick(self, in_stock: bool = False):
+        """
+        A random user and one of their favorites, as (user_id, payload, spoken store name).
+        """
+        user_id = self.rng.choice(self.user_ids)
+        favorites = self.server.favorites_of(user_id)
+        if in_stock:
+            favorites = [f for f in favorites if f["items_available"] > 0] or favorites
+        payload = self.rng.choice(favorites)
+        store = payload["store"]
+        return user_id, payload, f"{store['store_name']} {store['branch']}"
+
+    def request(self, scenario: Text) -> Callable[[], Any]:
+        """
+        Build one request of `scenario`; calling it runs it.
+        """
+        if scenario == "summarize":
+            from actions.items_summary import summarize_favorites
+            user_id, _, _ = self.pick()
+            payloads = self.server.favorites_of(user_id)
+
+            return lambda: summarize_favorites(payloads)
+
+        from rasa_sdk.executor import CollectingDispatcher
+        from actions.actions import ActionCheckAvailability, ActionCheckPickupTime, ActionReserveOrder
+
+        if scenario == "availability":
+            user_id, _, name = self.pick()
+            action = ActionCheckAvailability()
+            tracker = tracker_for(user_id, entities=[{"entity": "store", "value": name}])
+        elif scenario == "pickup":
+            user_id, _, name = self.pick()
+            action = ActionCheckPickupTime()
+            tracker = tracker_for(user_id, slots={"store": name})
+        else:
+            user_id, payload, name = self.pick(in_stock=True)
+            action = ActionReserveOrder()
+            tracker = tracker_for(user_id, slots={"store": name, "item_id": payload["item"]["item_id"]})
+
+        async def run():
+            # Failures are caught inside the action; its trace outcome is read from the metrics
+            await action.run(CollectingDispatcher(), tracker, {})
+        return run
+
+
+async def run_scenario(bench: Bench, scenario: Text, requests: int, concurrency: int) -> Dict[Text, Any]:
+    import actions.actions
+    from actions.metrics import registry
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(concurrency, thread_name_prefix=f"bench-{scenario}")
+    # The actions' own worker threads, sized like the action server's
+    actions.actions.action_executor = executor
+    slots = asyncio.Semaphore(concurrency)
+    calls_before = Counter(bench.server.calls)
+    traced_before = registry.series("tgtg_actions_total")
+    latencies = []
+    outcomes = Counter()
+
+    async def timed(call):
+        async with slots:
+            started = time.perf_counter()
+            try:
+                if asyncio.iscoroutinefunction(call):
+                    await call()
+                else:
+                    await loop.run_in_executor(executor, call)
+                outcome = None
+            except Exception as e:
+                outcome = type(e).__name__
+            return time.perf_counter() - started, outcome
+
+    calls = [bench.request(scenario) for _ in range(requests)]
+    started = time.perf_counter()
+    for latency, outcome in await asyncio.gather(*(timed(c) for c in calls)):
+        latencies.append(latency)
+        if outcome is not None:
+            outcomes[outcome] += 1
+    elapsed = time.perf_counter() - started
+    executor.shutdown()
+    from actions.order_tracker import order_tracker
+    while order_tracker.active:
+        await asyncio.sleep(0.05)
+
+    for key, count in registry.series("tgtg_actions_total").items():
+        count -= traced_before.get(key, 0)
+        if count:
+            outcomes[dict(key)["outcome"]] += count
+    if scenario == "summarize":
+        outcomes["ok"] = requests - sum(outcomes.values())
+
+    latencies.sort()
+    upstream = Counter(bench.server.calls)
+    upstream.subtract(calls_before)
+    return {
+        "requests": requests,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": latencies[-1] * 1000 if latencies else 0.0,
+        "throughput": requests / elapsed if elapsed else 0.0,
+        "outcomes": dict(outcomes),
+        "upstream_calls": {k: v for k, v in upstream.items() if v},
+    }
+
+
+def compare(results: Dict[Text, Dict], baseline: Dict[Text, Dict]) -> List[Text]:
+    regressions = []
+    for scenario, result in results.items():
+        base = baseline.get(scenario)
+        if not base:
+            continue
+        if result["p99_ms"] > base["p99_ms"] * (1 + REGRESSION_TOLERANCE):
+            regressions.append(f"{scenario}: p99 {base['p99_ms']:.1f}ms -> {result['p99_ms']:.1f}ms")
+        if result["throughput"] < base["throughput"] * (1 - REGRESSION_TOLERANCE):
+            regressions.append(f"{scenario}: throughput {base['throughput']:.1f}/s -> {result['throughput']:.1f}/s")
+    return regressions
+
+
+def print_report(results: Dict[Text, Dict]) -> None:
+    print(f"{'scenario':<14}{'requests':>9}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}{'req/s':>10}  upstream calls")
+    for scenario, r in results.items():
+        upstream = ", ".join(f"{k}={v}" for k, v in sorted(r["upstream_calls"].items())) or "-"
+        print(f"{scenario:<14}{r['requests']:>9}{r['p50_ms']:>10.1f}{r['p99_ms']:>10.1f}"
+              f"{r['max_ms']:>10.1f}{r['throughput']:>10.1f}  {upstream}")
+        bad = {k: v for k, v in r["outcomes"].items() if k != "ok"}
+        if bad:
+            print(f"{'':<14}not ok: {bad}")
+
+
+async def main_async(args) -> Dict[Text, Dict]:
+    server = FakeTgtgServer(args.catalog, args.favorites, args.description_length, args.latency,
+                            rate_429=args.rate_429, seed=args.seed, pending_orders=args.pending_orders)
+    url = await server.start()
+
+    # Must be set before the first `actions` import: they're read at import time
+    os.environ["TGTG_API_URL"] = url
+    os.environ.setdefault("TGTG_CREDENTIAL_DB", os.path.join(tempfile.mkdtemp(prefix="tgtg-bench-"), "bench.db"))
+    os.environ.setdefault("METRICS_PORT", "0")
+
+    from actions import rate_limiter
+    if not args.prod_limits:
+        # Measure the bot, not the politeness limits towards the real API
+        rate_limiter.request_scheduler = rate_limiter.RequestScheduler(
+            global_rate=args.upstream_rps, global_burst=args.upstream_rps,
+            user_rate=args.upstream_rps, user_burst=args.upstream_rps)
+
+    from actions.order_tracker import order_tracker
+    # Actions run in threads; pending orders are followed here, without pushing to Rasa
+    order_tracker.loop = asyncio.get_running_loop()
+    order_tracker.notify = None
+
+    bench = Bench(server, args.users, args.seed)
+    bench.setup()
+    results = {}
+    try:
+        for scenario in args.scenarios:
+            results[scenario] = await run_scenario(bench, scenario, args.requests, args.concurrency)
+    finally:
+        await server.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load benchmarks against a fake TGTG API")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--catalog", type=int, default=1000)
+    parser.add_argument("--favorites", type=int, default=50, help="Favorites per user")
+    parser.add_argument("--description-length", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.05, help="Mean seconds per fake API answer")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Share of API requests answered 429")
+    parser.add_argument("--pending-orders", type=float, default=0.3,
+                        help="Share of orders the fake API confirms asynchronously")
+    parser.add_argument("--upstream-rps", type=float, default=10000, help="Rate limiter setting for the run")
+    parser.add_argument("--prod-limits", action="store_true", help="Keep the production rate limits")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("--compare", help="Baseline JSON from an earlier --json run")
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f))
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+"""
+REST channel that runs the keyword router (actions/keyword_router.py) before NLU.
+
+Enabled in credentials.yml:
+    channels.routed_rest.RoutedRestInput:
+
+and used exactly like the rest channel, on /webhooks/routed_rest/webhook.
+Routed messages reach Rasa as `/intent{"store": ...}` and skip the NLU pipeline;
+everything else is passed through unchanged.
+"""
+from typing import Optional, Text
+
+from rasa.core.channels.rest import RestInput
+from sanic.request import Request
+
+from actions.keyword_router import keyword_router
+
+
+class RoutedRestInput(RestInput):
+
+    @classmethod
+    def name(cls) -> Text:
+        return "routed_rest"
+
+    def _extract_message(self, req: Request) -> Optional[Text]:
+        text = super()._extract_message(req)
+        return keyword_router.rewrite(req.json.get("sender"), text)
@@ -0,0 +1,29 @@
+import pytest
+
+from actions import coordination, rate_limiter
+
+
+@pytest.fixture(autouse=True)
+def offline(monkeypatch):
+    # Clients skip the Play Store version lookup and never reach the real API
+    monkeypatch.setattr(rate_limiter, "TGTG_API_URL", "http://tgtg.test/api/")
+    monkeypatch.setattr(rate_limiter, "request_scheduler", rate_limiter.RequestScheduler())
+
+
+@pytest.fixture
+def coordinator(tmp_path, monkeypatch):
+    c = coordination.SQLiteCoordinator(str(tmp_path / "coordination.db"))
+    monkeypatch.setattr(coordination, "_coordinator", c)
+    return c
+
+
+class FakeResponse:
+
+    def __init__(self, status_code=200, body=None, headers=None):
+        self.status_code = status_code
+        self._body = body if body is not None else {}
+        self.headers = headers or {}
+        self.content = repr(self._body).encode()
+
+    def json(self):
+        return self._body
@@ -0,0 +1,130 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from rasa_sdk import Tracker
+from rasa_sdk.executor import CollectingDispatcher
+
+from actions import actions
+from actions.auto_reserve import DEFAULT_DAILY_SPEND_CAP, AutoReserveStore
+from actions.monitor import WatchStore
+from actions.user_prefs import PrefsStore
+from actions.rate_limiter import Priority, _current_priority, request_priority
+
+
+class FakeManager:
+
+    def get_client(self, user_id):
+        return object()
+
+    def save_if_changed(self, user_id, client):
+        return False
+
+
+class BlockingAction(actions.ActionTgtgBase):
+    """
+    Stands in for an action waiting on the rate limiter.
+    """
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.seen = {}
+
+    def name(self):
+        return "action_blocking"
+
+    def run_authenticated(self, dispatcher, tracker, domain, client):
+        self.seen["thread"] = threading.current_thread().name
+        self.seen["priority"] = _current_priority.get()
+        self.release.wait(5)
+        dispatcher.utter_message(text="done")
+        return []
+
+
+def tracker_for(user_id, entities=()):
+    message = {"entities": [{"entity": name, "value": value} for name, value in entities]}
+    return Tracker(user_id, {}, message, [], False, None, {}, "action_listen")
+
+
+@pytest.fixture(autouse=True)
+def manager(monkeypatch):
+    monkeypatch.setattr(actions, "tgtg_manager", FakeManager())
+    monkeypatch.setattr(actions.order_tracker, "loop", None)
+
+
+def test_blocked_action_does_not_stall_the_loop():
+    action = BlockingAction()
+
+    async def scenario():
+        dispatcher = CollectingDispatcher()
+        turn = asyncio.ensure_future(action.run(dispatcher, tracker_for("alice"), {}))
+        # Other users' turns keep being served while this one waits
+        started = time.monotonic()
+        for _ in range(5):
+            await asyncio.sleep(0.01)
+        stalled = time.monotonic() - started
+        action.release.set()
+        assert await turn == []
+        return stalled, dispatcher.messages
+
+    stalled, messages = asyncio.run(scenario())
+    assert stalled < 1
+    assert messages[0]["text"] == "done"
+    assert action.seen["thread"].startswith("action")
+
+
+def test_body_sees_the_turn_context():
+    action = BlockingAction()
+    action.release.set()
+
+    async def scenario():
+        with request_priority(Priority.CHECKOUT):
+            await action.run(CollectingDispatcher(), tracker_for("alice"), {})
+        return actions.order_tracker.loop is asyncio.get_running_loop()
+
+    assert asyncio.run(scenario())
+    assert action.seen["priority"] == Priority.CHECKOUT
+
+
+def bag_payload():
+    return {"item": {"item_id": "1", "item_price": {"minor_units": 350, "decimals": 2, "code": "GBP"},
+                     "item_value": {"minor_units": 1200, "decimals": 2}},
+            "store": {"store_name": "Greggs", "store_location": {"address": {"address_line": "1 High St"}}},
+            "items_available": 0}
+
+
+@pytest.fixture
+def auto_reserve(tmp_path, monkeypatch):
+    monkeypatch.setattr(actions, "prefs_store", PrefsStore(str(tmp_path / "prefs.db"), ttl=0))
+    action = actions.ActionEnableAutoReserve()
+    action.watches = WatchStore(str(tmp_path / "watches.db"))
+    action.auto_reserve = AutoReserveStore(str(tmp_path / "auto.db"))
+    action.find_store = lambda *args: bag_payload()
+    return action
+
+
+def arm(action, *entities):
+    dispatcher = CollectingDispatcher()
+    action.run_authenticated(dispatcher, tracker_for("alice", (("store", "Greggs"),) + entities), {}, object())
+    [armed] = action.auto_reserve.by_item()["1"]
+    return armed.daily_spend_cap, dispatcher.messages[-1]["text"]
+
+
+def test_auto_reserve_uses_the_saved_spend_cap(auto_reserve):
+    assert arm(auto_reserve)[0] == DEFAULT_DAILY_SPEND_CAP
+
+    actions.ActionSetPreferences().run(CollectingDispatcher(), tracker_for("alice", [("spend_cap", "£25")]), {})
+    cap, text = arm(auto_reserve)
+    assert cap == 25.0
+    assert "max £25.00 per day" in text
+
+    # A cap given with the request wins over the saved one
+    assert arm(auto_reserve, ("spend_cap", "8"))[0] == 8.0
+
+
+def test_invalid_spend_cap_is_ignored():
+    assert actions.parse_spend_cap("12,50") == 12.5
+    assert actions.parse_spend_cap("-3") is None
+    assert actions.parse_spend_cap("lots") is None
+    assert actions.parse_spend_cap(None) is None
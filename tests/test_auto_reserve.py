@@ -0,0 +1,120 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from actions.auto_reserve import AutoReserver, AutoReserveStore
+from actions.order_tracker import OrderTracker
+
+
+class FakeClient:
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.orders = []
+        self._lock = threading.Lock()
+
+    def create_order(self, item_id, quantity):
+        time.sleep(0.05)  # both restocks are in flight at once
+        if self.fail:
+            raise RuntimeError("sold out")
+        with self._lock:
+            self.orders.append((item_id, quantity))
+            return {"id": f"order-{len(self.orders)}", "state": "RESERVED"}
+
+
+class FakeManager:
+
+    def __init__(self, client):
+        self.client = client
+
+    def get_client(self, user_id):
+        return self.client
+
+
+def payload(available=3, price_minor=1000):
+    return {"items_available": available, "item": {"item_price": {"minor_units": price_minor, "decimals": 2}}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return AutoReserveStore(str(tmp_path / "auto.db"))
+
+
+def reserver(store, client):
+    messages = []
+
+    async def notify(user_id, text):
+        messages.append((user_id, text))
+
+    r = AutoReserver(store, FakeManager(client), OrderTracker(notify=notify))
+    r.messages = messages
+    return r
+
+
+def test_concurrent_restocks_stay_within_spend_cap(store):
+    client = FakeClient()
+    store.arm("alice", "1", "Greggs", daily_spend_cap=15.0)
+    store.arm("alice", "2", "Pret", daily_spend_cap=15.0)
+    r = reserver(store, client)
+    r.reload()
+
+    async def both():
+        now = time.monotonic()
+        return await asyncio.gather(r.fire("1", payload(), now), r.fire("2", payload(), now))
+
+    results = asyncio.run(both())
+
+    assert sum(len(users) for users in results) == 1
+    assert len(client.orders) == 1
+    assert store.spent_since("alice", 0) == pytest.approx(10.0)
+
+
+def test_quantity_is_cut_down_to_the_budget(store):
+    client = FakeClient()
+    store.arm("alice", "1", "Greggs", max_quantity=3, daily_spend_cap=25.0)
+    r = reserver(store, client)
+    r.reload()
+
+    asyncio.run(r.fire("1", payload(), time.monotonic()))
+
+    assert client.orders == [("1", 2)]
+
+
+def test_failed_order_gives_the_budget_back(store):
+    store.arm("alice", "1", "Greggs", daily_spend_cap=15.0)
+    r = reserver(store, FakeClient(fail=True))
+    r.reload()
+
+    assert asyncio.run(r.fire("1", payload(), time.monotonic())) == []
+    assert store.spent_since("alice", 0) == 0
+    assert r.is_armed("1")
+
+
+def test_item_is_disarmed_after_its_order(store):
+    client = FakeClient()
+    store.arm("alice", "1", "Greggs", daily_spend_cap=100.0)
+    r = reserver(store, client)
+    r.reload()
+
+    asyncio.run(r.fire("1", payload(), time.monotonic()))
+    asyncio.run(r.fire("1", payload(), time.monotonic()))
+
+    assert len(client.orders) == 1
+    assert not r.is_armed("1")
+    assert store.by_item() == {}
+    assert "re-arm" in r.messages[0][1]
+
+
+def test_bags_go_to_the_first_armed_users(store):
+    client = FakeClient()
+    store.arm("alice", "1", "Greggs", max_quantity=2)
+    store.arm("bob", "1", "Greggs", max_quantity=2)
+    r = reserver(store, client)
+    r.reload()
+
+    ordered = asyncio.run(r.fire("1", payload(available=2, price_minor=100), time.monotonic()))
+
+    assert ordered == ["alice"]
+    assert client.orders == [("1", 2)]
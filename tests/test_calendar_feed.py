@@ -0,0 +1,116 @@
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from actions import calendar_feed
+from actions.calendar_feed import CalendarStore, refresh_all
+
+
+def order(order_id, start="2030-05-01T17:00:00Z", end="2030-05-01T17:30:00Z", quantity=1):
+    return {"order_id": order_id, "store_name": "Greggs", "store_branch": "Camden", "quantity": quantity,
+            "item_name": "Surprise Bag", "pickup_interval": {"start": start, "end": end}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CalendarStore(str(tmp_path / "calendar.db"))
+
+
+def etag_of(store, user_id):
+    return store.feed_of(store.subscribe(user_id))[1]
+
+
+def test_etag_changes_only_with_events(store):
+    store.subscribe("alice")
+    empty = etag_of(store, "alice")
+    assert store.sync_orders("alice", [order("1"), order("2")]) == 2
+    first = etag_of(store, "alice")
+    assert first != empty
+
+    assert store.sync_orders("alice", [order("1"), order("2")]) == 0
+    assert etag_of(store, "alice") == first
+
+    assert store.sync_orders("alice", [order("1", quantity=2)]) == 2  # one changed, one gone
+    assert etag_of(store, "alice") not in (first, empty)
+
+
+def test_render_streams_stored_events(store):
+    store.subscribe("alice")
+    store.sync_orders("alice", [order("2", start="2030-05-02T17:00:00Z"), order("1")])
+    feed = "".join(store.render("alice"))
+    assert feed.startswith("BEGIN:VCALENDAR\r\n") and feed.endswith("END:VCALENDAR\r\n")
+    assert feed.index("UID:order-1@") < feed.index("UID:order-2@")
+    assert "SUMMARY:Pick up: Greggs — Camden" in feed
+
+
+def test_feeds_keyset_pages_cover_every_user_once(store):
+    users = [f"user-{i:02d}" for i in range(7)]
+    for user_id in reversed(users):
+        store.subscribe(user_id)
+    assert [user_id for user_id, _, _ in store.feeds(page_size=3)] == users
+    assert [user_id for user_id, _, _ in store.feeds(page_size=7)] == users
+
+
+def test_refresh_all_counts_each_feed(store):
+    class Client:
+        def __init__(self, user_id):
+            self.user_id = user_id
+
+        def get_active(self):
+            if self.user_id == "c":
+                raise RuntimeError("upstream down")
+            return {"orders": [order(self.user_id)]}
+
+    class Manager:
+        def __init__(self):
+            self.saved = []
+
+        def get_client(self, user_id):
+            return None if user_id == "e" else Client(user_id)
+
+        def save_if_changed(self, user_id, client):
+            self.saved.append(user_id)
+
+    for user_id in "abcde":
+        store.subscribe(user_id)
+    manager = Manager()
+    assert refresh_all(manager, store) == {"feeds": 5, "changed": 3, "failed": 1, "skipped": 1}
+    assert manager.saved == ["a", "b", "d"]
+
+
+@pytest.fixture
+def server(store, monkeypatch):
+    monkeypatch.setattr(calendar_feed._FeedHandler, "store", store)
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), calendar_feed._FeedHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def get(url, etag=None):
+    request = urllib.request.Request(url, headers={"If-None-Match": etag} if etag else {})
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status, response.headers.get("ETag"), response.read().decode()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers.get("ETag"), ""
+
+
+def test_server_answers_304_while_etag_unchanged(store, server):
+    token = store.subscribe("alice")
+    store.sync_orders("alice", [order("1")])
+    url = f"{server}/calendar/{token}.ics"
+
+    status, etag, body = get(url)
+    assert status == 200 and "UID:order-1@" in body
+    assert get(url, etag)[:2] == (304, etag)
+
+    store.sync_orders("alice", [order("1"), order("2")])
+    status, new_etag, body = get(url, etag)
+    assert status == 200 and new_etag != etag and "UID:order-2@" in body
+
+    assert get(f"{server}/calendar/unknown.ics")[0] == 404
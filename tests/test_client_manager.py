@@ -0,0 +1,95 @@
+import threading
+
+import pytest
+
+from actions.client_manager import ClientPool, PooledTgtgClient, TGTGManager
+from actions.credential_store import SQLiteCredentialStore
+from conftest import FakeResponse
+
+
+class CountingStore(SQLiteCredentialStore):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reads = self.writes = 0
+
+    def get(self, user_id):
+        self.reads += 1
+        return super().get(user_id)
+
+    def put(self, user_id, credentials):
+        self.writes += 1
+        super().put(user_id, credentials)
+
+
+@pytest.fixture
+def manager(tmp_path, coordinator):
+    store = CountingStore(str(tmp_path / "credentials.db"))
+    for user_id in ("alice", "bob", "carol"):
+        store.put(user_id, {"access_token": f"access-{user_id}", "refresh_token": "r", "cookie": "c"})
+    store.reads = store.writes = 0
+    return TGTGManager(store=store, pool=ClientPool(max_clients=2))
+
+
+def test_pool_hit_reads_no_storage(manager):
+    client = manager.get_client("alice")
+    assert manager.get_client("alice") is client
+    assert manager.store.reads == 1
+
+
+def test_least_recently_used_client_is_evicted(manager):
+    alice, bob = manager.get_client("alice"), manager.get_client("bob")
+    manager.get_client("alice")
+    carol = manager.get_client("carol")
+    assert manager.pool.peek("bob") is None
+    assert manager.pool.peek("alice") is alice and manager.pool.peek("carol") is carol
+    assert bob._retired and not alice._retired
+
+
+def test_idle_clients_are_evicted(manager):
+    manager.pool.idle_timeout = 60
+    alice = manager.get_client("alice")
+    alice.last_used -= 61
+    bob = manager.get_client("bob")
+    assert manager.pool.get("bob") is bob
+    assert manager.pool.peek("alice") is None and alice._retired
+
+
+def test_dirty_tokens_are_saved_once(manager):
+    client = manager.get_client("alice")
+    assert not manager.save_if_changed("alice", client)
+    assert manager.store.writes == 0
+
+    client.access_token = "access-2"  # what the library does on a refresh
+    assert client.dirty
+    assert manager.save_if_changed("alice", client)
+    assert manager.store.get("alice")["access_token"] == "access-2"
+    assert not client.dirty
+    assert not manager.save_if_changed("alice", client)
+    assert manager.store.writes == 1
+
+
+def test_evicted_client_in_use_is_closed_after_its_request(manager, monkeypatch):
+    alice = manager.get_client("alice")
+    sending, release = threading.Event(), threading.Event()
+    closes = []
+    monkeypatch.setattr(PooledTgtgClient, "_close_session", lambda client: closes.append(client))
+
+    def request(session, method, url, **kwargs):
+        sending.set()
+        release.wait(5)
+        return FakeResponse(200, {"items": []})
+
+    monkeypatch.setattr("requests.Session.request", request)
+    worker = threading.Thread(target=lambda: alice.session.post(alice.base_url + "item/v8/", json={}))
+    worker.start()
+    assert sending.wait(5)
+
+    manager.pool.discard("alice")
+    assert closes == []            # still sending: not closed under its feet
+    release.set()
+    worker.join(5)
+    assert closes == [alice]
+
+    manager.get_client("bob").close()
+    assert len(closes) == 2        # idle clients close right away
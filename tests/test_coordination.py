@@ -0,0 +1,64 @@
+import time
+from collections import Counter
+
+from actions.coordination import HashRing, SQLiteCoordinator, user_lock
+
+
+def test_ring_splits_items_evenly():
+    ring = HashRing(["worker-a", "worker-b", "worker-c"])
+    owners = Counter(ring.owner(str(item_id)) for item_id in range(3000))
+    assert set(owners) == {"worker-a", "worker-b", "worker-c"}
+    assert all(800 < count < 1200 for count in owners.values())
+
+
+def test_ring_only_moves_the_leaving_members_items():
+    items = [str(i) for i in range(2000)]
+    before = HashRing(["worker-a", "worker-b", "worker-c"])
+    after = HashRing(["worker-a", "worker-b"])
+    for item in items:
+        if before.owner(item) != "worker-c":
+            assert after.owner(item) == before.owner(item)
+
+
+def test_empty_ring_has_no_owner():
+    assert HashRing([]).owner("1") is None
+
+
+def test_lease_is_exclusive_until_released(tmp_path):
+    a = SQLiteCoordinator(str(tmp_path / "c.db"))
+    b = SQLiteCoordinator(str(tmp_path / "c.db"))
+    token = a.try_acquire("poll:1", 60)
+    assert token is not None
+    assert b.try_acquire("poll:1", 60) is None
+    b.release("poll:1", "someone-else")
+    assert b.try_acquire("poll:1", 60) is None
+    a.release("poll:1", token)
+    assert b.try_acquire("poll:1", 60) is not None
+
+
+def test_expired_lease_is_taken_over(tmp_path):
+    c = SQLiteCoordinator(str(tmp_path / "c.db"))
+    assert c.try_acquire("poll:1", 0.01) is not None
+    time.sleep(0.02)
+    assert c.try_acquire("poll:1", 60) is not None
+
+
+def test_members_are_the_workers_with_a_recent_heartbeat(tmp_path):
+    c = SQLiteCoordinator(str(tmp_path / "c.db"))
+    c.heartbeat("worker-a")
+    c.heartbeat("worker-b")
+    c.leave("worker-b")
+    assert c.members(60) == ["worker-a"]
+    time.sleep(0.02)
+    assert c.members(0.01) == []
+
+
+def test_user_lock_waits_for_the_holder(coordinator):
+    token = coordinator.try_acquire("user:alice", 60)
+    with user_lock("alice", wait=0.05) as locked:
+        assert not locked
+    coordinator.release("user:alice", token)
+    with user_lock("alice", wait=0.05) as locked:
+        assert locked
+        assert coordinator.try_acquire("user:alice", 60) is None
+    assert coordinator.try_acquire("user:alice", 60) is not None
@@ -0,0 +1,89 @@
+import json
+import os
+import threading
+
+import pytest
+
+from actions.credential_store import CredentialStore, JsonCredentialStore, SQLiteCredentialStore, migrate
+
+
+def creds(n, **extra):
+    return {"access_token": f"access-{n}", "refresh_token": f"refresh-{n}", "cookie": f"cookie-{n}", **extra}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SQLiteCredentialStore(str(tmp_path / "credentials.db"))
+
+
+def test_upsert_replaces_one_row(store):
+    store.put("alice", creds(1))
+    store.put("bob", creds(1))
+    store.put("alice", creds(2, refreshed_at=100.0))
+    assert store.get("alice") == creds(2, refreshed_at=100.0)
+    assert store.get("bob") == creds(1)
+    assert sorted(user_id for user_id, _ in store.items()) == ["alice", "bob"]
+
+    store.delete("alice")
+    assert store.get("alice") is None
+    assert store.get("nobody") is None
+
+
+def test_rows_are_shared_across_threads(store):
+    store.put("alice", creds(1))
+    seen = []
+    worker = threading.Thread(target=lambda: seen.append(store.get("alice")))
+    worker.start()
+    worker.join()
+    assert seen == [creds(1)]
+
+
+def fill_due(store):
+    store.put("never", creds(1))                                   # old record: no refreshed_at
+    store.put("old", creds(1, refreshed_at=100.0))
+    store.put("older", creds(1, refreshed_at=50.0))
+    store.put("fresh", creds(1, refreshed_at=1000.0))
+    store.put("dead", creds(1, refreshed_at=10.0, login_required=True))
+
+
+def test_due_oldest_first_without_dead_tokens(store):
+    fill_due(store)
+    assert store.due(500.0, 10) == ["never", "older", "old"]
+    assert store.due(500.0, 2) == ["never", "older"]
+    assert store.due(0.0, 10) == []
+
+
+def test_sqlite_due_matches_the_generic_one(store, tmp_path):
+    fill_due(store)
+    generic = JsonCredentialStore(str(tmp_path / "credentials.json"))
+    migrate(store, generic)
+    for refreshed_before, limit in ((500.0, 10), (60.0, 10), (2000.0, 3)):
+        assert store.due(refreshed_before, limit) == CredentialStore.due(generic, refreshed_before, limit)
+
+
+def test_json_store_writes_atomically(tmp_path, monkeypatch):
+    path = tmp_path / "credentials.json"
+    store = JsonCredentialStore(str(path))
+    store.put("alice", creds(1))
+
+    def crash(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(json, "dump", crash)
+    with pytest.raises(OSError):
+        store.put("bob", creds(2))
+    # The old file is intact and no temp file is left behind
+    assert json.loads(path.read_text()) == {"alice": creds(1)}
+    assert os.listdir(tmp_path) == ["credentials.json"]
+    assert JsonCredentialStore(str(path)).get("alice") == creds(1)
+
+
+def test_migrate_copies_every_user(tmp_path, store):
+    path = tmp_path / "legacy.json"
+    path.write_text(json.dumps({"alice": creds(1), "bob": creds(2, refreshed_at=5.0)}))
+    assert migrate(JsonCredentialStore(str(path)), store) == 2
+    assert store.get("alice") == creds(1)
+    assert store.get("bob") == creds(2, refreshed_at=5.0)
+    # Running it again is harmless
+    assert migrate(JsonCredentialStore(str(path)), store) == 2
+    assert len(list(store.items())) == 2
@@ -0,0 +1,121 @@
+from types import SimpleNamespace
+
+import pytest
+
+from actions import favorites_cache as favorites_module
+from actions.favorites_cache import FavoritesCache
+from actions.rate_limiter import Priority, _current_priority, request_priority
+from actions.stock_cache import InMemoryStockCache
+
+
+def payload(item_id, available=1):
+    return {"item": {"item_id": str(item_id)}, "store": {"store_name": f"Store {item_id}", "branch": None},
+            "items_available": available}
+
+
+class FakeClient:
+
+    def __init__(self, items):
+        self.items = items
+        self.calls = []
+
+    def get_items(self):
+        self.calls.append(("get_items", _current_priority.get()))
+        return [dict(i) for i in self.items]
+
+    def get_item(self, item_id):
+        self.calls.append(("get_item", item_id))
+        return next(dict(i) for i in self.items if i["item"]["item_id"] == item_id)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(favorites_module, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+@pytest.fixture
+def stock():
+    return InMemoryStockCache(ttl=3600)
+
+
+@pytest.fixture
+def cache(stock):
+    return FavoritesCache(ttl=45, membership_ttl=600, stock=stock)
+
+
+def test_fresh_snapshot_is_served_from_memory(cache, clock):
+    client = FakeClient([payload(1), payload(2)])
+    first = cache.get_snapshot("alice", client)
+    clock[0] += 44
+    assert cache.get_snapshot("alice", client) is first
+    assert client.calls == [("get_items", Priority.INTERACTIVE)]
+
+
+def test_stale_snapshot_is_rebuilt_from_the_stock_cache(cache, stock, clock):
+    client = FakeClient([payload(1), payload(2)])
+    first = cache.get_snapshot("alice", client)
+    index = first.index
+    # Another user's fetch (or the monitor) updated item 2's stock meanwhile
+    stock.put(payload(2, available=0))
+    clock[0] += 46
+
+    snapshot = cache.get_snapshot("alice", client)
+    assert snapshot is not first
+    assert [p["items_available"] for p in snapshot.items] == [1, 0]
+    assert client.calls == [("get_items", Priority.INTERACTIVE)]
+    # Same favorites list: the store index is reused, not rebuilt
+    assert snapshot.listed_at == first.listed_at
+    assert snapshot.index is index
+
+
+def test_few_missing_items_are_fetched_one_by_one(cache, stock, clock):
+    client = FakeClient([payload(i) for i in range(1, 6)])
+    cache.get_snapshot("alice", client)
+    stock._entries.pop("3")
+    clock[0] += 46
+    cache.get_snapshot("alice", client)
+    assert client.calls[1:] == [("get_item", "3")]
+
+
+def test_many_missing_items_fall_back_to_get_items(cache, stock, clock):
+    client = FakeClient([payload(i) for i in range(1, 6)])
+    cache.get_snapshot("alice", client)
+    for item_id in "1234":
+        stock._entries.pop(item_id)
+    clock[0] += 46
+    cache.get_snapshot("alice", client)
+    assert [c[0] for c in client.calls] == ["get_items", "get_items"]
+
+
+def test_membership_expiry_lists_favorites_again(cache, clock):
+    client = FakeClient([payload(1)])
+    cache.get_snapshot("alice", client)
+    clock[0] += 601
+    client.items = [payload(1), payload(7)]
+    assert [p["item"]["item_id"] for p in cache.get_items("alice", client)] == ["1", "7"]
+    assert [c[0] for c in client.calls] == ["get_items", "get_items"]
+
+
+def test_forced_refresh_goes_upstream_at_checkout_priority(cache, stock, clock):
+    client = FakeClient([payload(1)])
+    cache.get_snapshot("alice", client)
+    client.items = [payload(1, available=0)]
+    with request_priority(Priority.CHECKOUT):
+        items = cache.get_items("alice", client, force_refresh=True)
+    assert items[0]["items_available"] == 0
+    assert client.calls[-1] == ("get_items", Priority.CHECKOUT)
+    # Everybody else sees the checkout's numbers
+    assert stock.get("1")["items_available"] == 0
+    assert cache.peek("alice").items[0]["items_available"] == 0
+
+
+def test_least_recently_used_users_are_dropped(stock, clock):
+    cache = FavoritesCache(max_users=2, stock=stock)
+    for user_id in ("alice", "bob"):
+        cache.get_snapshot(user_id, FakeClient([payload(1)]))
+    cache.peek("alice")
+    cache.get_snapshot("carol", FakeClient([payload(1)]))
+    assert cache.peek("bob") is None
+    assert cache.peek("alice") is not None and cache.peek("carol") is not None
@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from actions.keyword_router import GazetteerStore, KeywordRouter, build_templates, load_templates
+
+NLU = [
+    {"intent": "check_availability", "examples": "- check [Greggs](store)\n- is there anything at [Pret](store)?\n"},
+    {"intent": "list_available", "examples": "- what's available right now?\n"},
+    {"intent": "reserve_order", "examples": "- reserve [2](quantity) bags at [Pret](store)\n"},
+    {"intent": "greet", "examples": "- hello\n"},
+]
+
+
+def item(store_name, branch=None):
+    return {"store": {"store_name": store_name, "branch": branch}}
+
+
+@pytest.fixture
+def router(tmp_path):
+    store = GazetteerStore(str(tmp_path / "gazetteer.db"))
+    store.put("alice", [item("Greggs", "Camden"), item("Café Nero", "Soho"), item("Café Nero", "Oxford Street")])
+    return KeywordRouter(build_templates(NLU), store)
+
+
+def test_routes_favorite_store(router):
+    assert router.rewrite("alice", "Check greggs") == "/check_availability" + json.dumps({"store": "Greggs — Camden"})
+    assert router.rewrite("alice", "What's available right now?") == "/list_available"
+    assert router.stats == {"routed": 2, "fallback": 0}
+
+
+@pytest.mark.parametrize("user_id, text", [
+    ("alice", "check Starbucks"),              # not a favorite
+    ("alice", "check cafe nero"),              # two branches match equally
+    ("bob", "check greggs"),                   # favorites never listed
+    (None, "check greggs"),
+    ("alice", "reserve 2 bags at greggs"),     # other entities are left to the model
+    ("alice", "hello"),                        # intent the router doesn't answer
+    ("alice", "tell me about greggs history"),
+    ("alice", '/check_availability{"store": "Greggs"}'),
+])
+def test_falls_back_to_the_model(router, user_id, text):
+    assert router.rewrite(user_id, text) == text
+    assert router.stats["routed"] == 0
+
+
+def test_routed_message_carries_store_as_json(router):
+    message = router.rewrite("alice", "is there anything at cafe nero soho?")
+    intent, _, entities = message.partition("{")
+    assert intent == "/check_availability"
+    assert json.loads("{" + entities) == {"store": "Café Nero — Soho"}
+
+
+def test_gazetteer_update_reaches_router(router):
+    assert router.rewrite("alice", "check pret") == "check pret"
+    router.store.put("alice", [item("Pret A Manger")])
+    assert router.rewrite("alice", "check pret a manger") == '/check_availability{"store": "Pret A Manger"}'
+
+
+def test_repo_templates_load():
+    templates = load_templates()
+    assert templates.exact or templates.affixes
+
+
+def test_gazetteer_follows_fetched_favorites(tmp_path):
+    from actions.favorites_cache import FavoritesCache
+    from actions.stock_cache import InMemoryStockCache
+
+    class Client:
+        def get_items(self):
+            return [{"item": {"item_id": "1"}, "store": {"store_name": "Greggs", "branch": "Camden"}}]
+
+    store = GazetteerStore(str(tmp_path / "gazetteer.db"))
+    cache = FavoritesCache(stock=InMemoryStockCache())
+    cache.subscribe(store.put)
+    router = KeywordRouter(build_templates(NLU), store)
+    assert router.rewrite("carol", "check greggs") == "check greggs"
+
+    cache.get_items("carol", Client())
+    cache._notifier.submit(lambda: None).result(5)  # listeners are done
+    assert router.rewrite("carol", "check greggs") == "/check_availability" + json.dumps({"store": "Greggs — Camden"})
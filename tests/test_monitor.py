@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+from actions import monitor as monitor_module
+from actions.auto_reserve import AutoReserver, AutoReserveStore
+from actions.monitor import StockMonitor, WatchStore
+from actions.notifications import NotificationDispatcher, StubChannel
+from actions.restock_history import HistoryStore
+
+
+class FakeClient:
+
+    def __init__(self, stock):
+        self.stock = stock
+        self.fetched = []
+
+    def get_item(self, item_id):
+        self.fetched.append(item_id)
+        return {"item": {"item_id": item_id}, "items_available": self.stock[item_id],
+                "store": {"store_name": "Greggs", "store_time_zone": "Europe/London"}}
+
+
+class FakeManager:
+
+    def __init__(self, clients):
+        self.clients = clients
+
+    def get_client(self, user_id):
+        return self.clients.get(user_id)
+
+    def save_if_changed(self, user_id, client):
+        return False
+
+
+@pytest.fixture
+def monitor(tmp_path, coordinator, monkeypatch):
+    # Each tick stands for a poll a full interval later: the previous lease is over
+    monkeypatch.setattr(monitor_module, "POLL_LEASE", 0)
+    stock = {"1": 0, "2": 0}
+    client = FakeClient(stock)
+    # "carol" never logged in: her watch still counts, another watcher's client fetches
+    manager = FakeManager({"alice": client, "bob": client})
+    watches = WatchStore(str(tmp_path / "watches.db"))
+    watches.add("carol", "1", "Greggs")
+    watches.add("alice", "1", "Greggs")
+    watches.add("bob", "1", "Greggs", min_available=5)
+    watches.add("bob", "2", "Pret")
+    channel = StubChannel()
+    m = StockMonitor(watches=watches, manager=manager, history=HistoryStore(str(tmp_path / "history.db")),
+                     auto_reserver=AutoReserver(AutoReserveStore(str(tmp_path / "auto.db")), manager),
+                     notifications=NotificationDispatcher(channel, max_workers=2, retry_delay=0),
+                     worker_id="worker-1", coordinator=coordinator, max_rps=1000)
+    m.stock, m.client, m.channel = stock, client, channel
+    return m
+
+
+def tick(monitor, *item_ids):
+    async def run():
+        monitor._semaphore = asyncio.Semaphore(monitor.max_concurrent)
+        await monitor.notifications.start()
+        for item_id in item_ids:
+            await monitor.check_item(item_id)
+        await monitor.notifications.close()
+    asyncio.run(run())
+    return sorted(monitor.channel.sent)
+
+
+def test_watchers_of_an_item_share_one_fetch(monitor):
+    monitor.reload()
+    assert sorted(w.user_id for w in monitor._watchers["1"]) == ["alice", "bob", "carol"]
+    tick(monitor, "1", "2")
+    assert monitor.client.fetched == ["1", "2"]
+
+
+def test_restock_notifies_watchers_whose_threshold_is_crossed(monitor):
+    monitor.reload()
+    assert tick(monitor, "1") == []            # first look: nothing to compare against
+
+    monitor.stock["1"] = 3
+    sent = tick(monitor, "1")
+    assert [user_id for user_id, _ in sent] == ["alice", "carol"]
+    assert "Greggs has 3 bags available" in sent[0][1]
+
+    monitor.channel.sent.clear()
+    monitor.stock["1"] = 6
+    assert [user_id for user_id, _ in tick(monitor, "1")] == ["bob"]
+
+
+def test_no_alert_without_a_transition(monitor):
+    monitor.stock["1"] = 2
+    monitor.reload()
+    tick(monitor, "1")
+    assert tick(monitor, "1") == []
+    monitor.stock["1"] = 0
+    assert tick(monitor, "1") == []
+
+
+def test_another_worker_polling_skips_the_fetch(monitor):
+    monitor.reload()
+    monitor.coordinator.try_acquire("poll:1", 60)
+    tick(monitor, "1")
+    assert monitor.client.fetched == []
+
+
+def test_handed_over_item_continues_from_recorded_stock(monitor, tmp_path, coordinator):
+    monitor.reload()
+    tick(monitor, "1")
+    monitor.history.flush()
+
+    # A new worker (after a restart or a handover) sees the restock right away
+    other = StockMonitor(watches=monitor.watches, manager=monitor.manager, history=monitor.history,
+                         auto_reserver=monitor.auto_reserver,
+                         notifications=NotificationDispatcher(monitor.channel, max_workers=2, retry_delay=0),
+                         worker_id="worker-1", coordinator=coordinator, max_rps=1000)
+    other.stock, other.client, other.channel = monitor.stock, monitor.client, monitor.channel
+    other.reload()
+    monitor.stock["1"] = 1
+    assert [user_id for user_id, _ in tick(other, "1")] == ["alice", "carol"]
@@ -0,0 +1,76 @@
+import asyncio
+
+from actions.notifications import NotificationDispatcher, StubChannel, relogin_event, restock_event
+
+
+class FlakyChannel(StubChannel):
+    """
+    Fails the first `failures[user_id]` sends to each user.
+    """
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = dict(failures)
+
+    async def send(self, user_id, text):
+        self.attempts += 1
+        if self.failures.get(user_id, 0) > 0:
+            self.failures[user_id] -= 1
+            return False
+        self.sent.append((user_id, text))
+        return True
+
+
+def dispatch(dispatcher, *batches):
+    async def run():
+        await dispatcher.start()
+        queued = [await dispatcher.publish(event, users) for event, users in batches]
+        await dispatcher.close()
+        return queued
+    return asyncio.run(run())
+
+
+def test_same_event_reaches_each_user_once():
+    channel = StubChannel()
+    dispatcher = NotificationDispatcher(channel, max_workers=4)
+    event = restock_event("1", "Greggs", 3)
+    queued = dispatch(dispatcher, (event, ["alice", "bob", "alice"]), (event, ["bob", "carol"]))
+
+    assert queued == [2, 1]
+    assert sorted(user_id for user_id, _ in channel.sent) == ["alice", "bob", "carol"]
+    assert dispatcher.stats["deduped"] == 2
+
+
+def test_other_events_are_not_deduped():
+    channel = StubChannel()
+    dispatcher = NotificationDispatcher(channel, max_workers=2)
+    dispatch(dispatcher, (restock_event("1", "Greggs", 3), ["alice"]),
+             (restock_event("2", "Pret", 1), ["alice"]), (relogin_event(), ["alice"]))
+    assert len(channel.sent) == 3
+
+
+def test_dedup_window_expires():
+    channel = StubChannel()
+    dispatcher = NotificationDispatcher(channel, max_workers=1, dedup_window=0)
+    event = restock_event("1", "Greggs", 3)
+    dispatch(dispatcher, (event, ["alice"]), (event, ["alice"]))
+    assert len(channel.sent) == 2
+
+
+def test_failed_sends_are_retried_then_given_up():
+    channel = FlakyChannel({"alice": 2, "bob": 5})
+    dispatcher = NotificationDispatcher(channel, max_workers=2, max_attempts=3, retry_delay=0.001)
+    dispatch(dispatcher, (restock_event("1", "Greggs", 3), ["alice", "bob", "carol"]))
+
+    assert sorted(user_id for user_id, _ in channel.sent) == ["alice", "carol"]
+    assert dispatcher.stats == {"sent": 2, "failed": 1, "retried": 4, "deduped": 0}
+    assert channel.attempts == 7
+
+
+def test_message_rendered_per_locale():
+    channel = StubChannel()
+    dispatcher = NotificationDispatcher(channel, max_workers=1,
+                                        locale_of=lambda user_id: "fr" if user_id == "amelie" else "en")
+    dispatch(dispatcher, (restock_event("1", "Greggs", 3), ["amelie", "bob"]))
+    # No French template yet: both fall back to English
+    assert {text for _, text in channel.sent} == {"🔔 Greggs has 3 bags available right now!"}
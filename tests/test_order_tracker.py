@@ -0,0 +1,70 @@
+import asyncio
+import threading
+
+from actions.order_tracker import OrderTracker
+
+
+class FakeClient:
+
+    def __init__(self, *states):
+        self.states = list(states)
+        self.polls = 0
+
+    def get_order_status(self, order_id):
+        self.polls += 1
+        return {"state": self.states.pop(0) if len(self.states) > 1 else self.states[0]}
+
+
+def tracker_with_inbox(**kwargs):
+    inbox = []
+
+    async def notify(user_id, text):
+        inbox.append((user_id, text, threading.current_thread().name))
+
+    return OrderTracker(initial_delay=0.01, max_delay=0.02, deadline=5, notify=notify, **kwargs), inbox
+
+
+def track_from_thread(tracker, *args):
+    # As an action run in the action server's executor would
+    result = {}
+    worker = threading.Thread(target=lambda: result.update(future=tracker.track(*args)))
+    worker.start()
+    worker.join()
+    return result["future"]
+
+
+def test_track_from_worker_thread_runs_on_stored_loop():
+    tracker, inbox = tracker_with_inbox()
+
+    async def scenario():
+        tracker.loop = asyncio.get_running_loop()
+        future = track_from_thread(tracker, "alice", "order-1", FakeClient("PENDING", "RESERVED"), "Bakery")
+        return await asyncio.wrap_future(future)
+
+    outcome = asyncio.run(scenario())
+    assert outcome.succeeded
+    assert inbox == [("alice", "🎉 Bakery is reserved! Please complete payment in the TGTG app.", "MainThread")]
+    assert tracker.active == 0
+
+
+def test_track_from_thread_without_loop_starts_own():
+    tracker, inbox = tracker_with_inbox()
+    client = FakeClient("PENDING", "PENDING", "CANCELLED")
+    outcome = track_from_thread(tracker, "bob", "order-2", client).result(timeout=5)
+    assert outcome.state == "CANCELLED"
+    assert client.polls == 3
+    assert inbox[0][2] == "order-tracker"
+
+
+def test_same_order_tracked_once():
+    tracker, inbox = tracker_with_inbox()
+    client = FakeClient("PENDING", "RESERVED")
+
+    async def scenario():
+        first = tracker.track("alice", "order-3", client)
+        second = tracker.track("alice", "order-3", client)
+        assert first is second
+        await first
+
+    asyncio.run(scenario())
+    assert len(inbox) == 1
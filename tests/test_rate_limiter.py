@@ -0,0 +1,135 @@
+import threading
+import time
+from datetime import datetime
+
+import pytest
+import requests
+
+from actions import rate_limiter
+from actions.rate_limiter import (INTERACTIVE_RESERVE, Priority, RateLimitedTgtgClient, RequestScheduler,
+                                  RequestShedError, TokenBucket)
+from conftest import FakeResponse
+
+
+def test_bucket_refills_at_its_rate():
+    bucket = TokenBucket(rate=10.0, capacity=2)
+    now = time.monotonic()
+    assert bucket.try_take(now) and bucket.try_take(now)
+    assert not bucket.try_take(now)
+    assert bucket.wait_time(now) == pytest.approx(0.1, abs=0.01)
+    assert bucket.try_take(now + 0.11)
+
+
+def test_bucket_keeps_a_reserve():
+    bucket = TokenBucket(rate=1.0, capacity=3)
+    now = time.monotonic()
+    assert bucket.try_take(now, keep=1) and bucket.try_take(now, keep=1)
+    assert not bucket.try_take(now, keep=1)
+    assert bucket.try_take(now)
+
+
+def test_user_bucket_only_slows_that_user():
+    scheduler = RequestScheduler(global_rate=100, global_burst=100, user_rate=0.1, user_burst=2)
+    scheduler.acquire("alice", Priority.INTERACTIVE, deadline=0.05)
+    scheduler.acquire("alice", Priority.INTERACTIVE, deadline=0.05)
+    with pytest.raises(RequestShedError):
+        scheduler.acquire("alice", Priority.INTERACTIVE, deadline=0.05)
+    scheduler.acquire("bob", Priority.INTERACTIVE, deadline=0.05)
+
+
+def test_background_cannot_drain_the_interactive_reserve():
+    scheduler = RequestScheduler(global_rate=0.01, global_burst=10, user_rate=100, user_burst=100)
+    background = 0
+    with pytest.raises(RequestShedError):
+        while True:
+            scheduler.acquire(None, Priority.BACKGROUND, deadline=0.02)
+            background += 1
+    assert background == int(10 * (1 - INTERACTIVE_RESERVE))
+    for _ in range(10 - background):
+        scheduler.acquire(None, Priority.INTERACTIVE, deadline=0.02)
+
+
+def test_shed_request_gives_the_user_token_back():
+    scheduler = RequestScheduler(global_rate=0.01, global_burst=1, user_rate=0.01, user_burst=2)
+    scheduler.acquire("alice", Priority.INTERACTIVE, deadline=0.02)
+    # Global bucket empty: shed after taking alice's second token
+    with pytest.raises(RequestShedError):
+        scheduler.acquire("alice", Priority.INTERACTIVE, deadline=0.02)
+    assert scheduler._users["alice"].tokens == pytest.approx(1, abs=0.01)
+
+
+def test_higher_priority_is_served_first():
+    scheduler = RequestScheduler(global_rate=20, global_burst=10, user_rate=100, user_burst=100)
+    for _ in range(10):
+        scheduler.acquire(None, Priority.INTERACTIVE)
+    served = []
+
+    def request(priority, delay):
+        time.sleep(delay)
+        scheduler.acquire(None, priority, deadline=2)
+        served.append(priority)
+
+    threads = [threading.Thread(target=request, args=(Priority.BACKGROUND, 0.0)),
+               threading.Thread(target=request, args=(Priority.CHECKOUT, 0.01))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert served == [Priority.CHECKOUT, Priority.BACKGROUND]
+
+
+def test_rate_limit_answers_back_off_everybody():
+    scheduler = RequestScheduler(global_rate=100, global_burst=100, user_rate=100, user_burst=100)
+    scheduler.report(429)
+    with pytest.raises(RequestShedError):
+        scheduler.acquire("bob", Priority.CHECKOUT, deadline=0.05)
+    scheduler.report(403)
+    assert scheduler._strikes == 2
+    assert scheduler._blocked_until - time.monotonic() > rate_limiter.BACKOFF_BASE
+    scheduler.report(200)
+    assert scheduler._strikes == 0
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """
+    Answers of the fake API, and the requests that reached it.
+    """
+    sent = []
+    answers = []
+
+    def request(session, method, url, *args, **kwargs):
+        sent.append((method, url))
+        return answers.pop(0) if answers else FakeResponse(200, {})
+
+    monkeypatch.setattr(requests.Session, "request", request)
+    return sent, answers
+
+
+def test_library_internal_calls_are_scheduled(upstream):
+    sent, answers = upstream
+    acquired = []
+    scheduler = rate_limiter.request_scheduler
+    original = scheduler.acquire
+    scheduler.acquire = lambda user_id=None, *a, **k: (acquired.append(user_id), original(user_id, *a, **k))
+    client = RateLimitedTgtgClient(access_token="a", refresh_token="r", cookie="c")
+    client.user_id = "alice"
+    answers.append(FakeResponse(200, {"access_token": "a2", "refresh_token": "r2"}, {"Set-Cookie": "c2"}))
+
+    client._refresh_token()
+    client.get_active()
+
+    assert [url.rsplit("/api/", 1)[1] for _, url in sent] == ["token/v1/refresh", "order/v8/active"]
+    assert acquired == ["alice", "alice"]
+
+
+def test_captcha_answer_reaches_the_backoff(upstream):
+    _, answers = upstream
+    client = RateLimitedTgtgClient(access_token="a", refresh_token="r", cookie="c")
+    client.last_time_token_refreshed = datetime.now()
+    answers.append(FakeResponse(403))
+
+    with pytest.raises(Exception):
+        client.get_active()
+
+    assert rate_limiter.request_scheduler._strikes == 1
@@ -0,0 +1,51 @@
+import gzip
+import hashlib
+import json
+import os
+
+from actions.recorder import PART_SUFFIX, REDACTED, TrafficRecorder, hash_user, iter_records, redact, segments
+
+KEY = b"test-key"
+
+
+def test_redact_nested_and_case_insensitive():
+    body = {"Access_Token": "a", "items": [{"store": {"email": "x@y.z", "name": "Greggs"}}],
+            "nested": {"Cookie": "c", "ok": 1}}
+    assert redact(body) == {"Access_Token": REDACTED, "items": [{"store": {"email": REDACTED, "name": "Greggs"}}],
+                            "nested": {"Cookie": REDACTED, "ok": 1}}
+
+
+def test_user_hash_is_keyed():
+    phone = "whatsapp:+447700900123"
+    assert hash_user(phone, KEY) == hash_user(phone, KEY)
+    assert hash_user(phone, KEY) != hash_user(phone, b"other-key")
+    # Not the plain digest anyone could brute-force from the phone number space
+    assert hash_user(phone, KEY) != hashlib.sha256(phone.encode()).hexdigest()[:16]
+    assert hash_user(None, KEY) is None
+
+
+def test_records_are_redacted_and_pseudonymous(tmp_path):
+    recorder = TrafficRecorder(str(tmp_path), key=KEY)
+    recorder.record("auth/v5/token/refresh", {"refresh_token": "secret"}, 200,
+                    json.dumps({"access_token": "secret", "ttl": 10}).encode(), 0.1, "whatsapp:+447700900123",
+                    "BACKGROUND")
+    recorder.close()
+
+    [record] = list(iter_records([str(tmp_path)]))
+    assert record["user"] == hash_user("whatsapp:+447700900123", KEY)
+    assert record["request"] == {"refresh_token": REDACTED}
+    assert record["response"] == {"access_token": REDACTED, "ttl": 10}
+    raw = gzip.open(segments(str(tmp_path))[0]).read()
+    assert b"secret" not in raw and b"447700900123" not in raw
+
+
+def test_segments_rotate_by_size_and_keep_the_newest(tmp_path):
+    recorder = TrafficRecorder(str(tmp_path), segment_bytes=1, max_segments=3, key=KEY)
+    for i in range(5):
+        recorder.record("item/v8/", {"n": i}, 200, b"{}", 0.01)
+    recorder.close()
+
+    kept = segments(str(tmp_path))
+    assert len(kept) == 3
+    assert [r["request"]["n"] for r in iter_records(kept)] == [2, 3, 4]
+    assert not [n for n in os.listdir(tmp_path) if n.endswith(PART_SUFFIX)]
@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+
+from actions.items_summary import get_tz
+from actions.restock_history import BUCKET_MINUTES, HistoryStore, RestockModel, bucket_of, restocks
+
+LONDON = get_tz("Europe/London")
+
+
+def restock_days(first_day, days, hour=7):
+    """
+    Transitions of an item restocking at `hour`:00 local time, every day.
+    """
+    transitions = []
+    for day in range(days):
+        at = datetime(first_day.year, first_day.month, first_day.day, hour, 5, tzinfo=LONDON) + timedelta(days=day)
+        ts = int(at.timestamp())
+        transitions.append(("1", ts - 60, ts + 60))
+    return transitions
+
+
+def test_windows_stay_put_across_the_dst_change():
+    # Two weeks around the last Sunday of March: UTC+0 before, UTC+1 after
+    model = RestockModel(restock_days(datetime(2026, 3, 22), 14), LONDON)
+    assert model.trusted
+    assert model.windows == [7 * 60 // BUCKET_MINUTES]
+
+
+def test_next_window_is_in_local_time_after_the_change():
+    model = RestockModel(restock_days(datetime(2026, 3, 1), 20), LONDON)
+    now = datetime(2026, 4, 2, 6, 0, tzinfo=LONDON).timestamp()
+    assert model.seconds_until_window(now) == 60 * 60
+
+
+def test_bucket_of_uses_the_given_zone():
+    ts = datetime(2026, 7, 1, 12, 0, tzinfo=LONDON).timestamp()
+    assert bucket_of(ts, LONDON) == 12 * 60 // BUCKET_MINUTES
+    assert bucket_of(ts, get_tz("UTC")) == 11 * 60 // BUCKET_MINUTES
+
+
+def test_restocks_are_zero_to_stocked_transitions(tmp_path):
+    history = HistoryStore(str(tmp_path / "history.db"))
+    for ts, available in [(100, 0), (200, 0), (300, 2), (400, 0), (500, 1)]:
+        history.record("1", available, observed_at=ts)
+    history.flush()
+    assert list(restocks(history.series("1"))) == [("1", 200, 300), ("1", 400, 500)]
+    assert history.latest() == {"1": 1}
@@ -0,0 +1,115 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from tgtg import TgtgAPIError, TgtgClient
+
+from actions.rate_limiter import Priority, RateLimitedTgtgClient
+from actions.single_flight import SingleFlight, flights
+
+
+def slow_call(release, counter, result="items"):
+    def call():
+        counter.append(1)
+        release.wait(5)
+        return result
+    return call
+
+
+def wait_for_flight(group, key=None):
+    # The leader registers its flight before running the call
+    give_up = time.monotonic() + 5
+    while not (key in group._flights if key is not None else len(group)):
+        assert time.monotonic() < give_up, "no flight started"
+
+
+def test_identical_calls_coalesce():
+    group, release, calls = SingleFlight(), threading.Event(), []
+    with ThreadPoolExecutor(4) as pool:
+        leader = pool.submit(group.do, "k", slow_call(release, calls))
+        wait_for_flight(group, "k")
+        waiters = [pool.submit(group.do, "k", slow_call(release, calls)) for _ in range(3)]
+        release.set()
+        results = [f.result(5) for f in [leader] + waiters]
+    assert results == ["items"] * 4
+    assert len(calls) == 1
+    assert len(group) == 0
+
+
+def test_errors_reach_every_waiter():
+    group, release = SingleFlight(), threading.Event()
+
+    def failing():
+        release.wait(5)
+        raise RuntimeError("upstream down")
+
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(group.do, "k", failing)
+        wait_for_flight(group, "k")
+        waiter = pool.submit(group.do, "k", lambda: "not called")
+        release.set()
+        for future in (leader, waiter):
+            with pytest.raises(RuntimeError, match="upstream down"):
+                future.result(5)
+
+
+def test_urgent_caller_does_not_join_background_flight():
+    group, release, calls = SingleFlight(), threading.Event(), []
+    with ThreadPoolExecutor(2) as pool:
+        background = pool.submit(group.do, "k", slow_call(release, calls, "old"), Priority.BACKGROUND)
+        wait_for_flight(group, "k")
+        # Runs its own call rather than waiting on the background deadline
+        assert group.do("k", lambda: "fresh", Priority.INTERACTIVE) == "fresh"
+        release.set()
+        assert background.result(5) == "old"
+    assert len(group) == 0
+
+
+def test_flights_are_not_cached():
+    group = SingleFlight()
+    assert group.do("k", lambda: 1) == 1
+    assert group.do("k", lambda: 2) == 2
+
+
+def test_unshared_error_lets_waiters_call_themselves():
+    group, release = SingleFlight(), threading.Event()
+
+    def expired():
+        release.wait(5)
+        raise RuntimeError("alice's session expired")
+
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(group.do, "k", expired, 0, False)
+        wait_for_flight(group, "k")
+        waiter = pool.submit(group.do, "k", lambda: "item", 0, False)
+        release.set()
+        with pytest.raises(RuntimeError):
+            leader.result(5)
+        assert waiter.result(5) == "item"
+
+
+def test_get_item_failure_of_one_user_is_not_shared(monkeypatch):
+    release = threading.Event()
+
+    def get_item(client, item_id):
+        if client.user_id == "alice":
+            release.wait(5)
+            raise TgtgAPIError(401, "expired")
+        return {"item": {"item_id": item_id}}
+
+    monkeypatch.setattr(TgtgClient, "get_item", get_item)
+    clients = {}
+    for user_id in ("alice", "bob"):
+        clients[user_id] = RateLimitedTgtgClient(access_token="a", refresh_token="r", cookie="c")
+        clients[user_id].user_id = user_id
+
+    with ThreadPoolExecutor(2) as pool:
+        alice = pool.submit(clients["alice"].get_item, "42")
+        wait_for_flight(flights)
+        bob = pool.submit(clients["bob"].get_item, "42")
+        time.sleep(0.05)  # bob joins alice's flight
+        release.set()
+        with pytest.raises(TgtgAPIError):
+            alice.result(5)
+        assert bob.result(5) == {"item": {"item_id": "42"}}
@@ -0,0 +1,21 @@
+import threading
+
+import pytest
+
+from actions import metrics
+
+
+def no_listeners():
+    return metrics._server is None and \
+        not any(t.name in ("metrics", "calendar-feeds", "warm-up") for t in threading.enumerate())
+
+
+def test_importing_the_actions_opens_no_port():
+    import actions.actions  # noqa: F401
+    assert no_listeners()
+
+
+def test_importing_the_routed_channel_opens_no_port():
+    pytest.importorskip("rasa")
+    import channels.routed_rest  # noqa: F401
+    assert no_listeners()
@@ -0,0 +1,53 @@
+from actions.store_index import StoreIndex, describe_candidates, normalize
+
+
+def item(store_name, branch=None, item_id="1"):
+    return {"item": {"item_id": item_id}, "store": {"store_name": store_name, "branch": branch}}
+
+
+def index():
+    return StoreIndex([
+        item("Café Nero", "King's Road", "1"),
+        item("Café Nero", "Oxford Street", "2"),
+        item("Greggs", "Camden", "3"),
+        item("Pret A Manger", None, "4"),
+    ])
+
+
+def item_id(lookup):
+    return lookup.match["item"]["item_id"]
+
+
+def test_normalize():
+    assert normalize("Café Nero — King's Rd") == "cafe nero king s rd"
+    assert normalize(None) == ""
+
+
+def test_exact_display_name():
+    lookup = index().lookup("Café Nero — Oxford Street")
+    assert item_id(lookup) == "2"
+    assert not lookup.is_ambiguous
+
+
+def test_shared_store_name_is_ambiguous():
+    lookup = index().lookup("cafe nero")
+    assert lookup.match is None
+    assert lookup.is_ambiguous
+    assert sorted(describe_candidates(lookup.candidates).splitlines()) == [
+        "- Café Nero — King's Road", "- Café Nero — Oxford Street"]
+
+
+def test_branch_breaks_the_tie():
+    assert item_id(index().lookup("nero kings road")) == "1"
+    assert item_id(index().lookup("camden")) == "3"
+
+
+def test_typo_still_matches():
+    assert item_id(index().lookup("pret a mangr")) == "4"
+
+
+def test_unknown_store():
+    lookup = index().lookup("Starbucks")
+    assert lookup.match is None
+    assert not lookup.is_ambiguous
+    assert lookup.candidates == []
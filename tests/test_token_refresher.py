@@ -0,0 +1,160 @@
+import time
+
+import pytest
+
+from actions.client_manager import ACCESS_TOKEN_LIFETIME, PooledTgtgClient, TGTGManager
+from actions.credential_store import SQLiteCredentialStore
+from actions.token_refresher import REFRESH_LEAD, TokenRefresher
+from conftest import FakeResponse
+
+
+@pytest.fixture
+def manager(tmp_path, coordinator):
+    return TGTGManager(store=SQLiteCredentialStore(str(tmp_path / "credentials.db")))
+
+
+def due_user(manager, user_id="alice"):
+    # Refreshed long enough ago to be due, but still inside the library's own lifetime
+    refreshed_at = time.time() - ACCESS_TOKEN_LIFETIME + REFRESH_LEAD / 2
+    manager.store.put(user_id, {"access_token": "access-1", "refresh_token": "refresh-1",
+                                "cookie": "cookie-1", "refreshed_at": refreshed_at})
+    return refreshed_at
+
+
+def answer(client, *responses):
+    calls = []
+    queue = list(responses)
+
+    def post(url, **kwargs):
+        calls.append((url, kwargs.get("json")))
+        return queue.pop(0)
+
+    client.session.post = post
+    return calls
+
+
+def rotated(n):
+    return FakeResponse(200, {"access_token": f"access-{n}", "refresh_token": f"refresh-{n}"},
+                        {"Set-Cookie": f"cookie-{n}"})
+
+
+def test_refresh_rotates_tokens_before_expiry(manager):
+    refreshed_at = due_user(manager)
+    client = manager.get_client("alice")
+    calls = answer(client, rotated(2))
+
+    assert TokenRefresher(manager).run_once() == []
+
+    assert len(calls) == 1 and calls[0][0].endswith("token/v1/refresh")
+    assert calls[0][1] == {"refresh_token": "refresh-1"}
+    stored = manager.store.get("alice")
+    assert (stored["access_token"], stored["refresh_token"], stored["cookie"]) == \
+           ("access-2", "refresh-2", "cookie-2")
+    assert stored["refreshed_at"] > refreshed_at
+    assert client.tokens() == ("access-2", "refresh-2", "cookie-2")
+    assert not client.dirty
+
+
+def test_refreshed_user_is_not_due_again(manager):
+    due_user(manager)
+    calls = answer(manager.get_client("alice"), rotated(2))
+
+    TokenRefresher(manager).run_once()
+    TokenRefresher(manager).run_once()
+
+    assert len(calls) == 1
+
+
+def test_same_access_token_is_not_recorded_as_a_refresh(manager):
+    refreshed_at = due_user(manager)
+    client = manager.get_client("alice")
+    last = client.last_time_token_refreshed
+    answer(client, rotated(1))
+
+    assert manager.refresh_ahead("alice", time.time()) is False
+
+    assert manager.store.get("alice")["refreshed_at"] == refreshed_at
+    assert client.last_time_token_refreshed == last
+
+
+def test_dead_refresh_token_asks_for_login(manager):
+    due_user(manager)
+    answer(manager.get_client("alice"), FakeResponse(401))
+
+    assert TokenRefresher(manager).run_once() == ["alice"]
+
+    assert manager.store.get("alice")["login_required"] is True
+    assert manager.get_client("alice") is None
+    assert manager.store.due(time.time(), 10) == []
+
+
+def test_failed_refresh_keeps_the_last_refresh_time(manager):
+    due_user(manager)
+    client = manager.get_client("alice")
+    last = client.last_time_token_refreshed
+    answer(client, FakeResponse(500))
+
+    TokenRefresher(manager).run_once()
+
+    assert client.last_time_token_refreshed == last
+    assert manager.store.get("alice")["access_token"] == "access-1"
+
+
+def test_unpooled_user_is_refreshed_without_entering_the_pool(manager, monkeypatch):
+    due_user(manager, "alice")
+    warm = [f"user-{i}" for i in range(3)]
+    for user_id in warm:
+        manager.store.put(user_id, {"access_token": "a", "refresh_token": "r", "cookie": "c",
+                                    "refreshed_at": time.time()})
+        manager.get_client(user_id)
+    manager.pool.max_clients = len(warm)
+    calls = []
+
+    def request(session, method, url, **kwargs):
+        calls.append(url)
+        return rotated(2)
+
+    monkeypatch.setattr("requests.Session.request", request)
+
+    assert TokenRefresher(manager).run_once() == []
+
+    assert len(calls) == 1
+    assert manager.store.get("alice")["access_token"] == "access-2"
+    assert manager.pool.peek("alice") is None
+    assert all(manager.pool.peek(user_id) is not None for user_id in warm)
+
+
+def test_clients_reuse_the_first_user_agent(manager, monkeypatch):
+    for user_id in ("alice", "bob"):
+        manager.store.put(user_id, {"access_token": "a", "refresh_token": "r", "cookie": "c"})
+    built = []
+    init = PooledTgtgClient.__init__
+
+    def record(client, *args, **kwargs):
+        built.append(kwargs.get("user_agent"))
+        init(client, *args, **kwargs)
+
+    monkeypatch.setattr(PooledTgtgClient, "__init__", record)
+    manager.get_client("alice")
+    manager.get_client("bob")
+    assert built[0] is None and built[1] == manager.get_client("alice").user_agent
+
+
+def test_lazy_refresh_does_not_wait_for_a_held_lock(manager, coordinator):
+    due_user(manager)
+    client = manager.get_client("alice")
+    client.last_time_token_refreshed = None
+    calls = answer(client, rotated(2))
+    token = coordinator.try_acquire("user:alice", 30)
+
+    started = time.monotonic()
+    client._refresh_token()
+    assert time.monotonic() - started < 0.5
+    assert calls == [] and client.access_token == "access-1"
+
+    # The holder stores what it rotated; the next lazy refresh adopts it
+    manager.store.put("alice", {"access_token": "access-3", "refresh_token": "refresh-3",
+                                "cookie": "cookie-3", "refreshed_at": time.time()})
+    coordinator.release("user:alice", token)
+    client._refresh_token()
+    assert calls == [] and client.tokens() == ("access-3", "refresh-3", "cookie-3")
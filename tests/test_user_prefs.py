@@ -0,0 +1,52 @@
+import sqlite3
+import time
+
+from actions.local_cache import LocalCache
+from actions.user_prefs import PrefsStore
+
+
+def test_change_on_another_replica_shows_up_after_the_ttl(tmp_path):
+    path = str(tmp_path / "prefs.db")
+    here, there = PrefsStore(path, ttl=0.05), PrefsStore(path, ttl=0.05)
+    assert here.get("alice").timezone == "Europe/London"
+
+    there.set("alice", timezone="Europe/Paris", currency="eur")
+
+    assert here.get("alice").timezone == "Europe/London"
+    time.sleep(0.06)
+    prefs = here.get("alice")
+    assert (prefs.timezone, prefs.currency) == ("Europe/Paris", "EUR")
+
+
+def test_local_cache_drops_least_recently_used():
+    cache = LocalCache(ttl=60, max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+    assert len(cache) == 2
+
+
+def test_spend_cap_is_kept_when_other_prefs_change(tmp_path):
+    store = PrefsStore(str(tmp_path / "prefs.db"), ttl=0)
+    assert store.get("alice").spend_cap is None
+    store.set("alice", spend_cap=20.0)
+    store.set("alice", currency="eur")
+    prefs = store.get("alice")
+    assert (prefs.currency, prefs.spend_cap) == ("EUR", 20.0)
+
+
+def test_table_without_spend_cap_gets_the_column(tmp_path):
+    path = str(tmp_path / "prefs.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE user_prefs (user_id TEXT PRIMARY KEY, timezone TEXT, currency TEXT)")
+        conn.execute("INSERT INTO user_prefs VALUES ('alice', 'Europe/Paris', 'EUR')")
+    conn.close()
+
+    store = PrefsStore(path, ttl=0)
+    assert store.get("alice").spend_cap is None
+    store.set("alice", spend_cap=12.5)
+    # A second store (another replica) opening the migrated DB doesn't trip on the ALTER
+    prefs = PrefsStore(path, ttl=0).get("alice")
+    assert (prefs.timezone, prefs.spend_cap) == ("Europe/Paris", 12.5)
@@ -1,10 +1,11 @@
-from tgtg import TgtgClient
+# Run from the repo root (python -m utils.order) so requests share the bot's rate limiter
+from actions.rate_limiter import RateLimitedTgtgClient
 import os
 import argparse
 import dotenv
 dotenv.load_dotenv()
 
-client = TgtgClient(
+client = RateLimitedTgtgClient(
     access_token=os.getenv("ACCESS_TOKEN"),
     refresh_token=os.getenv("REFRESH_TOKEN"),
     cookie=os.getenv("COOKIE")